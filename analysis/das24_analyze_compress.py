@@ -3,14 +3,41 @@ import argparse
 import os
 import sys
 import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, nullcontext
+from functools import partial
 from pathlib import Path
-from typing import List, Tuple, Optional, Dict, Any
+from typing import Collection, Iterator, List, Set, Tuple, Optional, Dict, Any, Union
 
 import numpy as np
 import pandas as pd
 import h5py
 from tqdm import tqdm
-import matplotlib.pyplot as plt
+
+from das_aggregator import BlobAggregator
+from das_codecs import (
+    codec_is_lossy,
+    codec_names,
+    codec_suffix,
+    codec_version,
+    frame_blocks,
+    make_codec,
+)
+from das_result_cache import ResultCache, file_signature, open_result_cache
+from das_stats import (
+    STAT_KEYS,
+    HistogramAccumulator,
+    StatsAccumulator,
+    load_histogram_table,
+    save_histogram_table,
+)
+from hdf5_metadata_index import get_file
+from hdf5_metadata_scanner import HDF5MetadataScanner, read_file_metadata
+from prefetch_reader import PrefetchReader
+from shm_pipeline import Layout, aligned, slab_arrays, slab_pipeline
+from render_queue import RenderQueue
+from stream_sink import OUTPUT_MODES, StreamSink
 
 
 def find_hdf5_files(root: Path) -> List[Path]:
@@ -31,133 +58,438 @@ def list_numeric_2d_datasets(f: h5py.File) -> List[str]:
                 out.append(name)
 
     f.visititems(visitor)
+    return _data_first(out)
+
+
+def numeric_2d_datasets_in(structure: Dict[str, Any]) -> List[str]:
+    """``list_numeric_2d_datasets`` from a metadata-index ``structure`` (see
+    hdf5_metadata_scanner), without walking the file again."""
+    out: List[str] = []
+
+    def visit(item: Dict[str, Any]) -> None:
+        if item.get("type") == "group":
+            for child in item["children"].values():
+                visit(child)
+        elif item.get("type") == "dataset" and len(item["shape"]) == 2:
+            try:
+                numeric = np.issubdtype(np.dtype(item["dtype"]), np.number)
+            except TypeError:
+                numeric = False
+            if numeric:
+                out.append(item["path"])
+
+    for item in structure.values():
+        visit(item)
+    return _data_first(out)
+
+
+def _data_first(names: List[str]) -> List[str]:
     # Prefer a dataset named "data" if present by moving it to the front
-    out.sort()
-    if "data" in out:
-        out.remove("data")
-        out.insert(0, "data")
-    return out
+    names.sort()
+    if "data" in names:
+        names.remove("data")
+        names.insert(0, "data")
+    return names
+
 
+def open_h5(h5_path: Path, h5: Optional[h5py.File] = None) -> Any:
+    """Context manager yielding ``h5`` when the caller already holds the file
+    open (left open), else a read-only handle on ``h5_path``."""
+    return nullcontext(h5) if h5 is not None else h5py.File(h5_path, "r")
 
-def sample_array(a: np.ndarray, max_elems: int) -> np.ndarray:
-    n = a.size
+
+SAMPLE_MODES = ["stride", "rows", "windows", "block"]
+
+
+def sample_array(
+    a: Union[h5py.Dataset, np.ndarray],
+    max_elems: int,
+    mode: str = "stride",
+    n_windows: int = 16,
+) -> np.ndarray:
+    """Subsample a 2D array (or h5py dataset) to at most ``max_elems`` values.
+
+    The selection is made from the shape first and only the selected
+    hyperslabs are read, so on an h5py dataset or a memmap the cost scales
+    with the sample, not with the array:
+
+    - ``stride``: a common row/column stride (see ``sample_stride``), spread
+      over the whole array
+    - ``rows``: evenly spaced full rows (column stride only when one row is
+      larger than the budget); each row is one contiguous read, so this is
+      the cheapest spread-out sample on disk
+    - ``windows``: ``n_windows`` contiguous row windows at random
+      (seeded) positions
+    - ``block``: one contiguous window from the middle of the array, which
+      keeps the neighbouring-sample correlation the coder exploits, so
+      compression measured on it is representative
+    """
+    n = int(np.prod(a.shape, dtype=np.int64))
     if n <= max_elems:
-        return a
-    ratio = np.sqrt(max_elems / n)
-    step0 = max(1, int(round(1 / ratio)))
-    view = a[::step0, ::step0]
-    if view.size <= max_elems:
-        return view
-    # fallback: random sample without replacement on flattened indices
-    flat = a.ravel()
-    idx = np.random.default_rng(0xA11CE).choice(
-        flat.size, size=max_elems, replace=False
-    )
-    return flat[idx]
-
-
-def compute_stats(a: np.ndarray) -> Dict[str, Any]:
-    stats: Dict[str, Any] = {}
-    stats["shape"] = tuple(a.shape)
-    stats["dtype"] = str(a.dtype)
-    stats["nbytes"] = int(a.nbytes)
-    if a.size == 0:
-        stats.update(
-            {
-                "min": np.nan,
-                "max": np.nan,
-                "mean": np.nan,
-                "std": np.nan,
-                "p0p1": np.nan,
-                "p1": np.nan,
-                "p50": np.nan,
-                "p99": np.nan,
-                "p99p9": np.nan,
-                "nan_frac": np.nan,
-            }
+        return a[...]
+    n_rows, n_cols = a.shape[0], int(np.prod(a.shape[1:], dtype=np.int64))
+    if mode == "stride":
+        step = sample_stride(tuple(a.shape), max_elems)
+        return a[::step, ::step]
+    if mode == "rows":
+        col_step = -(-n_cols // max_elems)
+        row_elems = -(-n_cols // col_step)
+        row_step = -(-n_rows // max(1, max_elems // row_elems))
+        return a[::row_step, ::col_step]
+    if mode == "windows":
+        cols = min(n_cols, max_elems)
+        rows = max(1, min(n_rows, max_elems // cols))
+        win = max(1, rows // max(1, n_windows))
+        n_windows = rows // win
+        rng = np.random.default_rng(0xA11CE)
+        starts = np.sort(
+            rng.choice(n_rows // win, size=n_windows, replace=False) * win
+        )
+        c0 = (n_cols - cols) // 2
+        return np.concatenate(
+            [a[r0 : r0 + win, c0 : c0 + cols] for r0 in starts.tolist()], axis=0
         )
-        return stats
+    if mode == "block":
+        cols = min(n_cols, max_elems)
+        rows = max(1, min(n_rows, max_elems // cols))
+        r0 = (n_rows - rows) // 2
+        c0 = (n_cols - cols) // 2
+        return a[r0 : r0 + rows, c0 : c0 + cols]
+    raise ValueError(f"unknown sample mode: {mode}")
 
-    if np.issubdtype(a.dtype, np.floating):
-        nan_frac = float(np.isnan(a).mean())
-        arr = a[np.isfinite(a)]
-    else:
-        nan_frac = 0.0
-        arr = a
 
-    if arr.size == 0:
-        stats.update(
-            {
-                "min": np.nan,
-                "max": np.nan,
-                "mean": np.nan,
-                "std": np.nan,
-                "p0p1": np.nan,
-                "p1": np.nan,
-                "p50": np.nan,
-                "p99": np.nan,
-                "p99p9": np.nan,
-                "nan_frac": nan_frac,
-            }
-        )
-        return stats
+def sample_stride(shape: Tuple[int, ...], max_elems: int) -> int:
+    """Smallest common row/column stride whose strided view fits max_elems."""
+    n = int(np.prod(shape, dtype=np.int64))
+    if n <= max_elems:
+        return 1
+    step = max(1, int(np.sqrt(n / max_elems)))
+    while int(np.prod([-(-d // step) for d in shape], dtype=np.int64)) > max_elems:
+        step += 1
+    return step
+
+
+# Per-block working set relative to the raw block: the block itself, its
+# float64 copy for the coder and the decoded copy used for verification.
+BLOCK_WORKSET_FACTOR = 5
+
+
+def stream_block_rows(dset: h5py.Dataset, mem_limit_bytes: int) -> int:
+    """Rows per streamed block, aligned to the dataset's HDF5 chunk rows."""
+    row_bytes = max(1, int(np.prod(dset.shape[1:], dtype=np.int64))) * dset.dtype.itemsize
+    rows = max(1, mem_limit_bytes // (row_bytes * BLOCK_WORKSET_FACTOR))
+    if dset.chunks:
+        chunk_rows = dset.chunks[0]
+        rows = max(chunk_rows, (rows // chunk_rows) * chunk_rows)
+    return int(min(rows, max(1, dset.shape[0])))
+
+
+def iter_row_blocks(
+    dset: Union[h5py.Dataset, np.ndarray], block_rows: Optional[int]
+) -> Iterator[Tuple[int, np.ndarray]]:
+    """Yield (first_row, block) pairs; block_rows=None reads the whole dataset.
+
+    Blocks of a memory-mapped array (see ``open_array``) are views into it.
+    """
+    if block_rows is None:
+        yield 0, dset[...]
+        return
+    for row0 in range(0, dset.shape[0], block_rows):
+        yield row0, dset[row0 : row0 + block_rows]
+
 
-    stats["min"] = float(np.min(arr))
-    stats["max"] = float(np.max(arr))
-    stats["mean"] = float(np.mean(arr))
-    stats["std"] = float(np.std(arr))
-    qs = np.percentile(arr, [0.1, 1, 50, 99, 99.9])
-    stats["p0p1"], stats["p1"], stats["p50"], stats["p99"], stats["p99p9"] = map(
-        float, qs
+# (resolved path, size, mtime_ns, dataset) -> byte offset of the raw data of a
+# contiguous dataset, or None when it has to be read through h5py
+_OFFSET_CACHE: Dict[Tuple[str, int, int, str], Optional[int]] = {}
+
+
+def contiguous_offset(h5_path: Path, dset: h5py.Dataset) -> Optional[int]:
+    """File offset of an unfiltered, contiguous dataset's raw data.
+
+    None for chunked, compact or external layouts, non-numeric dtypes and
+    datasets whose storage is not allocated. Looked up once per file
+    signature.
+    """
+    st = os.stat(h5_path)
+    key = (str(Path(h5_path).resolve()), st.st_size, st.st_mtime_ns, dset.name)
+    if key not in _OFFSET_CACHE:
+        offset = None
+        nbytes = dset.size * dset.dtype.itemsize
+        if (
+            dset.chunks is None
+            and not dset.external
+            and dset.dtype.kind in "biuf"
+            and nbytes > 0
+        ):
+            raw = dset.id.get_offset()
+            if (
+                raw is not None
+                and dset.id.get_storage_size() == nbytes
+                and raw + nbytes <= st.st_size
+            ):
+                offset = int(raw)
+        _OFFSET_CACHE[key] = offset
+    return _OFFSET_CACHE[key]
+
+
+def open_array(
+    h5_path: Path, dset: h5py.Dataset, use_mmap: bool = True
+) -> Union[h5py.Dataset, np.ndarray]:
+    """Read-only ``np.memmap`` over a contiguous dataset, else ``dset`` itself.
+
+    Slices of the memmap are backed by the page cache, so stats, strided
+    samples and encoding read the file without an intermediate copy and
+    worker processes mapping the same file share its pages.
+    """
+    offset = contiguous_offset(h5_path, dset) if use_mmap else None
+    if offset is None:
+        return dset
+    return np.memmap(
+        h5_path, dtype=dset.dtype, mode="r", offset=offset, shape=dset.shape
     )
-    stats["nan_frac"] = nan_frac
-    return stats
 
 
-def save_histogram(a: np.ndarray, out_png: Path, title: str) -> None:
-    out_png.parent.mkdir(parents=True, exist_ok=True)
+def histogram_png_path(histograms_dir: Path, label: str) -> Path:
+    stem, dset_name = label.rsplit(":", 1)
+    return (
+        histograms_dir
+        / f"hist_{Path(stem).stem}__{dset_name.replace('/', '_')}.png"
+    )
+
+
+def draw_histogram(fig, counts: np.ndarray, edges: np.ndarray, title: str) -> None:
+    ax = fig.add_subplot()
+    ax.stairs(counts, edges, fill=True, color="#1abc9c", alpha=0.8)
+    ax.set_title(title)
+    ax.set_xlabel("value")
+    ax.set_ylabel("count")
+    fig.tight_layout()
+
 
-    if a.size == 0:
+def draw_histogram_heatmap(
+    fig, labels: List[str], density: np.ndarray, edges: np.ndarray
+) -> None:
+    """One image for many files: rows are files, columns are shared bins."""
+    ax = fig.add_subplot()
+    im = ax.imshow(
+        np.log10(density + 1e-9),
+        aspect="auto",
+        interpolation="nearest",
+        extent=(edges[0], edges[-1], len(density), 0),
+        cmap="viridis",
+    )
+    fig.colorbar(im, ax=ax, label="log10(fraction of values)")
+    if len(labels) <= 60:
+        ax.set_yticks(
+            np.arange(len(labels)) + 0.5,
+            [Path(label).name for label in labels],
+            fontsize=6,
+        )
+    ax.set_xlabel("value")
+    ax.set_ylabel("file")
+    ax.set_title(f"Value histograms across {len(density)} datasets")
+    fig.tight_layout()
+
+
+def render_histograms(
+    hist_npz: Path, mode: str, workers: int = 1, skip_unchanged: bool = False
+) -> None:
+    """Render PNGs from a persisted histogram table ('files' or 'heatmap')."""
+    if mode == "none" or not hist_npz.exists():
         return
-    if np.issubdtype(a.dtype, np.floating):
-        finite = a[np.isfinite(a)]
-        if finite.size == 0:
+    labels, hists = load_histogram_table(hist_npz)
+    histograms_dir = hist_npz.parent
+    queue = RenderQueue(workers=workers, skip_unchanged=skip_unchanged)
+    if mode == "files":
+        for label, hist in zip(labels, hists):
+            counts = hist.clipped_counts()
+            if counts.sum() == 0:
+                continue
+            queue.submit(
+                histogram_png_path(histograms_dir, label),
+                draw_histogram,
+                counts,
+                hist.edges,
+                Path(label).name,
+                figsize=(8, 4),
+            )
+    elif mode == "heatmap":
+        if not hists:
             return
-        lo, hi = np.percentile(finite, [1, 99])
-        data = np.clip(finite, lo, hi)
-        bins = 128
+        counts = np.stack([h.clipped_counts() for h in hists]).astype(np.float64)
+        totals = counts.sum(axis=1, keepdims=True)
+        density = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+        queue.submit(
+            histograms_dir / "hist_heatmap.png",
+            draw_histogram_heatmap,
+            labels,
+            density,
+            hists[0].edges,
+            figsize=(10, max(3, min(40, 0.12 * len(hists) + 2))),
+            dpi=150,
+        )
     else:
-        data = a
-        vmin, vmax = int(np.min(data)), int(np.max(data))
-        if vmin == vmax:
-            bins = 1
-        else:
-            bins = min(256, vmax - vmin + 1)
+        raise ValueError(f"unknown histogram render mode: {mode}")
+    rendered, skipped = queue.run()
+    print(f"Histogram figures: {rendered} rendered, {skipped} unchanged")
 
-    plt.figure(figsize=(8, 4))
-    plt.hist(data.ravel(), bins=bins, color="#1abc9c", alpha=0.8)
-    plt.title(title)
-    plt.xlabel("value")
-    plt.ylabel("count")
-    plt.tight_layout()
-    plt.savefig(out_png)
-    plt.close()
 
+def error_metrics(restored: np.ndarray, reference: np.ndarray) -> Tuple[float, float]:
+    """(max |error|, sum of squared error), computed in the decoder's buffer."""
+    if restored.size == 0:
+        return 0.0, 0.0
+    if not restored.flags.writeable or not np.issubdtype(restored.dtype, np.floating):
+        restored = restored.astype(np.float64)
+    np.subtract(restored, reference, out=restored, casting="unsafe")
+    flat = restored.ravel()
+    sse = float(np.dot(flat, flat))
+    np.abs(flat, out=flat)
+    return float(flat.max()), sse
 
-def ensure_daspack() -> Tuple[Any, Any]:
-    try:
-        from daspack import DASCoder, Quantizer
 
-        return DASCoder, Quantizer
-    except Exception as e:
-        raise RuntimeError(
-            "daspack is not installed. Build it with 'maturin develop --release' in the daspack/ directory, "
-            "or install via 'pip install daspack-dev'. Original error: %s" % (e,)
+VERIFY_MODES = ["limit", "blocks", "windows"]
+
+# Elements per row window compared at once when a whole-dataset stream is
+# verified (--verify limit without --stream)
+VERIFY_WINDOW_ELEMS = 1 << 20
+
+
+def verify_window_rows(shape: Tuple[int, ...], block_rows: Optional[int]) -> int:
+    """Rows per verification window.
+
+    Streamed datasets are checked one encoded block at a time; a dataset
+    encoded in one piece is checked in windows of ``VERIFY_WINDOW_ELEMS``.
+    """
+    if block_rows is not None:
+        return block_rows
+    row_elems = max(1, int(np.prod(shape[1:], dtype=np.int64)))
+    return int(min(max(1, VERIFY_WINDOW_ELEMS // row_elems), max(1, shape[0])))
+
+
+def verify_block_indices(
+    h5_path: Path, dset_name: str, n_blocks: int, windows: int
+) -> Set[int]:
+    """Row windows checked in ``windows`` mode, fixed per file and dataset.
+
+    The choice is seeded from the file name and dataset so reruns (and cached
+    results) check the same windows.
+    """
+    rng = np.random.default_rng(zlib.crc32(f"{h5_path.name}:{dset_name}".encode()))
+    picked = rng.choice(n_blocks, size=min(max(1, windows), n_blocks), replace=False)
+    return {int(i) for i in picked}
+
+
+def step_for_target_cf(
+    codec: str,
+    threads: int,
+    sample: np.ndarray,
+    target_cf: float,
+    tol: float = 0.02,
+    max_iter: int = 24,
+) -> Tuple[float, float]:
+    """Uniform step whose compression factor on ``sample`` reaches ``target_cf``.
+
+    The compression factor of a lossy ``codec`` grows with the step, so the
+    step is bracketed by factors of 4 and then bisected geometrically until
+    the factor is within ``tol`` of the target. Returns (step, compression
+    factor on the sample); the step returned always meets the target when the
+    target is reachable.
+    """
+    orig_nbytes = sample.size * sample.dtype.itemsize
+    arr = make_codec(codec, 1.0, threads).prepare(sample)
+
+    def cf(step: float) -> float:
+        stream = make_codec(codec, step, threads).encode(arr)
+        return orig_nbytes / len(stream) if len(stream) else np.inf
+
+    spread = float(np.std(arr)) if arr.size else 0.0
+    lo = hi = spread / 16 if spread > 0 else 1.0
+    cf_lo = cf_hi = cf(lo)
+    # Bracket the target: cf(lo) < target <= cf(hi)
+    while cf_hi < target_cf and hi < 1e12:
+        lo, cf_lo = hi, cf_hi
+        hi *= 4
+        cf_hi = cf(hi)
+    while cf_lo >= target_cf and lo > 1e-12:
+        hi, cf_hi = lo, cf_lo
+        lo /= 4
+        cf_lo = cf(lo)
+    if cf_hi < target_cf:
+        print(
+            f"\n⚠️  Target compression factor {target_cf} not reachable "
+            f"(best {cf_hi:.3f} at step {hi:.6g})",
+            file=sys.stderr,
         )
+        return hi, cf_hi
+
+    for _ in range(max_iter):
+        if abs(cf_hi / target_cf - 1) <= tol:
+            break
+        mid = float(np.sqrt(lo * hi))
+        cf_mid = cf(mid)
+        if cf_mid >= target_cf:
+            hi, cf_hi = mid, cf_mid
+        else:
+            lo, cf_lo = mid, cf_mid
+    return hi, cf_hi
 
 
-def encode_one(coder, quantizer, arr: np.ndarray) -> bytes:
-    return coder.encode(arr, quantizer)
+def resolve_target_step(
+    h5_path: Path,
+    dset_name: str,
+    threads: int,
+    target_cf: float,
+    target_sample: int,
+    codec: str = "daspack",
+    use_mmap: bool = True,
+    preloaded: Optional[np.ndarray] = None,
+    h5: Optional[h5py.File] = None,
+) -> Optional[Tuple[float, float]]:
+    """(step, sample compression factor) for a float dataset.
+
+    None for integer datasets and lossless-only codecs, which have no step.
+    ``preloaded`` is the dataset already loaded in memory, if it is, and
+    ``h5`` the file already open (see ``open_h5``).
+    """
+    if not codec_is_lossy(codec):
+        return None
+    with open_h5(h5_path, h5) as f:
+        dset = f[dset_name]
+        if np.issubdtype(dset.dtype, np.integer):
+            return None
+        source = (
+            open_array(h5_path, dset, use_mmap) if preloaded is None else preloaded
+        )
+        sample = sample_array(source, target_sample, mode="block")
+    return step_for_target_cf(codec, threads, sample, target_cf)
+
+
+def available_cpus() -> int:
+    # Respect CPU affinity / cgroup pinning where the platform exposes it
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def budget_threads(workers: int, threads: int) -> int:
+    """Cap DASCoder threads so that workers x threads never exceeds the CPUs."""
+    per_worker = available_cpus() // max(1, workers)
+    return max(1, min(threads, per_worker))
+
+
+def stream_names(
+    h5_path: Path, dset_name: str, codec: str, mode: str, step: Optional[float]
+) -> Tuple[str, str]:
+    """Output file name and aggregator key of one stream of a dataset."""
+    out_name = f"{h5_path.stem}__{dset_name.replace('/', '_')}__{mode}"
+    if step is not None:
+        out_name += f"{step}"
+    grp_leaf = f"{mode}{'' if step is None else step}"
+    # daspack keeps its original names; baseline codecs are told apart by name
+    if codec != "daspack":
+        out_name += f"__{codec}"
+        grp_leaf = f"{codec}/{grp_leaf}"
+    return f"{out_name}{codec_suffix(codec)}", f"{h5_path.stem}/{dset_name}/{grp_leaf}"
 
 
 def process_dataset(
@@ -167,31 +499,183 @@ def process_dataset(
     uniform_steps: List[float],
     max_sample: int,
     verify_limit: int,
-    outputs_dir: Path,
-    artifacts_dir: Path,
-    aggregator_h5: Optional[h5py.File],
+    sink: StreamSink,
+    mem_limit_bytes: int = 0,
+    stats_accs: Optional[Dict[str, StatsAccumulator]] = None,
+    hist_accs: Optional[Dict[str, HistogramAccumulator]] = None,
+    hist_range: Tuple[float, float] = (-64.0, 64.0),
+    hist_bins: int = 256,
+    codec: str = "daspack",
+    verify: str = "limit",
+    verify_windows: int = 4,
+    use_mmap: bool = True,
+    stats_only: bool = False,
+    sample_mode: str = "rows",
+    preloaded: Optional[np.ndarray] = None,
+    h5: Optional[h5py.File] = None,
 ) -> List[Dict[str, Any]]:
+    """Compute stats, histogram counts and compressed streams for one dataset.
+
+    Streams are produced by ``codec`` (see ``das_codecs.CODECS``): once per
+    uniform step for float data with a lossy codec, otherwise a single
+    lossless stream.
+
+    The dataset's stats accumulator is merged into ``stats_accs[dset_name]``
+    when a dict is given, so callers can build run-wide statistics. Histogram
+    counts over the fixed ``hist_range``/``hist_bins`` edges are stored in
+    ``hist_accs`` under ``"<file path>:<dataset>"``; rendering is left to the
+    caller (see ``render_histograms``).
+
+    Streams are handed to ``sink``, which writes them to files and/or the
+    aggregator on its own thread (see ``stream_sink.StreamSink``).
+
+    With ``mem_limit_bytes`` > 0 the dataset is streamed in row blocks sized
+    to stay under that working-set ceiling and each block is encoded on its
+    own; the per-block streams are stored as one framed stream (see
+    ``frame_blocks``). Otherwise the whole dataset is read and encoded at once.
+    With ``use_mmap`` contiguous datasets are read through a memory map (see
+    ``open_array``) instead of being copied out by h5py. ``preloaded`` is the
+    dataset already loaded in memory (prefetched), used instead of the file,
+    and ``h5`` the file already open, used instead of opening it again.
+
+    With ``stats_only`` nothing is encoded: only a ``max_sample``-element
+    sample chosen by ``sample_mode`` (see ``sample_array``) is read for the
+    stats and histogram, and a single ``mode="stats"`` row is returned.
+
+    Streams are decoded and checked against their source per ``verify``:
+    ``limit`` checks blocks of at most ``verify_limit`` elements, ``blocks``
+    checks every row window and ``windows`` checks ``verify_windows``
+    randomly chosen ones (see ``verify_window_rows``). The verify mode never
+    changes what is encoded: a stream is decoded as written and compared
+    window by window, so the error temporaries stay at one window. Only
+    streamed blocks decode on their own, so ``blocks`` and ``windows`` need
+    ``mem_limit_bytes`` > 0; otherwise each check decodes the whole stream.
+    ``verify_fraction`` in the rows is the share of elements that was checked.
+    """
     rows: List[Dict[str, Any]] = []
-    with h5py.File(h5_path, "r") as f:
+
+    with open_h5(h5_path, h5) as f:
         dset = f[dset_name]
-        data = dset[...]
+        shape = tuple(dset.shape)
+        dtype = dset.dtype
+        orig_nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+        lossless = np.issubdtype(dset.dtype, np.integer) or not codec_is_lossy(codec)
+        block_rows = (
+            stream_block_rows(dset, mem_limit_bytes) if mem_limit_bytes > 0 else None
+        )
+        sample_step = sample_stride(shape, max_sample)
+        win_rows = verify_window_rows(shape, block_rows)
+        n_windows = -(-shape[0] // win_rows) if shape[0] else 0
+        checked_windows = (
+            verify_block_indices(h5_path, dset_name, n_windows, verify_windows)
+            if verify == "windows" and n_windows
+            else set()
+        )
+
+        # One result slot per quantizer; None keys the lossless stream
+        keys: List[Optional[float]] = (
+            [None] if lossless else [float(step) for step in uniform_steps]
+        )
+        if stats_only:
+            keys = []
+        codecs = {key: make_codec(codec, key, threads) for key in keys}
+        results: Dict[Optional[float], Dict[str, Any]] = {
+            key: {
+                "streams": [],
+                "row_starts": [],
+                "enc_s": 0.0,
+                "dec_s": 0.0,
+                "verified": 0,
+                "recon_ok": True,
+                "max_err": 0.0,
+                "sse": 0.0,
+            }
+            for key in keys
+        }
+        acc = StatsAccumulator()
+        hist = HistogramAccumulator(hist_range[0], hist_range[1], hist_bins)
+        n_verified = 0
+
+        source = (
+            open_array(h5_path, dset, use_mmap) if preloaded is None else preloaded
+        )
+        if stats_only:
+            t0 = time.perf_counter()
+            sample = sample_array(source, max_sample, mode=sample_mode)
+            acc.update(sample)
+            hist.update(sample)
+            sample_seconds = time.perf_counter() - t0
+            del sample
+        blocks = [] if stats_only else iter_row_blocks(source, block_rows)
+        for block_index, (row0, data) in enumerate(blocks):
+            # Stats and histogram counts (on sampled data)
+            if block_rows is None:
+                sample = sample_array(data, max_sample)
+            else:
+                sample = data[(-row0) % sample_step :: sample_step, ::sample_step]
+            acc.update(sample)
+            hist.update(sample)
+            del sample
 
-    # Stats and histogram (on sampled data)
-    sample = sample_array(data, max_sample)
-    stats = compute_stats(sample)
+            # Every codec of a dataset shares one input layout, so convert once
+            arr = codecs[keys[0]].prepare(data) if keys else data
+            # Row windows of this block to check, relative to the block
+            n_rows = arr.shape[0] if arr.ndim else 0
+            first, end = row0 // win_rows, -(-(row0 + n_rows) // win_rows)
+            if verify == "limit":
+                windows = range(first, end) if arr.size <= verify_limit else []
+            elif verify == "blocks":
+                windows = range(first, end)
+            else:
+                windows = [w for w in range(first, end) if w in checked_windows]
+            spans = [
+                (w * win_rows - row0, min((w + 1) * win_rows, row0 + n_rows) - row0)
+                for w in windows
+            ]
+            if spans:
+                n_verified += sum(b - a for a, b in spans) * (arr.size // max(1, n_rows))
 
-    # Create histograms subdirectory
-    histograms_dir = artifacts_dir / "histograms"
-    histograms_dir.mkdir(parents=True, exist_ok=True)
+            for key in keys:
+                res = results[key]
+                t0 = time.perf_counter()
+                stream = codecs[key].encode(arr)
+                res["enc_s"] += time.perf_counter() - t0
+                res["streams"].append(stream)
+                res["row_starts"].append(row0)
 
-    hist_png = (
-        histograms_dir / f"hist_{h5_path.stem}__{dset_name.replace('/', '_')}.png"
-    )
-    save_histogram(sample, hist_png, title=f"{h5_path.name}:{dset_name}")
+                if not spans:
+                    continue
+                t1 = time.perf_counter()
+                restored = codecs[key].decode(stream)
+                res["dec_s"] += time.perf_counter() - t1
+                res["verified"] += 1
+                tol = codecs[key].error_bound() + 1e-12 if key is not None else 0.0
+                for a, b in spans:
+                    if key is None:
+                        res["recon_ok"] &= bool(
+                            np.array_equal(restored[a:b], arr[a:b])
+                        )
+                    else:
+                        err, sse = error_metrics(restored[a:b], arr[a:b])
+                        res["max_err"] = max(res["max_err"], err)
+                        res["sse"] += sse
+                        res["recon_ok"] &= err <= tol
+                del restored
+            del data, arr
+        del source
 
-    # Compression
-    DASCoder, Quantizer = ensure_daspack()
-    coder = DASCoder(threads=threads)
+    stats: Dict[str, Any] = {
+        "shape": shape,
+        "dtype": str(dtype),
+        "nbytes": orig_nbytes,
+        **acc.result(),
+    }
+    if stats_accs is not None:
+        stats_accs.setdefault(dset_name, StatsAccumulator()).merge(acc)
+    if hist_accs is not None:
+        hist_accs[f"{h5_path}:{dset_name}"] = hist
+    total_elems = int(np.prod(shape, dtype=np.int64))
+    verify_fraction = n_verified / total_elems if total_elems else 0.0
 
     def record(
         mode: str,
@@ -201,85 +685,79 @@ def process_dataset(
         dec_s: float,
         recon_ok: Optional[bool],
         max_err: Optional[float],
+        rmse: Optional[float],
     ) -> None:
-        out_name = f"{h5_path.stem}__{dset_name.replace('/', '_')}__{mode}"
-        if step is not None:
-            out_name += f"{step}"
-        out_path = outputs_dir / f"{out_name}.dasp"
-        outputs_dir.mkdir(parents=True, exist_ok=True)
-        with open(out_path, "wb") as fo:
-            fo.write(stream)
-
-        if aggregator_h5 is not None:
-            grp_path = (
-                f"{h5_path.stem}/{dset_name}/{mode}{'' if step is None else step}"
-            )
-            if grp_path in aggregator_h5:
-                del aggregator_h5[grp_path]
-            dset_c = aggregator_h5.create_dataset(
-                grp_path + "/compressed", data=np.frombuffer(stream, dtype=np.uint8)
-            )
-            dset_c.attrs["lossless"] = mode == "lossless"
-            dset_c.attrs["quant_step"] = float(step or 0.0)
-            dset_c.attrs["shape"] = stats["shape"]
-            dset_c.attrs["dtype"] = stats["dtype"]
+        file_name, grp_path = stream_names(h5_path, dset_name, codec, mode, step)
+        sink.submit(
+            {
+                "file_name": file_name,
+                "grp_path": grp_path,
+                "stream": stream,
+                "attrs": {
+                    "codec": codec,
+                    "lossless": mode == "lossless",
+                    "quant_step": float(step or 0.0),
+                    "shape": stats["shape"],
+                    "dtype": stats["dtype"],
+                    "block_framed": block_rows is not None,
+                },
+            }
+        )
 
         rows.append(
             {
                 "file": str(h5_path),
                 "dataset": dset_name,
+                "codec": codec,
                 "mode": mode,
                 "step": float(step) if step is not None else None,
-                "orig_nbytes": int(data.nbytes),
+                "orig_nbytes": orig_nbytes,
                 "compressed_bytes": len(stream),
                 "compression_factor": (
-                    (data.nbytes / len(stream)) if len(stream) > 0 else np.inf
+                    (orig_nbytes / len(stream)) if len(stream) > 0 else np.inf
                 ),
                 "encode_seconds": enc_s,
                 "decode_seconds": dec_s,
                 "verify_ok": bool(recon_ok) if recon_ok is not None else None,
                 "verify_max_abs_err": float(max_err) if max_err is not None else None,
+                "verify_rmse": float(rmse) if rmse is not None else None,
+                "verify_fraction": verify_fraction,
             }
         )
 
-    # Lossless path for integer arrays
-    if np.issubdtype(data.dtype, np.integer):
-        arr_i32 = data.astype(np.int32, copy=False)
-        q = Quantizer.Lossless()
-        t0 = time.perf_counter()
-        stream = encode_one(coder, q, arr_i32)
-        enc_s = time.perf_counter() - t0
-        # Optional decode/verify if small
-        t1 = time.perf_counter()
-        recon_ok = None
-        dec_s = 0.0
-        if arr_i32.size <= verify_limit:
-            restored = coder.decode(stream)
-            dec_s = time.perf_counter() - t1
-            recon_ok = np.array_equal(restored, arr_i32)
-        record("lossless", None, stream, enc_s, dec_s, recon_ok, None)
-    else:
-        # Lossy path for floats
-        arr_f64 = data.astype(np.float64, copy=False)
-        for step in uniform_steps:
-            q = Quantizer.Uniform(step=float(step))
-            t0 = time.perf_counter()
-            stream = encode_one(coder, q, arr_f64)
-            enc_s = time.perf_counter() - t0
-            # Optional decode/verify if small
-            t1 = time.perf_counter()
-            max_err = None
-            recon_ok = None
-            dec_s = 0.0
-            if arr_f64.size <= verify_limit:
-                restored = coder.decode(stream)
-                dec_s = time.perf_counter() - t1
-                tol = step / 2 + 1e-12
-                max_err = (
-                    float(np.max(np.abs(restored - arr_f64))) if restored.size else 0.0
-                )
-                recon_ok = max_err <= tol
-            record("uniform", float(step), stream, enc_s, dec_s, recon_ok, max_err)
+    if stats_only:
+        rows.append(
+            {
+                "file": str(h5_path),
+                "dataset": dset_name,
+                "codec": None,
+                "mode": "stats",
+                "step": None,
+                "orig_nbytes": orig_nbytes,
+                "sampled_values": acc.n_total,
+                "sample_mode": sample_mode,
+                "sample_seconds": sample_seconds,
+            }
+        )
+
+    for key in keys:
+        res = results[key]
+        if block_rows is None:
+            stream = res["streams"][0]
+        else:
+            stream = frame_blocks(res["streams"], res["row_starts"], shape)
+        verified = res["verified"] > 0
+        lossy_verified = verified and key is not None
+        record(
+            "lossless" if key is None else "uniform",
+            key,
+            stream,
+            res["enc_s"],
+            res["dec_s"],
+            res["recon_ok"] if verified else None,
+            res["max_err"] if lossy_verified else None,
+            float(np.sqrt(res["sse"] / n_verified)) if lossy_verified else None,
+        )
 
     # Return metrics with stats columns merged
     for r in rows:
@@ -287,28 +765,564 @@ def process_dataset(
             {
                 "shape": stats["shape"],
                 "dtype": stats["dtype"],
-                "min": stats.get("min"),
-                "max": stats.get("max"),
-                "mean": stats.get("mean"),
-                "std": stats.get("std"),
-                "p0p1": stats.get("p0p1"),
-                "p1": stats.get("p1"),
-                "p50": stats.get("p50"),
-                "p99": stats.get("p99"),
-                "p99p9": stats.get("p99p9"),
-                "nan_frac": stats.get("nan_frac"),
+                **{key: stats.get(key) for key in STAT_KEYS},
             }
         )
 
     return rows
 
 
+def discover_datasets(h5_path: Path) -> Optional[List[str]]:
+    """List candidate datasets, or return None if the file cannot be read."""
+    try:
+        with h5py.File(h5_path, "r") as f:
+            return list_numeric_2d_datasets(f)
+    except OSError as e:
+        error_msg = str(e)
+        if "truncated file" in error_msg.lower():
+            print(f"\n⚠️  Skipping truncated file: {h5_path.name}", file=sys.stderr)
+            print(f"    Error: {error_msg}", file=sys.stderr)
+        elif "unable to open file" in error_msg.lower():
+            print(
+                f"\n⚠️  Skipping inaccessible file: {h5_path.name}",
+                file=sys.stderr,
+            )
+            print(f"    Error: {error_msg}", file=sys.stderr)
+        else:
+            print(
+                f"\n⚠️  Skipping file with OSError: {h5_path.name}",
+                file=sys.stderr,
+            )
+            print(f"    Error: {error_msg}", file=sys.stderr)
+        return None
+    except Exception as e:
+        print(
+            f"\n⚠️  Skipping file with unexpected error: {h5_path.name}",
+            file=sys.stderr,
+        )
+        print(f"    Error: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+
+
+def new_file_products() -> Dict[str, Any]:
+    """Everything produced for one file, merged by main() in file order.
+
+    ``rows`` holds all rows (cached and new) and ``new_rows`` only those
+    computed in this run, which are the ones appended to RESULTS.md.
+    ``file_metadata`` is the file's metadata-index entry when it was read
+    along the way (see ``scan_and_process_file``).
+    """
+    return {
+        "rows": [],
+        "new_rows": [],
+        "aggregator_entries": [],
+        "stats_accs": {},
+        "hist_accs": {},
+        "file_metadata": None,
+    }
+
+
+def _restore_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(row)
+    if isinstance(row.get("shape"), list):
+        row["shape"] = tuple(row["shape"])
+    return row
+
+
+def file_target_datasets(
+    h5_path: Path,
+    cache: Optional[ResultCache],
+    file_sig: Dict[str, Any],
+    listed: Optional[List[str]] = None,
+) -> List[str]:
+    """Datasets process_file works on (listing cached per file signature).
+
+    ``listed`` is the candidate list when the caller already has it, used
+    instead of walking the file on a cache miss.
+    """
+    dsets = cache.get({"kind": "datasets", **file_sig}) if cache is not None else None
+    if dsets is None:
+        dsets = listed if listed is not None else discover_datasets(h5_path)
+        if cache is not None and dsets is not None:
+            cache.put({"kind": "datasets", **file_sig}, dsets)
+    # Process only the first dataset if there are many, but always prioritize 'data'
+    return (dsets or [])[:1]
+
+
+def dataset_config(
+    codec: str,
+    max_sample: int,
+    verify_limit: int,
+    target_cf: Optional[float],
+    target_sample: int,
+    stats_only: bool,
+    output_mode: str,
+    dataset_kwargs: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Settings that change a dataset's results or outputs; part of its cache
+    key."""
+    return {
+        "stats_only": stats_only,
+        "outputs": None if stats_only else output_mode,
+        "codec": codec,
+        "coder": codec_version(codec),
+        "max_sample": max_sample,
+        "verify_limit": verify_limit,
+        "target_cf": target_cf,
+        "target_sample": target_sample if target_cf is not None else None,
+        **{k: list(v) if isinstance(v, tuple) else v for k, v in dataset_kwargs.items()},
+    }
+
+
+def dataset_key(
+    file_sig: Dict[str, Any], dname: str, config: Dict[str, Any]
+) -> Dict[str, Any]:
+    return {"kind": "dataset", **file_sig, "dataset": dname, "config": config}
+
+
+def prefetch_datasets(
+    h5_path: Path,
+    uniform_steps: List[float],
+    max_sample: int,
+    verify_limit: int,
+    cache_path: Optional[Path] = None,
+    cache_key: str = "mtime",
+    target_cf: Optional[float] = None,
+    target_sample: int = 1_000_000,
+    codec: str = "daspack",
+    use_mmap: bool = True,
+    stats_only: bool = False,
+    output_mode: str = "both",
+    **dataset_kwargs: Any,
+) -> List[Tuple[str, int]]:
+    """(dataset, nbytes) that process_file will read in full for ``h5_path``.
+
+    Takes process_file's keyword arguments. Datasets with a cached entry for
+    the same config are left out. Runs on the prefetch thread, so it opens
+    its own cache connection.
+    """
+    if stats_only:
+        return []
+    cache = ResultCache(cache_path) if cache_path is not None else None
+    try:
+        file_sig = file_signature(h5_path, cache_key) if cache is not None else {}
+        dsets = file_target_datasets(h5_path, cache, file_sig)
+        config = dataset_config(
+            codec,
+            max_sample,
+            verify_limit,
+            target_cf,
+            target_sample,
+            stats_only,
+            output_mode,
+            dataset_kwargs,
+        )
+        if cache is not None:
+            dsets = [
+                dname
+                for dname in dsets
+                if cache.get(dataset_key(file_sig, dname, config)) is None
+            ]
+    finally:
+        if cache is not None:
+            cache.close()
+    out = []
+    with h5py.File(h5_path, "r") as f:
+        for dname in dsets:
+            dset = f[dname]
+            out.append((dname, int(dset.size) * dset.dtype.itemsize))
+    return out
+
+
+def read_datasets(h5_path: Path, names: List[str]) -> Dict[str, np.ndarray]:
+    """Load whole datasets into memory.
+
+    Contiguous datasets are read with plain file I/O at their byte offset
+    (see ``contiguous_offset``), which does not hold h5py's global lock, so
+    the main thread's HDF5 calls are not blocked by a prefetch read.
+    """
+    out: Dict[str, np.ndarray] = {}
+    plain: List[Tuple[str, int, np.dtype, Tuple[int, ...]]] = []
+    with h5py.File(h5_path, "r") as f:
+        for name in names:
+            dset = f[name]
+            offset = contiguous_offset(h5_path, dset)
+            if offset is None:
+                out[name] = dset[...]
+            else:
+                plain.append((name, offset, dset.dtype, tuple(dset.shape)))
+    for name, offset, dtype, shape in plain:
+        count = int(np.prod(shape, dtype=np.int64))
+        with open(h5_path, "rb") as fo:
+            data = np.fromfile(fo, dtype=dtype, count=count, offset=offset)
+        out[name] = data.reshape(shape)
+    return out
+
+
+def read_datasets_into(
+    h5_path: Path, names: List[str], buf: memoryview
+) -> Layout:
+    """Load whole datasets back to back into ``buf`` (a shared-memory slab).
+
+    Returns their layout for ``shm_pipeline.slab_arrays``. Contiguous
+    datasets are read with plain file I/O as in ``read_datasets``, the
+    others through h5py's ``read_direct``; both write straight into ``buf``.
+    """
+    layout: Layout = []
+    pos = 0
+    with h5py.File(h5_path, "r") as f, open(h5_path, "rb") as fo:
+        for name in names:
+            dset = f[name]
+            nbytes = int(dset.size) * dset.dtype.itemsize
+            if pos + nbytes > len(buf):
+                raise ValueError(f"{name} does not fit in a {len(buf)}-byte slab")
+            offset = contiguous_offset(h5_path, dset)
+            if offset is None:
+                dset.read_direct(
+                    np.ndarray(dset.shape, dtype=dset.dtype, buffer=buf, offset=pos)
+                )
+            else:
+                fo.seek(offset)
+                if fo.readinto(buf[pos : pos + nbytes]) != nbytes:
+                    raise IOError(f"short read of {name}")
+            layout.append((name, pos, tuple(dset.shape), dset.dtype.str))
+            pos += aligned(nbytes)
+    return layout
+
+
+def process_file(
+    h5_path: Path,
+    products: Dict[str, Any],
+    threads: int,
+    uniform_steps: List[float],
+    max_sample: int,
+    verify_limit: int,
+    sink: StreamSink,
+    cache_path: Optional[Path] = None,
+    cache_key: str = "mtime",
+    target_cf: Optional[float] = None,
+    target_sample: int = 1_000_000,
+    codec: str = "daspack",
+    use_mmap: bool = True,
+    stats_only: bool = False,
+    output_mode: str = "both",
+    preloaded: Optional[Dict[str, np.ndarray]] = None,
+    h5: Optional[h5py.File] = None,
+    listed: Optional[List[str]] = None,
+    **dataset_kwargs: Any,
+) -> Dict[str, Any]:
+    """Process one file into ``products`` (see ``new_file_products``).
+
+    With ``cache_path`` set, work items already in the result cache for the
+    file's current signature are reused and only the missing quantizer steps
+    are computed (and then cached). A cached step whose stream is no longer
+    stored where ``sink`` writes it (see ``StreamSink.stored``) is encoded
+    again. ``output_mode`` is the mode of ``sink``, part of the cache key.
+
+    With ``target_cf`` the uniform step of each float dataset is chosen by
+    bisection on a contiguous ``target_sample``-element block (see
+    ``step_for_target_cf``) instead of taking ``uniform_steps``.
+
+    Streams are written through ``sink`` (see ``stream_sink.StreamSink``).
+    With ``stats_only`` only sampled stats are computed (see
+    ``process_dataset``) and each dataset yields one ``mode="stats"`` row.
+
+    ``preloaded`` maps dataset names to arrays already in memory (see
+    ``PrefetchReader``); those datasets are not read from the file again.
+    ``h5`` is the file already open and ``listed`` its candidate datasets
+    (see ``scan_and_process_file``), so the file is not reopened or walked.
+    Without ``h5`` the file is opened once, when a dataset first needs it.
+    """
+    preloaded = preloaded or {}
+    if stats_only:
+        uniform_steps, target_cf = [], None
+    cache = open_result_cache(cache_path) if cache_path is not None else None
+    file_sig = file_signature(h5_path, cache_key) if cache is not None else {}
+
+    target_dsets = file_target_datasets(h5_path, cache, file_sig, listed)
+    if not target_dsets:
+        return products
+
+    config = dataset_config(
+        codec,
+        max_sample,
+        verify_limit,
+        target_cf,
+        target_sample,
+        stats_only,
+        output_mode,
+        dataset_kwargs,
+    )
+
+    # The file is opened at most once, and only if a dataset has to be read
+    with ExitStack() as stack:
+
+        def file_handle() -> h5py.File:
+            nonlocal h5
+            if h5 is None:
+                h5 = stack.enter_context(h5py.File(h5_path, "r"))
+            return h5
+
+        for dname in target_dsets:
+            ds_key = dataset_key(file_sig, dname, config)
+            cached_ds = cache.get(ds_key) if cache is not None else None
+            steps: List[Optional[float]] = [float(step) for step in uniform_steps]
+            if stats_only:
+                steps = [None]
+            rows_by_step: Dict[Optional[float], Dict[str, Any]] = {}
+
+            target: Dict[str, Any] = {}
+            if target_cf is not None:
+                target_key = {
+                    **ds_key,
+                    "kind": "target_step",
+                    "target_cf": target_cf,
+                    "target_sample": target_sample,
+                }
+                resolved = cache.get(target_key) if cache is not None else None
+                if resolved is None:
+                    resolved = resolve_target_step(
+                        h5_path,
+                        dname,
+                        threads,
+                        target_cf,
+                        target_sample,
+                        codec,
+                        use_mmap,
+                        preloaded=preloaded.get(dname),
+                        h5=file_handle(),
+                    )
+                    if cache is not None:
+                        cache.put(target_key, resolved)
+                steps = [] if resolved is None else [float(resolved[0])]
+                if resolved is not None:
+                    target = {"target_cf": target_cf, "sample_cf": float(resolved[1])}
+
+            if cached_ds is not None:
+                if cached_ds["lossless"]:
+                    steps = [None]
+                for step in steps:
+                    row = cache.get({**ds_key, "kind": "row", "step": step})
+                    if row is not None and (
+                        row["mode"] == "stats"
+                        or sink.stored(
+                            *stream_names(h5_path, dname, codec, row["mode"], step)
+                        )
+                    ):
+                        rows_by_step[step] = _restore_row(row)
+                missing = [step for step in steps if step not in rows_by_step]
+                if not missing:
+                    products["rows"].extend(rows_by_step[step] for step in steps)
+                    products["stats_accs"].setdefault(dname, StatsAccumulator()).merge(
+                        StatsAccumulator.from_dict(cached_ds["stats"])
+                    )
+                    products["hist_accs"][f"{h5_path}:{dname}"] = (
+                        HistogramAccumulator.from_dict(cached_ds["hist"])
+                    )
+                    continue
+            else:
+                missing = steps
+
+            ds_stats: Dict[str, StatsAccumulator] = {}
+            ds_hists: Dict[str, HistogramAccumulator] = {}
+            new_rows = process_dataset(
+                h5_path=h5_path,
+                dset_name=dname,
+                threads=threads,
+                uniform_steps=[step for step in missing if step is not None],
+                max_sample=max_sample,
+                verify_limit=verify_limit,
+                sink=sink,
+                stats_accs=ds_stats,
+                hist_accs=ds_hists,
+                codec=codec,
+                use_mmap=use_mmap,
+                stats_only=stats_only,
+                preloaded=preloaded.get(dname),
+                h5=file_handle(),
+                **dataset_kwargs,
+            )
+
+            lossless = any(r["mode"] == "lossless" for r in new_rows)
+            if lossless:
+                steps = [None]
+            for r in new_rows:
+                if r["step"] is not None:
+                    r.update(target)
+                rows_by_step[r["step"]] = r
+            if cache is not None:
+                for r in new_rows:
+                    cache.put({**ds_key, "kind": "row", "step": r["step"]}, r)
+                cache.put(
+                    ds_key,
+                    {
+                        "lossless": lossless,
+                        "stats": ds_stats[dname].to_dict(),
+                        "hist": ds_hists[f"{h5_path}:{dname}"].to_dict(),
+                    },
+                )
+
+            products["rows"].extend(rows_by_step[s] for s in steps if s in rows_by_step)
+            products["new_rows"].extend(new_rows)
+            for name, acc in ds_stats.items():
+                products["stats_accs"].setdefault(name, StatsAccumulator()).merge(acc)
+            products["hist_accs"].update(ds_hists)
+    return products
+
+
+def scan_and_process_file(
+    h5_path: Path, products: Dict[str, Any], **kwargs: Any
+) -> Dict[str, Any]:
+    """``process_file`` on a file opened once for everything.
+
+    The file's metadata-index entry (see ``hdf5_metadata_scanner``) is read
+    from the same handle into ``products["file_metadata"]`` (None if the
+    file cannot be read), and its candidate datasets are taken from that
+    entry instead of another walk over the file.
+    """
+    try:
+        h5 = h5py.File(h5_path, "r")
+    except Exception:
+        # The scanner reports why; there is nothing to process
+        products["file_metadata"] = read_file_metadata(h5_path)
+        return products
+    with h5:
+        entry = read_file_metadata(h5_path, h5=h5)
+        products["file_metadata"] = entry
+        listed = numeric_2d_datasets_in(entry["structure"]) if entry else None
+        return process_file(h5_path, products, h5=h5, listed=listed, **kwargs)
+
+
+def analyze_file(
+    h5_path: Path,
+    products: Dict[str, Any],
+    scan_metadata: Collection[str] = (),
+    indexed: Optional[Dict[str, List[str]]] = None,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """``process_file`` with what a metadata index (--metadata-file) provides.
+
+    Files whose resolved path is in ``scan_metadata`` get their index entry
+    read along the way (see ``scan_and_process_file``); ``indexed`` maps the
+    other files to the candidate datasets of their current index entry, so
+    they are not walked again.
+    """
+    key = str(Path(h5_path).resolve())
+    if key in scan_metadata:
+        return scan_and_process_file(h5_path, products, **kwargs)
+    listed = indexed.get(key) if indexed is not None else None
+    return process_file(h5_path, products, listed=listed, **kwargs)
+
+
+# Run-wide inputs of a pool worker, set once per process by ``_init_worker``
+# instead of being pickled with every task
+_WORKER_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(state: Dict[str, Any]) -> None:
+    _WORKER_STATE.update(state)
+
+
+def _process_file_worker(
+    h5_path: Path,
+    outputs_dir: Path,
+    output_mode: str,
+    collect_aggregator: bool,
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """Pool entry point: returns the file's products for the parent to merge.
+
+    Stream files are written here; aggregator entries are collected into the
+    products when ``collect_aggregator`` is set, since only the parent holds
+    the aggregator. ``kwargs`` go to ``analyze_file``, with the metadata-index
+    inputs (``scan_metadata``, ``indexed``) the worker was started with; its
+    ``stored_keys`` are the aggregator streams present at the start of the run.
+    """
+    products = new_file_products()
+    sink = StreamSink(
+        outputs_dir,
+        output_mode,
+        collect=products["aggregator_entries"] if collect_aggregator else None,
+        stored_keys=_WORKER_STATE.get("stored_keys", ()),
+    )
+    try:
+        analyze_file(
+            h5_path,
+            products,
+            sink=sink,
+            output_mode=output_mode,
+            **_WORKER_STATE.get("index", {}),
+            **kwargs,
+        )
+    finally:
+        sink.close()
+    return products
+
+
+def default_slab_bytes(files: List[Path], file_kwargs: Dict[str, Any]) -> int:
+    """Slab size for the datasets of the first readable file.
+
+    DAS files of a run share one layout, so only the first file is opened
+    (the next ones only if it cannot be read).
+    """
+    for h5_path in files:
+        try:
+            items = prefetch_datasets(h5_path, **{**file_kwargs, "cache_path": None})
+        except Exception:
+            continue
+        if items:
+            return sum(aligned(n) for _, n in items)
+    return 0
+
+
+def _process_slab_worker(
+    h5_path: Path,
+    slab_name: Optional[str],
+    layout: Optional[Layout],
+    **kwargs: Any,
+) -> Dict[str, Any]:
+    """``_process_file_worker`` on datasets a reader process loaded into the
+    shared-memory slab ``slab_name`` (see ``shm_pipeline``), used in place."""
+    preloaded = slab_arrays(slab_name, layout) if slab_name is not None else None
+    return _process_file_worker(h5_path, preloaded=preloaded, **kwargs)
+
+
+def write_stats_summary(
+    summary_csv: Path,
+    stats_accs: Dict[str, StatsAccumulator],
+    file_counts: Dict[str, int],
+) -> None:
+    """Write run-wide stats per dataset name from merged accumulators."""
+    summary_rows = []
+    for dset_name in sorted(stats_accs):
+        acc = stats_accs[dset_name]
+        summary_rows.append(
+            {
+                "dataset": dset_name,
+                "files": file_counts.get(dset_name, 0),
+                "sampled_values": acc.n_total,
+                **acc.result(),
+            }
+        )
+    summary_csv.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame(summary_rows).to_csv(summary_csv, index=False)
+
+
 def append_results_md(results_md: Path, rows: List[Dict[str, Any]]) -> None:
     results_md.parent.mkdir(parents=True, exist_ok=True)
     with open(results_md, "a", encoding="utf-8") as fo:
         for r in rows:
+            if r["mode"] == "stats":
+                fo.write(
+                    f"- file={Path(r['file']).name} dset={r['dataset']} mode=stats"
+                    f" sampled={r['sampled_values']} ({r['sample_mode']},"
+                    f" {r['sample_seconds']:.3f}s) mean={r['mean']:.6g}"
+                    f" std={r['std']:.6g} min={r['min']:.6g} max={r['max']:.6g}\n"
+                )
+                continue
             line = (
-                f"- file={Path(r['file']).name} dset={r['dataset']} mode={r['mode']}"
+                f"- file={Path(r['file']).name} dset={r['dataset']}"
+                f" codec={r.get('codec', 'daspack')} mode={r['mode']}"
                 f" step={r['step']} cf={r['compression_factor']:.3f}"
                 f" enc={r['encode_seconds']:.3f}s dec={r['decode_seconds']:.3f}s"
             )
@@ -316,10 +1330,16 @@ def append_results_md(results_md: Path, rows: List[Dict[str, Any]]) -> None:
                 line += f" verify_ok={r['verify_ok']}"
             if r.get("verify_max_abs_err") is not None:
                 line += f" max_err={r['verify_max_abs_err']:.6g}"
+            if r.get("verify_rmse") is not None:
+                line += f" rmse={r['verify_rmse']:.6g}"
+            if r.get("verify_ok") is not None and r.get("verify_fraction", 1.0) < 1.0:
+                line += f" verified={r['verify_fraction']:.1%}"
+            if r.get("target_cf") is not None:
+                line += f" target_cf={r['target_cf']:g} sample_cf={r['sample_cf']:.3f}"
             fo.write(line + "\n")
 
 
-def main() -> int:
+def main(argv: Optional[List[str]] = None) -> int:
     ap = argparse.ArgumentParser(
         description="Analyze and compress DAS24 HDF5 files using daspack"
     )
@@ -329,7 +1349,21 @@ def main() -> int:
         default="das24_data",
         help="Input directory to scan for HDF5 files",
     )
-    ap.add_argument("--threads", type=int, default=4, help="Threads for DASCoder")
+    ap.add_argument(
+        "--codec",
+        choices=codec_names(),
+        default="daspack",
+        help="Compression backend; the non-daspack codecs are baselines for "
+        "comparison (blosc-* need blosc2, quant-delta-zstd needs zstandard)",
+    )
+    ap.add_argument("--threads", type=int, default=4, help="Threads per codec")
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes to spread files across (1=serial). "
+        "DASCoder threads are reduced so workers x threads fits the CPUs",
+    )
     ap.add_argument(
         "--uniform-steps",
         type=float,
@@ -337,17 +1371,181 @@ def main() -> int:
         default=[0.5, 0.1],
         help="Uniform quantization steps for float data",
     )
+    target = ap.add_mutually_exclusive_group()
+    target.add_argument(
+        "--target-cf",
+        type=float,
+        default=None,
+        help="Pick each float dataset's uniform step so the compression factor "
+        "reaches this target (bisection on a block subsample); replaces "
+        "--uniform-steps",
+    )
+    target.add_argument(
+        "--target-max-err",
+        type=float,
+        default=None,
+        help="Maximum absolute reconstruction error; uses step = 2 x error "
+        "(uniform quantization error is at most step/2); replaces --uniform-steps",
+    )
+    ap.add_argument(
+        "--target-sample",
+        type=int,
+        default=1_000_000,
+        help="Elements in the contiguous block used to search for --target-cf",
+    )
     ap.add_argument(
         "--max-sample",
         type=int,
         default=2_000_000,
         help="Max elements to sample for stats/histograms",
     )
+    ap.add_argument(
+        "--stats-only",
+        action="store_true",
+        help="Quick look: compute stats/histograms from a --max-sample sample "
+        "read straight from disk, without reading whole datasets or encoding",
+    )
+    ap.add_argument(
+        "--sample-mode",
+        choices=[m for m in SAMPLE_MODES if m != "block"],
+        default="rows",
+        help="Sample layout for --stats-only: evenly spaced full rows, random "
+        "row windows, or a row/column stride",
+    )
+    ap.add_argument(
+        "--hist-range",
+        type=float,
+        nargs=2,
+        default=[-64.0, 64.0],
+        metavar=("LO", "HI"),
+        help="Fixed histogram range shared by all files; values outside are "
+        "counted as under/overflow",
+    )
+    ap.add_argument(
+        "--hist-bins", type=int, default=256, help="Number of histogram bins"
+    )
+    ap.add_argument(
+        "--hist-render",
+        choices=["none", "files", "heatmap"],
+        default="heatmap",
+        help="PNG rendering of the histogram counts after the run: one PNG per "
+        "file, one heatmap across files, or none",
+    )
+    ap.add_argument(
+        "--render-histograms",
+        type=str,
+        default=None,
+        metavar="NPZ",
+        help="Only render PNGs (per --hist-render) from an existing "
+        "hist_counts.npz and exit",
+    )
+    ap.add_argument(
+        "--skip-unchanged-figures",
+        action="store_true",
+        help="Skip re-rendering histogram PNGs whose input counts did not change",
+    )
+    ap.add_argument(
+        "--verify",
+        choices=VERIFY_MODES,
+        default="limit",
+        help="Decode check: 'limit' only for blocks up to --verify-limit elements, "
+        "'blocks' for every --stream block, 'windows' for --verify-windows "
+        "random --stream blocks. 'blocks' and 'windows' need --stream, where "
+        "each block decodes on its own; streams are encoded the same way in "
+        "every mode",
+    )
     ap.add_argument(
         "--verify-limit",
         type=int,
         default=1_200_000,
-        help="Max elements allowed to fully decode for verification",
+        help="Max elements allowed to fully decode for verification (--verify limit)",
+    )
+    ap.add_argument(
+        "--verify-windows",
+        type=int,
+        default=4,
+        help="Random --stream blocks checked per dataset with --verify windows",
+    )
+    ap.add_argument(
+        "--stream",
+        action="store_true",
+        help="Read, analyze and encode each dataset in row blocks instead of all at once",
+    )
+    ap.add_argument(
+        "--mem-limit-mb",
+        type=float,
+        default=512,
+        help="Per-file working-set ceiling for --stream block sizing (MB)",
+    )
+    ap.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Read datasets through h5py instead of memory-mapping contiguous ones",
+    )
+    ap.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=2,
+        help="Files loaded ahead on a background thread while the current one "
+        "is encoded (serial runs only; 0=off)",
+    )
+    ap.add_argument(
+        "--prefetch-mb",
+        type=float,
+        default=1024,
+        help="Memory cap for prefetched datasets, including the file in use (MB)",
+    )
+    ap.add_argument(
+        "--shm-readers",
+        type=int,
+        default=0,
+        help="Reader processes loading datasets into shared-memory slabs that "
+        "the --workers encoder processes use without copying (0=off)",
+    )
+    ap.add_argument(
+        "--shm-slabs",
+        type=int,
+        default=0,
+        help="Shared-memory slabs (0=--shm-readers + --workers)",
+    )
+    ap.add_argument(
+        "--shm-slab-mb",
+        type=float,
+        default=0,
+        help="Size of each slab (MiB; 0=the datasets of the first file). Files "
+        "that do not fit are read by their encoder",
+    )
+    ap.add_argument(
+        "--outputs",
+        choices=OUTPUT_MODES,
+        default="both",
+        help="Where streams go: one file each, the aggregator blob only, both "
+        "(two copies, the default), or linked (files indexed by the aggregator, "
+        "one copy; the aggregator then needs the files next to it)",
+    )
+    ap.add_argument(
+        "--write-buffer-mb",
+        type=float,
+        default=256,
+        help="Streams buffered for the background writer before encoding waits (MB)",
+    )
+    ap.add_argument(
+        "--cache",
+        type=str,
+        default=str(Path(__file__).resolve().parent / "artifacts" / "result_cache.sqlite"),
+        help="Result cache database; unchanged work items are reused on reruns",
+    )
+    ap.add_argument(
+        "--cache-key",
+        choices=["mtime", "content"],
+        default="mtime",
+        help="Detect changed files by size+mtime or by hashing their full content "
+        "(reads every file on each run)",
+    )
+    ap.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Recompute everything and do not read or write the result cache",
     )
     ap.add_argument(
         "--min-files",
@@ -361,7 +1559,33 @@ def main() -> int:
         default=0,
         help="Optional cap on number of files processed (0=no cap)",
     )
-    args = ap.parse_args()
+    ap.add_argument(
+        "--metadata-file",
+        type=str,
+        default=None,
+        help="Also update this metadata index (as hdf5_metadata_scanner.py) for "
+        "new or changed files, read from the same open handle as the data so "
+        "each file is opened once",
+    )
+    ap.add_argument(
+        "--rescan-metadata",
+        action="store_true",
+        help="With --metadata-file, re-read the entries of unchanged files too",
+    )
+    args = ap.parse_args(argv)
+    if args.verify in ("blocks", "windows") and not args.stream:
+        # Without block framing every check decodes the whole stream, a second
+        # full-size copy next to the source
+        ap.error(f"--verify {args.verify} needs --stream")
+
+    if args.render_histograms:
+        render_histograms(
+            Path(args.render_histograms),
+            args.hist_render,
+            workers=max(1, min(args.workers, available_cpus())),
+            skip_unchanged=args.skip_unchanged_figures,
+        )
+        return 0
 
     root = Path(args.input).resolve()
     if not root.exists():
@@ -379,90 +1603,229 @@ def main() -> int:
     if args.limit and args.limit > 0:
         files = files[: args.limit]
 
+    workers = max(1, min(args.workers, available_cpus(), len(files)))
+    if workers < args.workers:
+        print(
+            f"Using {workers} worker(s) instead of {args.workers} "
+            f"({available_cpus()} CPU(s), {len(files)} file(s))",
+            file=sys.stderr,
+        )
+
     base_dir = Path(__file__).resolve().parent
     artifacts_dir = base_dir / "artifacts"
     outputs_dir = base_dir / "outputs"
     stats_csv = artifacts_dir / "stats.csv"
+    summary_csv = artifacts_dir / "stats_summary.csv"
+    hist_npz = artifacts_dir / "histograms" / "hist_counts.npz"
     results_md = base_dir / "RESULTS.md"
     aggregator_path = outputs_dir / "daspack_compressed.h5"
 
     all_rows: List[Dict[str, Any]] = []
+    stats_accs: Dict[str, StatsAccumulator] = {}
+    hist_accs: Dict[str, HistogramAccumulator] = {}
 
     # Open aggregator once
-    aggregator: Optional[h5py.File] = None
+    aggregator: Optional[BlobAggregator] = None
     outputs_dir.mkdir(parents=True, exist_ok=True)
-    try:
-        aggregator = h5py.File(aggregator_path, "a")
-    except Exception:
-        aggregator = None
+    output_mode = args.outputs
+    if output_mode != "files":
+        try:
+            aggregator = BlobAggregator(aggregator_path)
+        except Exception as e:
+            print(
+                f"\n⚠️  Aggregator disabled, writing stream files only: {e}",
+                file=sys.stderr,
+            )
+            aggregator = None
+            output_mode = "files"
+    if aggregator is not None and aggregator.legacy_keys():
+        print(
+            f"\n⚠️  {aggregator_path} also holds streams in the old one-dataset-per-"
+            "stream layout; new streams go to its blob. Migrate the old ones with "
+            "'das_aggregator.py convert'",
+            file=sys.stderr,
+        )
+
+    # Files whose metadata-index entry is read along with their data; the
+    # others take their dataset list from their current entry
+    scanner: Optional[HDF5MetadataScanner] = None
+    index_kwargs: Dict[str, Any] = {}
+    if args.metadata_file:
+        scanner = HDF5MetadataScanner(Path(args.metadata_file))
+        stale = scanner.prepare_scan(root, force=args.rescan_metadata)
+        scan_metadata = frozenset(str(p.resolve()) for p in stale)
+        indexed: Dict[str, List[str]] = {}
+        for h5_path in files:
+            key = str(h5_path.resolve())
+            entry = None if key in scan_metadata else get_file(scanner.metadata, key)
+            if entry is not None and "structure" in entry:
+                indexed[key] = numeric_2d_datasets_in(entry["structure"])
+        index_kwargs = dict(scan_metadata=scan_metadata, indexed=indexed)
 
+    uniform_steps = args.uniform_steps
+    if args.target_max_err is not None:
+        uniform_steps = [2.0 * args.target_max_err]
+    elif args.target_cf is not None:
+        uniform_steps = []
+
+    # Aggregator streams of earlier runs; cached results are only reused
+    # while their streams are still stored
+    stored_keys = (
+        frozenset(aggregator.available_keys()) if aggregator is not None else frozenset()
+    )
+    sink = StreamSink(
+        outputs_dir,
+        output_mode,
+        aggregator=aggregator,
+        max_pending_bytes=int(args.write_buffer_mb * 2**20),
+        stored_keys=stored_keys,
+    )
+    worker_state = {"index": index_kwargs, "stored_keys": stored_keys}
     try:
-        for h5_path in tqdm(files, desc="Files"):
-            try:
-                with h5py.File(h5_path, "r") as f:
-                    dsets = list_numeric_2d_datasets(f)
-            except OSError as e:
-                error_msg = str(e)
-                if "truncated file" in error_msg.lower():
-                    print(
-                        f"\n⚠️  Skipping truncated file: {h5_path.name}", file=sys.stderr
-                    )
-                    print(f"    Error: {error_msg}", file=sys.stderr)
-                    continue
-                elif "unable to open file" in error_msg.lower():
-                    print(
-                        f"\n⚠️  Skipping inaccessible file: {h5_path.name}",
-                        file=sys.stderr,
-                    )
-                    print(f"    Error: {error_msg}", file=sys.stderr)
-                    continue
-                else:
-                    print(
-                        f"\n⚠️  Skipping file with OSError: {h5_path.name}",
-                        file=sys.stderr,
+        file_kwargs = dict(
+            uniform_steps=uniform_steps,
+            max_sample=args.max_sample,
+            verify_limit=args.verify_limit,
+            mem_limit_bytes=int(args.mem_limit_mb * 2**20) if args.stream else 0,
+            hist_range=tuple(args.hist_range),
+            hist_bins=args.hist_bins,
+            cache_path=Path(args.cache),
+            cache_key=args.cache_key,
+            target_cf=args.target_cf,
+            target_sample=args.target_sample,
+            codec=args.codec,
+            verify=args.verify,
+            verify_windows=args.verify_windows,
+            use_mmap=not args.no_mmap,
+            stats_only=args.stats_only,
+        )
+        if args.stats_only:
+            file_kwargs["sample_mode"] = args.sample_mode
+        if args.no_cache:
+            file_kwargs["cache_path"] = None
+
+        def merge_products(products: Dict[str, Any]) -> None:
+            if scanner is not None and products["file_metadata"] is not None:
+                scanner.store_file(products["file_metadata"])
+            for entry in products["aggregator_entries"]:
+                sink.submit_aggregator(entry)
+            for dset_name, acc in products["stats_accs"].items():
+                stats_accs.setdefault(dset_name, StatsAccumulator()).merge(acc)
+            hist_accs.update(products["hist_accs"])
+            all_rows.extend(products["rows"])
+            append_results_md(results_md, products["new_rows"])
+
+        if args.shm_readers > 0 and not args.stats_only:
+            # Readers fill shared-memory slabs; encoders use them in place
+            worker_fn = partial(
+                _process_slab_worker,
+                outputs_dir=outputs_dir,
+                output_mode=output_mode,
+                collect_aggregator=aggregator is not None,
+                threads=budget_threads(workers, args.threads),
+                **file_kwargs,
+            )
+            if args.shm_slab_mb > 0:
+                slab_bytes = int(args.shm_slab_mb * 2**20)
+            else:
+                slab_bytes = default_slab_bytes(files, file_kwargs)
+            results = slab_pipeline(
+                files,
+                partial(prefetch_datasets, output_mode=output_mode, **file_kwargs),
+                read_datasets_into,
+                worker_fn,
+                slab_bytes,
+                readers=args.shm_readers,
+                workers=workers,
+                slabs=args.shm_slabs,
+                initializer=_init_worker,
+                initargs=(worker_state,),
+            )
+            for products in tqdm(results, total=len(files), desc="Files"):
+                merge_products(products)
+        elif workers == 1:
+            if args.prefetch_depth > 0 and not args.stats_only:
+                # Load the next files on a background thread while this one encodes
+                items = iter(
+                    PrefetchReader(
+                        files,
+                        partial(prefetch_datasets, output_mode=output_mode, **file_kwargs),
+                        read_datasets,
+                        depth=args.prefetch_depth,
+                        max_bytes=int(args.prefetch_mb * 2**20),
                     )
-                    print(f"    Error: {error_msg}", file=sys.stderr)
-                    continue
-            except Exception as e:
-                print(
-                    f"\n⚠️  Skipping file with unexpected error: {h5_path.name}",
-                    file=sys.stderr,
                 )
-                print(f"    Error: {type(e).__name__}: {e}", file=sys.stderr)
-                continue
-
-            if not dsets:
-                continue
-            # Process only the first dataset if there are many, but always prioritize 'data'
-            target_dsets = dsets[:1]
-            for dname in target_dsets:
-                rows = process_dataset(
-                    h5_path=h5_path,
-                    dset_name=dname,
-                    threads=args.threads,
-                    uniform_steps=args.uniform_steps,
-                    max_sample=args.max_sample,
-                    verify_limit=args.verify_limit,
-                    outputs_dir=outputs_dir,
-                    artifacts_dir=artifacts_dir,
-                    aggregator_h5=aggregator,
+            else:
+                items = ((h5_path, None) for h5_path in files)
+            for h5_path, preloaded in tqdm(items, total=len(files), desc="Files"):
+                merge_products(
+                    analyze_file(
+                        h5_path,
+                        new_file_products(),
+                        threads=args.threads,
+                        sink=sink,
+                        output_mode=output_mode,
+                        preloaded=preloaded,
+                        **index_kwargs,
+                        **file_kwargs,
+                    )
                 )
-                all_rows.extend(rows)
-                append_results_md(results_md, rows)
+                del preloaded
+        else:
+            worker_fn = partial(
+                _process_file_worker,
+                outputs_dir=outputs_dir,
+                output_mode=output_mode,
+                collect_aggregator=aggregator is not None,
+                threads=budget_threads(workers, args.threads),
+                **file_kwargs,
+            )
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(worker_state,),
+            ) as pool:
+                # map() yields in submission order, so outputs match a serial run
+                for products in tqdm(
+                    pool.map(worker_fn, files), total=len(files), desc="Files"
+                ):
+                    merge_products(products)
+        if scanner is not None:
+            scanner.finish_scan(root)
+            scanner.save_metadata()
     finally:
-        if aggregator is not None:
-            aggregator.close()
+        try:
+            sink.close()
+        finally:
+            if aggregator is not None:
+                aggregator.close()
 
     # Merge to CSV
     if all_rows:
         df = pd.DataFrame(all_rows)
         df.sort_values(
-            ["file", "dataset", "mode", "step"], inplace=True, na_position="last"
+            ["file", "dataset", "codec", "mode", "step"],
+            inplace=True,
+            na_position="last",
         )
         artifacts_dir.mkdir(parents=True, exist_ok=True)
         df.to_csv(stats_csv, index=False)
 
+        file_counts = df.groupby("dataset")["file"].nunique().to_dict()
+        write_stats_summary(summary_csv, stats_accs, file_counts)
+
+    if hist_accs:
+        save_histogram_table(hist_npz, list(hist_accs), list(hist_accs.values()))
+        render_histograms(
+            hist_npz,
+            args.hist_render,
+            workers=max(1, min(args.workers, available_cpus())),
+            skip_unchanged=args.skip_unchanged_figures,
+        )
+
     print(f"Done. Stats CSV: {stats_csv}")
+    print(f"Run-wide stats: {summary_csv}")
+    print(f"Histogram counts: {hist_npz}")
     print(f"Results: {results_md}")
     print(f"Compressed outputs: {outputs_dir}")
     return 0
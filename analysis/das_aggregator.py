@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Append-only aggregator for encoded DAS streams
+
+All streams live in one HDF5 file with two datasets:
+- ``blob``: a single chunked, resizable uint8 dataset; each stream is
+  appended at its end
+- ``index``: one row per stream with its key, offset, length, live flag and
+  attributes (JSON)
+
+The index is loaded into a dict on open, so any stream is read with a single
+slice of ``blob``. Streams that already exist as files can be linked instead
+of copied (``put_external``): their index row has offset -1 and the file
+path, relative to the aggregator, in the ``external`` attribute. Rewriting a key appends a new copy and marks the old row
+dead instead of deleting datasets, which HDF5 would never reclaim; ``repack``
+copies the live streams into a fresh file to drop the dead bytes.
+
+Usage:
+    python das_aggregator.py list outputs/daspack_compressed.h5
+    python das_aggregator.py get outputs/daspack_compressed.h5 KEY -o stream.dasp
+    python das_aggregator.py decode outputs/daspack_compressed.h5 KEY -o data.npy
+    python das_aggregator.py repack outputs/daspack_compressed.h5
+    python das_aggregator.py convert OLD.h5 NEW.h5   # one-dataset-per-stream layout
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import h5py
+import numpy as np
+
+from das_codecs import decode_stream, make_codec
+
+
+BLOB_CHUNK_BYTES = 1 << 20
+INDEX_CHUNK_ROWS = 1024
+INDEX_DTYPE = np.dtype(
+    [
+        ("key", h5py.string_dtype()),
+        ("offset", "<i8"),
+        ("length", "<i8"),
+        ("live", "u1"),
+        ("attrs", h5py.string_dtype()),
+    ]
+)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (tuple, np.ndarray)):
+        return [_json_value(v) for v in value]
+    return value
+
+
+def _as_str(value: Any) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class BlobAggregator:
+    """Streams appended into one ``blob`` dataset with an ``index`` table."""
+
+    def __init__(self, path: Path, mode: str = "a"):
+        self.path = Path(path)
+        self.h5 = h5py.File(self.path, mode)
+        if "blob" not in self.h5 and mode == "r":
+            self.h5.close()
+            raise ValueError(
+                f"{self.path} has no blob layout; convert it with "
+                f"'das_aggregator.py convert {self.path} NEW.h5'"
+            )
+        if "blob" not in self.h5:
+            self.h5.create_dataset(
+                "blob",
+                shape=(0,),
+                maxshape=(None,),
+                dtype=np.uint8,
+                chunks=(BLOB_CHUNK_BYTES,),
+            )
+            self.h5.create_dataset(
+                "index",
+                shape=(0,),
+                maxshape=(None,),
+                dtype=INDEX_DTYPE,
+                chunks=(INDEX_CHUNK_ROWS,),
+            )
+        self.blob = self.h5["blob"]
+        self.index = self.h5["index"]
+        # key -> (index row, offset, length) of the live copy
+        self.entries: Dict[str, Tuple[int, int, int]] = {}
+        for row, rec in enumerate(self.index[...]):
+            if rec["live"]:
+                self.entries[_as_str(rec["key"])] = (
+                    row,
+                    int(rec["offset"]),
+                    int(rec["length"]),
+                )
+
+    def legacy_keys(self) -> List[str]:
+        """Top-level names left over from the one-dataset-per-stream layout."""
+        return [name for name in self.h5 if name not in ("blob", "index")]
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def keys(self) -> List[str]:
+        return list(self.entries)
+
+    def available_keys(self) -> Set[str]:
+        """Keys whose bytes can be read: streams in ``blob``, and linked
+        streams whose file still exists."""
+        out = set()
+        for rec in self.index[...]:
+            if not rec["live"]:
+                continue
+            if rec["offset"] < 0:
+                external = json.loads(_as_str(rec["attrs"]))["external"]
+                if not (self.path.parent / external).is_file():
+                    continue
+            out.add(_as_str(rec["key"]))
+        return out
+
+    def put(self, key: str, stream: bytes, attrs: Dict[str, Any]) -> None:
+        """Append ``stream`` under ``key``; an older copy is marked dead."""
+        data = np.frombuffer(stream, dtype=np.uint8)
+        offset = self.blob.shape[0]
+        self.blob.resize((offset + data.size,))
+        if data.size:
+            self.blob[offset:] = data
+        self._append_row(key, offset, data.size, attrs)
+
+    def put_external(
+        self, key: str, path: Path, length: int, attrs: Dict[str, Any]
+    ) -> None:
+        """Index a stream stored in the file ``path`` without copying its bytes."""
+        external = os.path.relpath(Path(path).resolve(), self.path.resolve().parent)
+        self._append_row(key, -1, length, {**attrs, "external": external})
+
+    def _append_row(
+        self, key: str, offset: int, length: int, attrs: Dict[str, Any]
+    ) -> None:
+        previous = self.entries.get(key)
+        if previous is not None:
+            rec = self.index[previous[0]]
+            rec["live"] = 0
+            self.index[previous[0]] = rec
+
+        row = self.index.shape[0]
+        self.index.resize((row + 1,))
+        self.index[row] = (
+            key,
+            offset,
+            length,
+            1,
+            json.dumps({k: _json_value(v) for k, v in attrs.items()}),
+        )
+        self.entries[key] = (row, offset, length)
+
+    def external_path(self, key: str) -> Optional[Path]:
+        """File holding a linked stream, or None for streams in ``blob``."""
+        if self.entries[key][1] >= 0:
+            return None
+        return self.path.parent / self.attrs(key)["external"]
+
+    def get(self, key: str) -> bytes:
+        _, offset, length = self.entries[key]
+        if offset < 0:
+            with open(self.external_path(key), "rb") as f:
+                return f.read()
+        return self.blob[offset : offset + length].tobytes()
+
+    def decode(self, key: str, threads: int = 1) -> np.ndarray:
+        """Decode a stream with the codec named in its attributes.
+
+        Block-framed streams (written with --stream) are reassembled into one
+        array; streams without a ``codec`` attribute are daspack.
+        """
+        attrs = self.attrs(key)
+        step = None if attrs.get("lossless", True) else attrs.get("quant_step")
+        codec = make_codec(attrs.get("codec", "daspack"), step, threads)
+        return decode_stream(codec, self.get(key))
+
+    def attrs(self, key: str) -> Dict[str, Any]:
+        return json.loads(_as_str(self.index[self.entries[key][0]]["attrs"]))
+
+    def items(self) -> Iterator[Tuple[str, bytes, Dict[str, Any]]]:
+        for key in self.entries:
+            yield key, self.get(key), self.attrs(key)
+
+    def usage(self) -> Dict[str, int]:
+        """Live and dead bytes in ``blob`` (linked streams are not counted)."""
+        live = sum(
+            length for _, offset, length in self.entries.values() if offset >= 0
+        )
+        return {
+            "streams": len(self.entries),
+            "linked": sum(1 for _, offset, _ in self.entries.values() if offset < 0),
+            "blob_bytes": int(self.blob.shape[0]),
+            "live_bytes": live,
+            "dead_bytes": int(self.blob.shape[0]) - live,
+        }
+
+    def flush(self) -> None:
+        self.h5.flush()
+
+    def close(self) -> None:
+        self.h5.close()
+
+
+def repack(path: Path) -> Dict[str, int]:
+    """Rewrite ``path`` with only its live streams; returns the old usage."""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".repack")
+    src = BlobAggregator(path, "r")
+    try:
+        if src.legacy_keys():
+            raise ValueError(
+                f"{path} still holds old-layout streams; run "
+                f"'das_aggregator.py convert {path} NEW.h5' instead"
+            )
+        usage = src.usage()
+        dst = BlobAggregator(tmp_path, "w")
+        try:
+            for key in src.keys():
+                attrs = src.attrs(key)
+                external = src.external_path(key)
+                if external is None:
+                    dst.put(key, src.get(key), attrs)
+                else:
+                    attrs.pop("external")
+                    dst.put_external(key, external, src.entries[key][2], attrs)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+    os.replace(tmp_path, path)
+    return usage
+
+
+def convert_legacy(src_path: Path, dst_path: Path) -> int:
+    """Copy ``<key>/compressed`` datasets of the old layout into a blob file.
+
+    Streams already in the source's blob are copied too, after the old ones,
+    so the newer copy of a key wins.
+    """
+    streams: List[str] = []
+
+    def visit(name: str, obj: Any) -> None:
+        if isinstance(obj, h5py.Dataset) and name.endswith("/compressed"):
+            streams.append(name[: -len("/compressed")])
+
+    with h5py.File(src_path, "r") as src:
+        src.visititems(visit)
+        has_blob = "blob" in src
+    dst = BlobAggregator(dst_path, "a")
+    try:
+        with h5py.File(src_path, "r") as src:
+            for key in streams:
+                dset = src[key + "/compressed"]
+                dst.put(key, dset[...].tobytes(), dict(dset.attrs))
+        if has_blob:
+            blob_src = BlobAggregator(src_path, "r")
+            try:
+                for key, stream, attrs in blob_src.items():
+                    dst.put(key, stream, attrs)
+            finally:
+                blob_src.close()
+    finally:
+        dst.close()
+    return len(streams)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Inspect and maintain blob aggregator files"
+    )
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p_list = sub.add_parser("list", help="List streams and space usage")
+    p_list.add_argument("path", type=str)
+
+    p_get = sub.add_parser("get", help="Write one stream to a file")
+    p_get.add_argument("path", type=str)
+    p_get.add_argument("key", type=str)
+    p_get.add_argument("-o", "--output", type=str, required=True)
+
+    p_decode = sub.add_parser("decode", help="Decode one stream to a .npy file")
+    p_decode.add_argument("path", type=str)
+    p_decode.add_argument("key", type=str)
+    p_decode.add_argument("-o", "--output", type=str, required=True)
+    p_decode.add_argument("--threads", type=int, default=1, help="Codec threads")
+
+    p_repack = sub.add_parser("repack", help="Drop dead (overwritten) streams")
+    p_repack.add_argument("path", type=str)
+
+    p_convert = sub.add_parser(
+        "convert",
+        help="Convert a one-dataset-per-stream aggregator to the blob layout",
+    )
+    p_convert.add_argument("src", type=str)
+    p_convert.add_argument("dst", type=str)
+    args = ap.parse_args()
+
+    if args.command == "convert":
+        n = convert_legacy(Path(args.src), Path(args.dst))
+        print(f"Converted {n} stream(s) into {args.dst}")
+        return 0
+
+    path = Path(args.path)
+    if not path.exists():
+        print(f"Aggregator not found: {path}", file=sys.stderr)
+        return 2
+
+    if args.command == "repack":
+        try:
+            before = repack(path)
+        except ValueError as e:
+            print(str(e), file=sys.stderr)
+            return 2
+        print(
+            f"Repacked {path}: {before['streams']} stream(s), "
+            f"{before['dead_bytes']:,} dead bytes dropped"
+        )
+        return 0
+
+    try:
+        agg = BlobAggregator(path, "r")
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    try:
+        if args.command in ("get", "decode") and args.key not in agg:
+            print(f"No stream with key: {args.key}", file=sys.stderr)
+            return 1
+        if args.command == "get":
+            with open(args.output, "wb") as fo:
+                fo.write(agg.get(args.key))
+            print(f"Wrote {args.output}")
+        elif args.command == "decode":
+            data = agg.decode(args.key, args.threads)
+            np.save(args.output, data)
+            print(f"Wrote {args.output} ({data.dtype}, shape {data.shape})")
+        else:
+            for key in sorted(agg.keys()):
+                _, _, length = agg.entries[key]
+                print(f"{key}\t{length}")
+            usage = agg.usage()
+            print(
+                f"{usage['streams']} stream(s) ({usage['linked']} linked), "
+                f"{usage['live_bytes']:,} live bytes, {usage['dead_bytes']:,} dead bytes"
+            )
+    finally:
+        agg.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
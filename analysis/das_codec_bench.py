@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Codec throughput benchmark for DAS blocks
+
+Measures encode and decode throughput (MB/s of uncompressed data) of the
+codecs in ``das_codecs`` with warmup runs, repeated timings and percentiles,
+sweeping array shape, dtype, codec threads and quantization step.
+
+Blocks come from two sources:
+- synthetic: colored (1/f) noise plus moving-vessel chirps, generated from a
+  fixed seed so the benchmark runs offline and is repeatable
+- real: the top-left block of the first 2D dataset of each file under
+  ``--input`` (files smaller than a shape are skipped for that shape)
+
+Results are written as JSON together with the codec versions and host
+details, so runs across daspack versions can be compared with ``--compare``.
+
+Rows are treated as time samples and columns as channels.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import h5py
+import numpy as np
+
+from das24_analyze_compress import available_cpus, discover_datasets, find_hdf5_files
+from das_codecs import codec_is_lossy, codec_names, codec_version, make_codec
+
+
+PERCENTILES = (5, 50, 95)
+DTYPES = ["float32", "float64", "int16", "int32"]
+
+
+def parse_shape(text: str) -> Tuple[int, int]:
+    rows, _, cols = text.lower().partition("x")
+    try:
+        return int(rows), int(cols)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shape must look like ROWSxCOLS: {text}")
+
+
+def synthetic_das(
+    shape: Tuple[int, int],
+    seed: int = 0,
+    fs: float = 250.0,
+    dx: float = 8.0,
+    alpha: float = 1.0,
+    n_vessels: int = 3,
+    chunk_cols: int = 1024,
+) -> np.ndarray:
+    """Synthetic DAS block (time x channel, float32).
+
+    Background is Gaussian noise shaped to a 1/f**alpha power spectrum along
+    time. Each vessel moves along the fiber at a constant speed and emits a
+    linear chirp whose amplitude falls off with distance from its current
+    channel and whose phase is delayed by the acoustic travel time (1500 m/s).
+    Columns are generated in chunks to bound the temporary complex arrays.
+    """
+    n_t, n_ch = shape
+    rng = np.random.default_rng(seed)
+    out = np.empty(shape, dtype=np.float32)
+    t = np.arange(n_t, dtype=np.float64)[:, None] / fs
+
+    freqs = np.fft.rfftfreq(n_t, d=1.0 / fs)
+    shaping = np.ones_like(freqs)
+    shaping[1:] = (freqs[1:] / freqs[1]) ** (-alpha / 2)
+    shaping[0] = 0.0
+
+    vessels = [
+        {
+            "c0": rng.uniform(0, n_ch),
+            "speed": rng.uniform(-5, 5) / dx,  # channels per second
+            "f0": rng.uniform(10, fs / 8),
+            "rate": rng.uniform(-2, 2),  # Hz per second
+            "amp": rng.uniform(2, 8),
+            "width": rng.uniform(5, 50),  # channels
+        }
+        for _ in range(n_vessels)
+    ]
+
+    for c0 in range(0, n_ch, chunk_cols):
+        c1 = min(n_ch, c0 + chunk_cols)
+        noise = rng.standard_normal((n_t, c1 - c0))
+        spec = np.fft.rfft(noise, axis=0)
+        spec *= shaping[:, None]
+        block = np.fft.irfft(spec, n=n_t, axis=0)
+        del noise, spec
+        block /= block.std() or 1.0
+
+        ch = np.arange(c0, c1, dtype=np.float64)[None, :]
+        for v in vessels:
+            dist = ch - (v["c0"] + v["speed"] * t)
+            delay = np.abs(dist) * dx / 1500.0
+            tau = t - delay
+            phase = 2 * np.pi * (v["f0"] * tau + 0.5 * v["rate"] * tau**2)
+            block += v["amp"] / (1 + (dist / v["width"]) ** 2) * np.sin(phase)
+        out[:, c0:c1] = block
+    return out
+
+
+def as_dtype(block: np.ndarray, dtype: str) -> np.ndarray:
+    """Cast a float block to ``dtype``; integers keep ~8 bits below the spread."""
+    dtype = np.dtype(dtype)
+    if np.issubdtype(block.dtype, np.integer) or not np.issubdtype(dtype, np.integer):
+        return np.ascontiguousarray(block, dtype=dtype)
+    spread = float(np.std(block)) or 1.0
+    info = np.iinfo(dtype)
+    scaled = np.rint(block / (spread / 256))
+    np.clip(scaled, info.min, info.max, out=scaled)
+    return scaled.astype(dtype)
+
+
+def real_blocks(
+    root: Path, shape: Tuple[int, int], limit: int
+) -> Iterator[Tuple[str, np.ndarray]]:
+    """(label, block) for the first dataset of each file large enough for ``shape``."""
+    files = sorted(find_hdf5_files(root))
+    if limit > 0:
+        files = files[:limit]
+    for h5_path in files:
+        dsets = discover_datasets(h5_path)
+        if not dsets:
+            continue
+        with h5py.File(h5_path, "r") as f:
+            dset = f[dsets[0]]
+            if dset.shape[0] < shape[0] or dset.shape[1] < shape[1]:
+                print(
+                    f"⚠️  {h5_path.name}:{dsets[0]} {dset.shape} is smaller than "
+                    f"{shape}, skipped",
+                    file=sys.stderr,
+                )
+                continue
+            yield f"{h5_path.name}:{dsets[0]}", dset[: shape[0], : shape[1]]
+
+
+def time_call(fn: Callable[[], Any], warmup: int, repeats: int) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def throughput(nbytes: int, times: List[float]) -> Dict[str, Optional[float]]:
+    """MB/s percentiles (decimal MB) and the median time of one call.
+
+    Calls too fast for the timer have no finite rate and are left out; the
+    rates are None if no call was measurable.
+    """
+    mb_s = [nbytes / 1e6 / t for t in times if t > 0]
+    result: Dict[str, Optional[float]] = {
+        f"mb_s_p{p}": float(np.percentile(mb_s, p)) if mb_s else None
+        for p in PERCENTILES
+    }
+    result["mb_s_mean"] = float(np.mean(mb_s)) if mb_s else None
+    result["median_seconds"] = float(np.median(times))
+    return result
+
+
+def fmt(value: Optional[float], spec: str = ".1f") -> str:
+    return "n/a" if value is None else format(value, spec)
+
+
+def bench_block(
+    source: str,
+    block: np.ndarray,
+    codec_name: str,
+    threads: int,
+    step: Optional[float],
+    warmup: int,
+    repeats: int,
+) -> Dict[str, Any]:
+    codec = make_codec(codec_name, step, threads)
+    arr = codec.prepare(block)
+    nbytes = block.size * block.dtype.itemsize
+    stream = codec.encode(arr)
+    restored = codec.decode(stream)
+    max_err: Optional[float] = (
+        float(np.max(np.abs(restored.astype(np.float64) - arr))) if arr.size else 0.0
+    )
+    if not np.isfinite(max_err):
+        max_err = None  # NaN or inf in the block; JSON has no such numbers
+
+    return {
+        "source": source,
+        "codec": codec_name,
+        "codec_version": codec_version(codec_name),
+        "shape": list(block.shape),
+        "dtype": str(block.dtype),
+        "threads": threads,
+        "step": step,
+        "nbytes": nbytes,
+        "compressed_bytes": len(stream),
+        "compression_factor": nbytes / len(stream) if len(stream) else None,
+        "max_err": max_err,
+        "verify_ok": max_err is not None and max_err <= codec.error_bound() + 1e-12,
+        "encode": throughput(
+            nbytes, time_call(lambda: codec.encode(arr), warmup, repeats)
+        ),
+        "decode": throughput(
+            nbytes, time_call(lambda: codec.decode(stream), warmup, repeats)
+        ),
+    }
+
+
+def case_key(r: Dict[str, Any]) -> Tuple:
+    return (
+        r["source"],
+        r["codec"],
+        tuple(r["shape"]),
+        r["dtype"],
+        r["threads"],
+        r["step"],
+    )
+
+
+def compare_runs(old: Dict[str, Any], new: Dict[str, Any]) -> None:
+    """Print the median MB/s change of every case present in both runs."""
+    old_by_key = {case_key(r): r for r in old["results"]}
+    print(f"\nCompared with {old.get('created', '?')}:")
+    for r in new["results"]:
+        prev = old_by_key.get(case_key(r))
+        if prev is None:
+            continue
+        changes = []
+        for phase in ("encode", "decode"):
+            before = prev[phase]["mb_s_p50"]
+            after = r[phase]["mb_s_p50"]
+            pct = (after / before - 1) * 100 if before and after is not None else None
+            changes.append(
+                f"{phase} {fmt(before)} -> {fmt(after)} MB/s ({fmt(pct, '+.1f')}%)"
+            )
+        print(
+            f"  {r['source']} {r['codec']} {tuple(r['shape'])} {r['dtype']} "
+            f"t={r['threads']} step={r['step']}: " + ", ".join(changes)
+        )
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Encode/decode throughput benchmark of the DAS codecs"
+    )
+    ap.add_argument(
+        "--codecs",
+        nargs="+",
+        choices=codec_names(),
+        default=["daspack"],
+        help="Codecs to benchmark",
+    )
+    ap.add_argument(
+        "--input",
+        type=str,
+        default=None,
+        help="Directory of HDF5 files to benchmark on real data (optional)",
+    )
+    ap.add_argument(
+        "--limit",
+        type=int,
+        default=1,
+        help="Real files used per shape (0=all)",
+    )
+    ap.add_argument(
+        "--no-synthetic",
+        action="store_true",
+        help="Only benchmark real files from --input",
+    )
+    ap.add_argument(
+        "--shapes",
+        type=parse_shape,
+        nargs="+",
+        default=[(1000, 5000)],
+        help="Block shapes as ROWSxCOLS (time x channel)",
+    )
+    ap.add_argument(
+        "--dtypes",
+        nargs="+",
+        choices=DTYPES,
+        default=["float32"],
+        help="Block dtypes; integer blocks are quantized from the float data",
+    )
+    ap.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 4], help="Codec thread counts"
+    )
+    ap.add_argument(
+        "--steps",
+        type=float,
+        nargs="*",
+        default=[0.1, 0.5],
+        help="Uniform steps for float blocks with lossy codecs "
+        "(integer blocks and lossless codecs are run lossless)",
+    )
+    ap.add_argument("--warmup", type=int, default=1, help="Untimed runs per case")
+    ap.add_argument("--repeats", type=int, default=5, help="Timed runs per case")
+    ap.add_argument("--seed", type=int, default=0, help="Synthetic data seed")
+    ap.add_argument(
+        "--output",
+        type=str,
+        default=str(Path(__file__).resolve().parent / "artifacts" / "codec_bench.json"),
+        help="JSON results file",
+    )
+    ap.add_argument(
+        "--compare",
+        type=str,
+        default=None,
+        metavar="JSON",
+        help="Earlier results file to compare median throughput against",
+    )
+    args = ap.parse_args()
+
+    if args.no_synthetic and not args.input:
+        print("--no-synthetic needs --input", file=sys.stderr)
+        return 2
+    root = Path(args.input).resolve() if args.input else None
+    if root is not None and not root.exists():
+        print(f"Input path not found: {root}", file=sys.stderr)
+        return 2
+
+    def sources(shape: Tuple[int, int]) -> Iterator[Tuple[str, np.ndarray]]:
+        if not args.no_synthetic:
+            yield "synthetic", synthetic_das(shape, seed=args.seed)
+        if root is not None:
+            yield from real_blocks(root, shape, args.limit)
+
+    results: List[Dict[str, Any]] = []
+    for shape in args.shapes:
+        for source, base in sources(shape):
+            for dtype in args.dtypes:
+                block = as_dtype(base, dtype)
+                for codec_name in args.codecs:
+                    steps: List[Optional[float]] = [None]
+                    if codec_is_lossy(codec_name) and not np.issubdtype(
+                        block.dtype, np.integer
+                    ):
+                        steps = list(args.steps) or [None]
+                    for threads in args.threads:
+                        for step in steps:
+                            try:
+                                r = bench_block(
+                                    source,
+                                    block,
+                                    codec_name,
+                                    threads,
+                                    step,
+                                    args.warmup,
+                                    args.repeats,
+                                )
+                            except Exception as e:
+                                print(
+                                    f"⚠️  {source} {codec_name} {dtype} {shape} "
+                                    f"t={threads} step={step}: {e}",
+                                    file=sys.stderr,
+                                )
+                                continue
+                            results.append(r)
+                            print(
+                                f"{source} {codec_name} {shape} {dtype} "
+                                f"t={threads} step={step}: "
+                                f"cf={fmt(r['compression_factor'], '.3f')} "
+                                f"enc={fmt(r['encode']['mb_s_p50'])} MB/s "
+                                f"dec={fmt(r['decode']['mb_s_p50'])} MB/s"
+                                + ("" if r["verify_ok"] else " VERIFY FAILED")
+                            )
+                del block
+
+    run = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": available_cpus(),
+        },
+        "codec_versions": {name: codec_version(name) for name in args.codecs},
+        "config": {
+            "shapes": [list(s) for s in args.shapes],
+            "dtypes": args.dtypes,
+            "threads": args.threads,
+            "steps": args.steps,
+            "warmup": args.warmup,
+            "repeats": args.repeats,
+            "seed": args.seed,
+            "input": str(root) if root is not None else None,
+        },
+        "results": results,
+    }
+    out_path = Path(args.output)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w") as f:
+        json.dump(run, f, indent=2, allow_nan=False)
+    print(f"Done. Benchmark results: {out_path}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            compare_runs(json.load(f), run)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
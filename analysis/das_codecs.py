@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Codec registry for das24_analyze_compress.py
+
+Every codec exposes the same small interface so the compression pipeline can
+run daspack and cheap baselines on the same files:
+
+    codec = make_codec("blosc-zstd", step=None, threads=4)
+    arr = codec.prepare(block)      # dtype/layout the codec encodes directly
+    stream = codec.encode(arr)
+    restored = codec.decode(stream)
+    restored = decode_stream(codec, stream)   # also block-framed streams
+    codec.params()                  # name, step and codec settings
+    codec.error_bound()             # max |restored - arr| allowed by design
+
+Codecs with ``lossy = True`` take a uniform quantization step (``step=None``
+means lossless); the others are lossless only.
+
+Registered codecs:
+- daspack: DASCoder with Quantizer.Lossless / Quantizer.Uniform (Rust module)
+- blosc-zstd, blosc-lz4: Blosc2 with byte shuffle; the ``-bitshuffle``
+  variants use bit shuffle instead
+- hdf5-gzip: an in-memory HDF5 file with a shuffled, gzip-compressed dataset
+- quant-delta-zstd: NumPy round(x / step), delta along rows, then zstd
+
+Optional dependencies (daspack, blosc2, zstandard) are imported on first use
+and raise a RuntimeError with install hints when missing, so the pipeline
+runs with whichever codecs are installed.
+"""
+
+import abc
+import io
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import h5py
+import numpy as np
+
+
+def ensure_daspack() -> Tuple[Any, Any]:
+    try:
+        from daspack import DASCoder, Quantizer
+
+        return DASCoder, Quantizer
+    except Exception as e:
+        raise RuntimeError(
+            "daspack is not installed. Build it with 'maturin develop --release' in the daspack/ directory, "
+            "or install via 'pip install daspack-dev'. Original error: %s" % (e,)
+        )
+
+
+def ensure_blosc2() -> Any:
+    try:
+        import blosc2
+
+        return blosc2
+    except Exception as e:
+        raise RuntimeError(
+            "blosc2 is not installed. Install it with 'pip install blosc2'. "
+            "Original error: %s" % (e,)
+        )
+
+
+def ensure_zstandard() -> Any:
+    try:
+        import zstandard
+
+        return zstandard
+    except Exception as e:
+        raise RuntimeError(
+            "zstandard is not installed. Install it with 'pip install zstandard'. "
+            "Original error: %s" % (e,)
+        )
+
+
+def encode_one(coder, quantizer, arr: np.ndarray) -> bytes:
+    return coder.encode(arr, quantizer)
+
+
+# (dtype, quantizer kind) -> whether DASCoder.encode takes that dtype as-is
+_CODER_NATIVE_DTYPES: Dict[Tuple[str, str], bool] = {}
+# Elements converted per slice by coder_input, bounding the temporaries of
+# reading a memory-mapped or non-contiguous source
+CONVERSION_BLOCK_ELEMS = 1 << 22
+
+
+def coder_accepts(coder, quantizer, dtype: np.dtype) -> bool:
+    """Probe once per dtype whether the coder encodes it without conversion."""
+    key = (np.dtype(dtype).str, type(quantizer).__name__)
+    if key not in _CODER_NATIVE_DTYPES:
+        try:
+            coder.encode(np.zeros((2, 2), dtype=dtype), quantizer)
+            _CODER_NATIVE_DTYPES[key] = True
+        except (TypeError, ValueError):
+            _CODER_NATIVE_DTYPES[key] = False
+    return _CODER_NATIVE_DTYPES[key]
+
+
+def coder_input(
+    coder, quantizer, data: np.ndarray, fallback_dtype: np.dtype
+) -> np.ndarray:
+    """Return ``data`` as a C-contiguous array the coder accepts.
+
+    Native dtypes are passed through without a copy when the coder takes them.
+    Otherwise the data is converted to ``fallback_dtype`` into a new array
+    owned by the caller, ``CONVERSION_BLOCK_ELEMS`` at a time along the rows.
+    """
+    if coder_accepts(coder, quantizer, data.dtype):
+        return np.ascontiguousarray(data)
+    out = np.empty(data.shape, dtype=fallback_dtype)
+    if data.ndim == 0:
+        np.copyto(out, data, casting="unsafe")
+        return out
+    row_elems = max(1, int(np.prod(data.shape[1:], dtype=np.int64)))
+    rows = max(1, CONVERSION_BLOCK_ELEMS // row_elems)
+    for r in range(0, data.shape[0], rows):
+        np.copyto(out[r : r + rows], data[r : r + rows], casting="unsafe")
+    return out
+
+
+# Array header for the baseline codecs: dtype string, ndim, shape
+def _pack_array_header(dtype: np.dtype, shape: Tuple[int, ...]) -> bytes:
+    dtype_str = np.dtype(dtype).str.encode("ascii")
+    return (
+        struct.pack("<B", len(dtype_str))
+        + dtype_str
+        + struct.pack(f"<B{len(shape)}Q", len(shape), *shape)
+    )
+
+
+def _unpack_array_header(stream: bytes) -> Tuple[np.dtype, Tuple[int, ...], int]:
+    (n,) = struct.unpack_from("<B", stream, 0)
+    dtype = np.dtype(bytes(stream[1 : 1 + n]).decode("ascii"))
+    pos = 1 + n
+    (ndim,) = struct.unpack_from("<B", stream, pos)
+    shape = struct.unpack_from(f"<{ndim}Q", stream, pos + 1)
+    return dtype, tuple(shape), pos + 1 + 8 * ndim
+
+
+class Codec(abc.ABC):
+    """Common interface; subclasses set ``name`` and implement encode/decode."""
+
+    name = ""
+    lossy = False
+    suffix = ".bin"
+
+    def __init__(self, step: Optional[float] = None, threads: int = 1):
+        if step is not None and not self.lossy:
+            raise ValueError(f"{self.name} is lossless and takes no quantization step")
+        self.step = None if step is None else float(step)
+        self.threads = max(1, threads)
+
+    @staticmethod
+    def version() -> str:
+        return "unknown"
+
+    def params(self) -> Dict[str, Any]:
+        return {"codec": self.name, "step": self.step}
+
+    def error_bound(self) -> float:
+        return 0.0 if self.step is None else self.step / 2
+
+    def prepare(self, data: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(data)
+
+    @abc.abstractmethod
+    def encode(self, arr: np.ndarray) -> bytes: ...
+
+    @abc.abstractmethod
+    def decode(self, stream: bytes) -> np.ndarray: ...
+
+
+class DaspackCodec(Codec):
+    name = "daspack"
+    lossy = True
+    suffix = ".dasp"
+
+    def __init__(self, step: Optional[float] = None, threads: int = 1):
+        super().__init__(step, threads)
+        DASCoder, Quantizer = ensure_daspack()
+        self.coder = DASCoder(threads=self.threads)
+        self.quantizer = (
+            Quantizer.Lossless() if self.step is None else Quantizer.Uniform(step=self.step)
+        )
+
+    @staticmethod
+    def version() -> str:
+        try:
+            from importlib.metadata import version
+
+            return version("daspack")
+        except Exception:
+            pass
+        try:
+            import daspack
+
+            return str(getattr(daspack, "__version__", "unknown"))
+        except Exception:
+            return "unavailable"
+
+    def prepare(self, data: np.ndarray) -> np.ndarray:
+        fallback = np.int32 if self.step is None else np.float64
+        return coder_input(self.coder, self.quantizer, data, fallback)
+
+    def encode(self, arr: np.ndarray) -> bytes:
+        return encode_one(self.coder, self.quantizer, self.prepare(arr))
+
+    def decode(self, stream: bytes) -> np.ndarray:
+        return self.coder.decode(stream)
+
+
+class BloscCodec(Codec):
+    """Blosc2 with byte or bit shuffle (lossless)."""
+
+    suffix = ".blosc"
+
+    def __init__(
+        self,
+        step: Optional[float] = None,
+        threads: int = 1,
+        cname: str = "zstd",
+        shuffle: str = "byte",
+        clevel: int = 5,
+    ):
+        self.name = f"blosc-{cname}" + ("-bitshuffle" if shuffle == "bit" else "")
+        super().__init__(step, threads)
+        self.blosc2 = ensure_blosc2()
+        self.cname = cname
+        self.shuffle = shuffle
+        self.clevel = clevel
+
+    @staticmethod
+    def version() -> str:
+        try:
+            return ensure_blosc2().__version__
+        except RuntimeError:
+            return "unavailable"
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            **super().params(),
+            "cname": self.cname,
+            "shuffle": self.shuffle,
+            "clevel": self.clevel,
+        }
+
+    def encode(self, arr: np.ndarray) -> bytes:
+        blosc2 = self.blosc2
+        blosc2.set_nthreads(self.threads)
+        payload = blosc2.compress(
+            arr,
+            typesize=arr.dtype.itemsize,
+            clevel=self.clevel,
+            filter=(
+                blosc2.Filter.BITSHUFFLE
+                if self.shuffle == "bit"
+                else blosc2.Filter.SHUFFLE
+            ),
+            codec=blosc2.Codec.ZSTD if self.cname == "zstd" else blosc2.Codec.LZ4,
+        )
+        return _pack_array_header(arr.dtype, arr.shape) + payload
+
+    def decode(self, stream: bytes) -> np.ndarray:
+        dtype, shape, pos = _unpack_array_header(stream)
+        raw = self.blosc2.decompress(bytes(stream[pos:]))
+        return np.frombuffer(raw, dtype=dtype).reshape(shape)
+
+
+class Hdf5GzipCodec(Codec):
+    """An in-memory HDF5 file holding the array with shuffle + gzip."""
+
+    name = "hdf5-gzip"
+    suffix = ".h5"
+
+    def __init__(self, step: Optional[float] = None, threads: int = 1, level: int = 4):
+        super().__init__(step, threads)
+        self.level = level
+
+    @staticmethod
+    def version() -> str:
+        return f"h5py {h5py.__version__} / HDF5 {h5py.version.hdf5_version}"
+
+    def params(self) -> Dict[str, Any]:
+        return {**super().params(), "level": self.level, "shuffle": True}
+
+    def encode(self, arr: np.ndarray) -> bytes:
+        bio = io.BytesIO()
+        with h5py.File(bio, "w") as f:
+            f.create_dataset(
+                "data",
+                data=arr,
+                chunks=True,
+                compression="gzip",
+                compression_opts=self.level,
+                shuffle=True,
+            )
+        return bio.getvalue()
+
+    def decode(self, stream: bytes) -> np.ndarray:
+        with h5py.File(io.BytesIO(bytes(stream)), "r") as f:
+            return f["data"][...]
+
+
+class QuantDeltaZstdCodec(Codec):
+    """round(x / step), delta along rows, zstd; lossless on integers with step=None."""
+
+    name = "quant-delta-zstd"
+    lossy = True
+    suffix = ".zst"
+
+    def __init__(self, step: Optional[float] = None, threads: int = 1, level: int = 3):
+        super().__init__(step, threads)
+        self.zstd = ensure_zstandard()
+        self.level = level
+
+    @staticmethod
+    def version() -> str:
+        try:
+            return ensure_zstandard().__version__
+        except RuntimeError:
+            return "unavailable"
+
+    def params(self) -> Dict[str, Any]:
+        return {**super().params(), "level": self.level}
+
+    def encode(self, arr: np.ndarray) -> bytes:
+        if self.step is None:
+            if not np.issubdtype(arr.dtype, np.integer):
+                raise TypeError("quant-delta-zstd needs a step for float data")
+            q = arr.astype(np.int64)
+        else:
+            q = np.rint(np.divide(arr, self.step, dtype=np.float64)).astype(np.int64)
+        delta = np.diff(q, axis=0, prepend=np.zeros((1,) + q.shape[1:], dtype=np.int64))
+        del q
+        # Store deltas in the narrowest integer type that holds them
+        lo, hi = (int(delta.min()), int(delta.max())) if delta.size else (0, 0)
+        for int_dtype in (np.int8, np.int16, np.int32, np.int64):
+            info = np.iinfo(int_dtype)
+            if info.min <= lo and hi <= info.max:
+                break
+        payload = self.zstd.ZstdCompressor(
+            level=self.level, threads=self.threads if self.threads > 1 else 0
+        ).compress(np.ascontiguousarray(delta, dtype=int_dtype).tobytes())
+        return (
+            _pack_array_header(arr.dtype, arr.shape)
+            + struct.pack("<d", self.step or 0.0)
+            + _pack_array_header(int_dtype, ())
+            + payload
+        )
+
+    def decode(self, stream: bytes) -> np.ndarray:
+        dtype, shape, pos = _unpack_array_header(stream)
+        (step,) = struct.unpack_from("<d", stream, pos)
+        int_dtype, _, n = _unpack_array_header(stream[pos + 8 :])
+        pos += 8 + n
+        raw = self.zstd.ZstdDecompressor().decompress(bytes(stream[pos:]))
+        q = np.cumsum(
+            np.frombuffer(raw, dtype=int_dtype).reshape(shape), axis=0, dtype=np.int64
+        )
+        if step == 0.0:
+            return q.astype(dtype)
+        return q * step
+
+
+# Framed multi-block stream written by --stream: magic, ndim, shape, block
+# count, then per block (first_row, payload_nbytes), followed by the
+# concatenated codec payloads. Each payload is a plain stream of the codec.
+BLOCK_FRAME_MAGIC = b"DASPBLK1"
+
+
+def frame_blocks(
+    streams: List[bytes], row_starts: List[int], shape: Tuple[int, ...]
+) -> bytes:
+    header = [BLOCK_FRAME_MAGIC, struct.pack("<I", len(shape))]
+    header.append(struct.pack(f"<{len(shape)}Q", *shape))
+    header.append(struct.pack("<I", len(streams)))
+    for row0, stream in zip(row_starts, streams):
+        header.append(struct.pack("<QQ", row0, len(stream)))
+    return b"".join(header + list(streams))
+
+
+def unframe_blocks(
+    framed: bytes,
+) -> Tuple[Tuple[int, ...], List[Tuple[int, memoryview]]]:
+    """Split a framed stream into its shape and (first_row, payload) blocks."""
+    if framed[: len(BLOCK_FRAME_MAGIC)] != BLOCK_FRAME_MAGIC:
+        raise ValueError("not a block-framed daspack stream")
+    pos = len(BLOCK_FRAME_MAGIC)
+    (ndim,) = struct.unpack_from("<I", framed, pos)
+    pos += 4
+    shape = struct.unpack_from(f"<{ndim}Q", framed, pos)
+    pos += 8 * ndim
+    (n_blocks,) = struct.unpack_from("<I", framed, pos)
+    pos += 4
+    index = [struct.unpack_from("<QQ", framed, pos + 16 * i) for i in range(n_blocks)]
+    pos += 16 * n_blocks
+    view = memoryview(framed)
+    blocks = []
+    for row0, nbytes in index:
+        blocks.append((row0, view[pos : pos + nbytes]))
+        pos += nbytes
+    return tuple(shape), blocks
+
+
+def decode_stream(codec: Codec, stream: bytes) -> np.ndarray:
+    """Decode a plain or block-framed stream back into one array."""
+    if stream[: len(BLOCK_FRAME_MAGIC)] != BLOCK_FRAME_MAGIC:
+        return codec.decode(stream)
+    _, blocks = unframe_blocks(stream)
+    return np.concatenate([codec.decode(bytes(p)) for _, p in blocks], axis=0)
+
+
+# name -> (codec class, fixed constructor options)
+CODECS: Dict[str, Tuple[type, Dict[str, Any]]] = {
+    "daspack": (DaspackCodec, {}),
+    "blosc-zstd": (BloscCodec, {"cname": "zstd", "shuffle": "byte"}),
+    "blosc-zstd-bitshuffle": (BloscCodec, {"cname": "zstd", "shuffle": "bit"}),
+    "blosc-lz4": (BloscCodec, {"cname": "lz4", "shuffle": "byte"}),
+    "blosc-lz4-bitshuffle": (BloscCodec, {"cname": "lz4", "shuffle": "bit"}),
+    "hdf5-gzip": (Hdf5GzipCodec, {}),
+    "quant-delta-zstd": (QuantDeltaZstdCodec, {}),
+}
+
+
+def codec_names() -> List[str]:
+    return list(CODECS)
+
+
+def codec_is_lossy(name: str) -> bool:
+    return CODECS[name][0].lossy
+
+
+def codec_suffix(name: str) -> str:
+    return CODECS[name][0].suffix
+
+
+def codec_version(name: str) -> str:
+    return CODECS[name][0].version()
+
+
+def make_codec(name: str, step: Optional[float] = None, threads: int = 1) -> Codec:
+    if name not in CODECS:
+        raise ValueError(f"unknown codec: {name} (choose from {', '.join(CODECS)})")
+    cls, options = CODECS[name]
+    return cls(step=step, threads=threads, **options)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Persistent result cache for das24_analyze_compress.py
+
+Stores the row dicts and per-dataset products (stats / histogram accumulator
+state) computed for each work item, keyed by:
+
+- the source file signature: resolved path, size and mtime, or a hash of
+  the whole file (``--cache-key content``)
+- the dataset name and the pipeline settings that change results (coder
+  version, sampling, verification and streaming options)
+- for rows, the quantizer mode and step
+
+Entries live in a SQLite database in WAL mode, so several worker processes
+can read and write the same cache concurrently and an interrupted run keeps
+everything committed so far.
+"""
+
+import hashlib
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+# Read size while hashing a file for --cache-key content
+CONTENT_HASH_CHUNK = 8 << 20
+
+
+def file_signature(path: Path, mode: str = "mtime") -> Dict[str, Any]:
+    """Identify the current content of ``path`` for cache lookups."""
+    st = path.stat()
+    sig: Dict[str, Any] = {"file": str(path.resolve()), "size": st.st_size}
+    if mode == "mtime":
+        sig["mtime_ns"] = st.st_mtime_ns
+    elif mode == "content":
+        # Every byte: an in-place rewrite of the data keeps size and layout,
+        # so no sample of the file is guaranteed to see it
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as fi:
+            for chunk in iter(lambda: fi.read(CONTENT_HASH_CHUNK), b""):
+                h.update(chunk)
+        sig["content"] = h.hexdigest()
+    else:
+        raise ValueError(f"unknown cache key mode: {mode}")
+    return sig
+
+
+class ResultCache:
+    """Key/value store of JSON payloads keyed by a dict of key parts."""
+
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                file TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_file ON results(file)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(parts: Dict[str, Any]) -> str:
+        blob = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, parts: Dict[str, Any]) -> Optional[Any]:
+        cur = self.conn.execute(
+            "SELECT payload FROM results WHERE key = ?", (self.make_key(parts),)
+        )
+        row = cur.fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, parts: Dict[str, Any], payload: Any) -> None:
+        self.conn.execute(
+            "INSERT OR REPLACE INTO results (key, kind, file, payload, created) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                self.make_key(parts),
+                str(parts.get("kind", "")),
+                str(parts.get("file", "")),
+                json.dumps(payload, default=str),
+                datetime.now().isoformat(),
+            ),
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# One connection per process; sqlite3 connections cannot be pickled to workers
+_OPEN_CACHES: Dict[str, ResultCache] = {}
+
+
+def open_result_cache(db_path: Path) -> ResultCache:
+    key = str(Path(db_path).resolve())
+    if key not in _OPEN_CACHES:
+        _OPEN_CACHES[key] = ResultCache(Path(db_path))
+    return _OPEN_CACHES[key]
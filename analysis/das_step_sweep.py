@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Quantizer step sweep for DAS24 HDF5 files
+
+Builds a rate-distortion table over many ``Quantizer.Uniform`` steps while
+reading each dataset only once: every row block is read (and converted for
+the coder) a single time, then encoded, decoded and measured at all steps
+concurrently in a thread pool with one DASCoder per thread.
+
+Output (under analysis/artifacts/):
+- rd_table.csv: one row per file, dataset and step with compressed bytes,
+  compression factor, max_err, RMSE and SNR
+- rd_summary.csv: the same metrics pooled over all files per dataset and step
+
+Coarse steps cannot be derived from a fine one here: DASCoder quantizes and
+entropy-codes internally, so each step is a full encode. What is shared is
+the read, the dtype conversion and the reference statistics used for SNR.
+Integer datasets are lossless-only and are skipped.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import h5py
+import numpy as np
+import pandas as pd
+
+from das24_analyze_compress import (
+    BLOCK_WORKSET_FACTOR,
+    available_cpus,
+    budget_threads,
+    discover_datasets,
+    error_metrics,
+    find_hdf5_files,
+    iter_row_blocks,
+    open_array,
+    stream_block_rows,
+)
+from das_codecs import coder_input, encode_one, ensure_daspack
+
+
+RD_COLUMNS = [
+    "file",
+    "dataset",
+    "step",
+    "orig_nbytes",
+    "compressed_bytes",
+    "compression_factor",
+    "max_err",
+    "rmse",
+    "snr_db",
+    "encode_seconds",
+    "decode_seconds",
+]
+
+
+def sweep_steps(lo: float, hi: float, n: int) -> List[float]:
+    """``n`` geometrically spaced steps from ``lo`` to ``hi``."""
+    return [float(s) for s in np.geomspace(lo, hi, n)]
+
+
+def rd_metrics(
+    orig_nbytes: int,
+    compressed_bytes: int,
+    max_err: float,
+    sse: float,
+    n: int,
+    signal_ss: float,
+) -> Dict[str, float]:
+    """Compression factor, RMSE and SNR (dB, against the mean-removed signal)."""
+    rmse = float(np.sqrt(sse / n)) if n else 0.0
+    if sse > 0:
+        snr_db = float(10 * np.log10(signal_ss / sse)) if signal_ss > 0 else -np.inf
+    else:
+        snr_db = np.inf
+    return {
+        "compressed_bytes": compressed_bytes,
+        "compression_factor": (
+            orig_nbytes / compressed_bytes if compressed_bytes > 0 else np.inf
+        ),
+        "max_err": max_err,
+        "rmse": rmse,
+        "snr_db": snr_db,
+    }
+
+
+class _CoderPool:
+    """One DASCoder per thread (coders are not shared across threads)."""
+
+    def __init__(self, coder_cls, threads: int):
+        self.coder_cls = coder_cls
+        self.threads = threads
+        self.local = threading.local()
+
+    def get(self):
+        coder = getattr(self.local, "coder", None)
+        if coder is None:
+            coder = self.local.coder = self.coder_cls(threads=self.threads)
+        return coder
+
+
+def sweep_dataset(
+    h5_path: Path,
+    dset_name: str,
+    steps: List[float],
+    threads: int,
+    step_workers: int,
+    mem_limit_bytes: int,
+    use_mmap: bool = True,
+) -> List[Dict[str, Any]]:
+    """Rate-distortion rows for every step, from a single read of the dataset.
+
+    ``threads`` is per coder; each of the ``step_workers`` threads has its
+    own coder, so callers budget ``threads`` over all of them.
+    """
+    DASCoder, Quantizer = ensure_daspack()
+    coders = _CoderPool(DASCoder, threads)
+    main_coder = coders.get()
+
+    totals = {
+        step: {"bytes": 0, "max_err": 0.0, "sse": 0.0, "enc_s": 0.0, "dec_s": 0.0}
+        for step in steps
+    }
+    n = 0
+    total = 0.0
+    total_sq = 0.0
+
+    def run_step(step: float, arr: np.ndarray) -> Tuple[float, Dict[str, float]]:
+        coder = coders.get()
+        t0 = time.perf_counter()
+        stream = encode_one(coder, Quantizer.Uniform(step=step), arr)
+        t1 = time.perf_counter()
+        restored = coder.decode(stream)
+        t2 = time.perf_counter()
+        max_err, sse = error_metrics(restored, arr)
+        return step, {
+            "bytes": len(stream),
+            "max_err": max_err,
+            "sse": sse,
+            "enc_s": t1 - t0,
+            "dec_s": t2 - t1,
+        }
+
+    with h5py.File(h5_path, "r") as f:
+        dset = f[dset_name]
+        shape = tuple(dset.shape)
+        orig_nbytes = int(np.prod(shape, dtype=np.int64)) * dset.dtype.itemsize
+        block_rows = None
+        if mem_limit_bytes > 0:
+            # Each concurrent step holds its own decoded copy of the block
+            per_block = mem_limit_bytes * BLOCK_WORKSET_FACTOR // (
+                BLOCK_WORKSET_FACTOR + 2 * step_workers
+            )
+            block_rows = stream_block_rows(dset, per_block)
+
+        with ThreadPoolExecutor(max_workers=step_workers) as pool:
+            source = open_array(h5_path, dset, use_mmap)
+            for _, data in iter_row_blocks(source, block_rows):
+                arr = coder_input(
+                    main_coder, Quantizer.Uniform(step=1.0), data, np.float64
+                )
+                del data
+                # Reference statistics are shared by every step
+                n += arr.size
+                total += float(arr.sum(dtype=np.float64))
+                total_sq += float(np.square(arr, dtype=np.float64).sum())
+
+                for step, res in pool.map(partial(run_step, arr=arr), steps):
+                    acc = totals[step]
+                    acc["bytes"] += res["bytes"]
+                    acc["max_err"] = max(acc["max_err"], res["max_err"])
+                    acc["sse"] += res["sse"]
+                    acc["enc_s"] += res["enc_s"]
+                    acc["dec_s"] += res["dec_s"]
+                del arr
+
+    signal_ss = max(0.0, total_sq - total * total / n) if n else 0.0
+    rows = []
+    for step in steps:
+        acc = totals[step]
+        rows.append(
+            {
+                "file": str(h5_path),
+                "dataset": dset_name,
+                "step": step,
+                "orig_nbytes": orig_nbytes,
+                **rd_metrics(
+                    orig_nbytes, acc["bytes"], acc["max_err"], acc["sse"], n, signal_ss
+                ),
+                "encode_seconds": acc["enc_s"],
+                "decode_seconds": acc["dec_s"],
+                # Kept for pooling across files in rd_summary.csv
+                "_n": n,
+                "_sse": acc["sse"],
+                "_signal_ss": signal_ss,
+            }
+        )
+    return rows
+
+
+def sweep_file(h5_path: Path, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Sweep every float 2D dataset of one file (integer datasets are skipped)."""
+    dsets = discover_datasets(h5_path)
+    if dsets is None:
+        return []
+    rows: List[Dict[str, Any]] = []
+    for dset_name in dsets:
+        with h5py.File(h5_path, "r") as f:
+            if np.issubdtype(f[dset_name].dtype, np.integer):
+                continue
+        try:
+            rows.extend(sweep_dataset(h5_path, dset_name, **kwargs))
+        except Exception as e:
+            print(
+                f"\n⚠️  Error sweeping {h5_path.name}:{dset_name}: {e}",
+                file=sys.stderr,
+            )
+    return rows
+
+
+def summarize(df: pd.DataFrame) -> pd.DataFrame:
+    """Pool rd_table rows over files: one row per dataset and step."""
+    out = []
+    for (dset_name, step), g in df.groupby(["dataset", "step"], sort=True):
+        orig = int(g["orig_nbytes"].sum())
+        metrics = rd_metrics(
+            orig,
+            int(g["compressed_bytes"].sum()),
+            float(g["max_err"].max()),
+            float(g["_sse"].sum()),
+            int(g["_n"].sum()),
+            float(g["_signal_ss"].sum()),
+        )
+        out.append(
+            {
+                "dataset": dset_name,
+                "step": step,
+                "files": len(g),
+                "orig_nbytes": orig,
+                **metrics,
+                "encode_seconds": float(g["encode_seconds"].sum()),
+                "decode_seconds": float(g["decode_seconds"].sum()),
+            }
+        )
+    return pd.DataFrame(out)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(
+        description="Rate-distortion sweep of daspack uniform quantizer steps"
+    )
+    ap.add_argument(
+        "--input",
+        type=str,
+        default="das24_data",
+        help="Input directory to scan for HDF5 files",
+    )
+    ap.add_argument(
+        "--steps",
+        type=float,
+        nargs="*",
+        default=None,
+        help="Explicit quantization steps (overrides --step-range)",
+    )
+    ap.add_argument(
+        "--step-range",
+        type=float,
+        nargs=3,
+        default=[0.01, 4.0, 30],
+        metavar=("MIN", "MAX", "N"),
+        help="N geometrically spaced steps from MIN to MAX",
+    )
+    ap.add_argument("--threads", type=int, default=4, help="Threads for DASCoder")
+    ap.add_argument(
+        "--step-workers",
+        type=int,
+        default=4,
+        help="Steps encoded concurrently on each block (threads, one coder each)",
+    )
+    ap.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Worker processes to spread files across (1=serial)",
+    )
+    ap.add_argument(
+        "--mem-limit-mb",
+        type=float,
+        default=512,
+        help="Per-file working-set ceiling for block sizing (MB, 0=whole dataset)",
+    )
+    ap.add_argument(
+        "--no-mmap",
+        action="store_true",
+        help="Read datasets through h5py instead of memory-mapping contiguous ones",
+    )
+    ap.add_argument(
+        "--limit",
+        type=int,
+        default=0,
+        help="Optional cap on number of files processed (0=no cap)",
+    )
+    args = ap.parse_args()
+
+    if args.steps:
+        steps = sorted(float(s) for s in args.steps)
+    else:
+        lo, hi, count = args.step_range
+        steps = sweep_steps(lo, hi, int(count))
+
+    root = Path(args.input).resolve()
+    if not root.exists():
+        print(f"Input path not found: {root}", file=sys.stderr)
+        return 2
+    files = sorted(find_hdf5_files(root))
+    if args.limit and args.limit > 0:
+        files = files[: args.limit]
+    if not files:
+        print(f"No HDF5 files found under {root}", file=sys.stderr)
+        return 3
+
+    workers = max(1, min(args.workers, available_cpus(), len(files)))
+    step_workers = max(1, min(args.step_workers, len(steps)))
+    sweep_kwargs = {
+        "steps": steps,
+        # Budgeted once over every coder running at the same time
+        "threads": budget_threads(workers * step_workers, args.threads),
+        "step_workers": step_workers,
+        "mem_limit_bytes": int(args.mem_limit_mb * 2**20),
+        "use_mmap": not args.no_mmap,
+    }
+    print(
+        f"Sweeping {len(steps)} steps ({steps[0]:.4g}..{steps[-1]:.4g}) over "
+        f"{len(files)} file(s), {workers} worker(s) x {step_workers} step thread(s)"
+    )
+
+    rows: List[Dict[str, Any]] = []
+    if workers == 1:
+        for h5_path in files:
+            print(f"  {h5_path.name}")
+            rows.extend(sweep_file(h5_path, **sweep_kwargs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for h5_path, file_rows in zip(
+                files, pool.map(partial(sweep_file, **sweep_kwargs), files)
+            ):
+                print(f"  {h5_path.name}")
+                rows.extend(file_rows)
+
+    if not rows:
+        print("No float datasets swept", file=sys.stderr)
+        return 1
+
+    artifacts_dir = Path(__file__).resolve().parent / "artifacts"
+    artifacts_dir.mkdir(parents=True, exist_ok=True)
+    rd_csv = artifacts_dir / "rd_table.csv"
+    rd_summary_csv = artifacts_dir / "rd_summary.csv"
+
+    df = pd.DataFrame(rows)
+    summary = summarize(df)
+    df.sort_values(["file", "dataset", "step"])[RD_COLUMNS].to_csv(rd_csv, index=False)
+    summary.to_csv(rd_summary_csv, index=False)
+
+    with pd.option_context("display.width", 120, "display.max_rows", 200):
+        print(
+            summary[
+                ["dataset", "step", "compression_factor", "max_err", "rmse", "snr_db"]
+            ].to_string(index=False, float_format=lambda v: f"{v:.4g}")
+        )
+    print(f"Done. RD table: {rd_csv}")
+    print(f"RD summary: {rd_summary_csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
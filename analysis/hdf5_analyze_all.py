@@ -2,7 +2,10 @@
 """
 HDF5 Complete Analysis Pipeline
 
-Combines scanning and visualization in one convenient script.
+Combines scanning and visualization in one convenient script. With --full the
+scan is fused with das24_analyze_compress.py: each file is opened once for
+its metadata-index entry, dataset discovery, stats, histograms and
+compressed streams.
 """
 
 import argparse
@@ -10,6 +13,7 @@ import sys
 from pathlib import Path
 
 # Import our modules
+from das24_analyze_compress import main as compress_main
 from hdf5_metadata_scanner import HDF5MetadataScanner
 from hdf5_metadata_visualizer import HDF5MetadataVisualizer
 
@@ -28,6 +32,10 @@ Examples:
 
   # Only visualize existing metadata (skip scanning)
   python hdf5_analyze_all.py --visualize-only --metadata-file artifacts/hdf5_metadata_index.json
+
+  # Scan and compress in one pass over the files; unknown options go to
+  # das24_analyze_compress.py
+  python hdf5_analyze_all.py das24_data/20240506/dphi --full --workers 8 --uniform-steps 0.5
         """,
     )
     parser.add_argument(
@@ -54,6 +62,25 @@ Examples:
         default=[".h5", ".hdf5"],
         help="File extensions to scan (default: .h5 .hdf5)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to open files while scanning and to render "
+        "figures (default: 1)",
+    )
+    parser.add_argument(
+        "--skip-unchanged-figures",
+        action="store_true",
+        help="Skip re-rendering figures whose input data did not change",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Scan and run das24_analyze_compress.py in one pass, opening each "
+        "file once; options not listed here are passed on to it "
+        "(--extensions and --shm-readers do not apply)",
+    )
     parser.add_argument(
         "--scan-only", action="store_true", help="Only scan files, skip visualization"
     )
@@ -63,11 +90,18 @@ Examples:
         help="Only generate visualizations from existing metadata",
     )
 
-    args = parser.parse_args()
+    args, compress_args = parser.parse_known_args()
 
     # Validate arguments
     if not args.visualize_only and not args.input:
         parser.error("input directory is required unless --visualize-only is specified")
+    if compress_args and not args.full:
+        parser.error(f"unrecognized arguments: {' '.join(compress_args)}")
+    if args.full and args.visualize_only:
+        parser.error("--full and --visualize-only are mutually exclusive")
+    if args.full and any(a.split("=", 1)[0] == "--shm-readers" for a in compress_args):
+        # Reader processes would open every file a second time
+        parser.error("--shm-readers does not apply to --full")
 
     metadata_file = Path(args.metadata_file)
 
@@ -86,18 +120,42 @@ Examples:
             print(f"Error: Not a directory: {input_dir}", file=sys.stderr)
             return 1
 
-        # Create scanner and scan
-        scanner = HDF5MetadataScanner(metadata_file)
-        extensions = set(args.extensions)
-        scanned_count = scanner.scan_directory(
-            input_dir, force=args.force, extensions=extensions
-        )
-        scanner.save_metadata()
-
-        print(f"\n✅ Scan complete!")
-        print(f"   Files scanned: {scanned_count}")
-        print(f"   Total files in index: {len(scanner.metadata['files'])}")
-        print(f"   Metadata file: {metadata_file}")
+        if args.full:
+            # One open per file: the compressor reads each new or changed
+            # file's index entry from the handle it uses for the data.
+            # Prefetching would reopen files on its own thread, so it is off
+            # unless asked for.
+            status = compress_main(
+                [
+                    "--input",
+                    str(input_dir),
+                    "--metadata-file",
+                    str(metadata_file),
+                    "--workers",
+                    str(args.workers),
+                    "--prefetch-depth",
+                    "0",
+                ]
+                + (["--rescan-metadata"] if args.force else [])
+                + compress_args
+            )
+            if status != 0:
+                return status
+            print(f"\n✅ Scan and compression complete!")
+            print(f"   Metadata file: {metadata_file}")
+        else:
+            # Create scanner and scan
+            scanner = HDF5MetadataScanner(metadata_file)
+            extensions = set(args.extensions)
+            scanned_count = scanner.scan_directory(
+                input_dir, force=args.force, extensions=extensions, workers=args.workers
+            )
+            scanner.save_metadata()
+
+            print(f"\n✅ Scan complete!")
+            print(f"   Files scanned: {scanned_count}")
+            print(f"   Total files in index: {len(scanner.metadata['files'])}")
+            print(f"   Metadata file: {metadata_file}")
 
     # Step 2: Visualize (unless scan-only)
     if not args.scan_only:
@@ -110,7 +168,11 @@ Examples:
             print("Run with a directory argument first to scan files", file=sys.stderr)
             return 1
 
-        visualizer = HDF5MetadataVisualizer(metadata_file)
+        visualizer = HDF5MetadataVisualizer(
+            metadata_file,
+            render_workers=args.workers,
+            skip_unchanged_figures=args.skip_unchanged_figures,
+        )
         visualizer.generate_all_visualizations()
 
         print(f"\n✅ Visualizations complete!")
@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+"""
+Schema-deduplicated HDF5 metadata index
+
+Consecutive DAS files share the same tree of groups and datasets, so the
+index stores each distinct schema once and every file only keeps a reference
+to its schema plus the attribute values that differ from it:
+
+{
+  "version": "2.0",
+  "schemas": {
+    "<schema hash>": {"structure": {...}, "root_attributes": {...}}
+  },
+  "files": {
+    "/path/to/file.h5": {
+      "file_path": ..., "file_size": ..., "modified_time": ..., ...,
+      "schema": "<schema hash>",
+      "attribute_overrides": {"Acquisition/Raw[0]": {"startTime": ...}},
+      "root_attribute_overrides": {...}
+    }
+  }
+}
+
+The schema hash covers everything except attribute values: node names and
+types, dataset shapes/dtypes/chunking/compression and attribute names. The
+first file seen with a given schema provides its base attribute values.
+
+Readers should go through ``iter_files`` / ``expand_file_entry``, which
+rebuild the full per-file ``structure`` and ``root_attributes`` one file at a
+time (sharing unchanged subtrees with the schema), so version 1.0 consumers
+keep working without holding every tree in memory. Version 1.0 indexes are
+migrated on load.
+
+Storage backends
+----------------
+The index can live in a single JSON file (rewritten on every save) or in a
+SQLite database in WAL mode, chosen by the metadata file suffix (.sqlite,
+.sqlite3 or .db). The SQLite store upserts one file's rows as soon as it is
+scanned and keeps queryable tables:
+
+- files(file_path, file_name, file_size, modified_time, modified_ns,
+  scanned_time, schema)
+- schemas(hash, structure, root_attributes)
+- nodes(schema, path, type, shape, dtype, size, chunks, compression)
+- schema_attributes(schema, path, name, value): base attribute values,
+  path "" holds root attributes
+- file_attributes(file_path, path, name, value): per-file overrides
+
+so questions like "which files changed Acquisition.rate" or "sizes of
+dataset X over time" are answered with indexed SQL instead of parsing the
+whole index. Run this module as a script for those queries and to convert
+between backends.
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+INDEX_VERSION = "2.0"
+
+# Per-file keys that are expanded from the schema rather than stored
+EXPANDED_KEYS = ("structure", "root_attributes")
+
+
+def _skeleton(structure: Dict[str, Any]) -> Dict[str, Any]:
+    """Structure with attribute values dropped (attribute names are kept)."""
+    out = {}
+    for name, item in structure.items():
+        node = {k: v for k, v in item.items() if k not in ("attributes", "children")}
+        if "attributes" in item:
+            node["attributes"] = sorted(item["attributes"])
+        if "children" in item:
+            node["children"] = _skeleton(item["children"])
+        out[name] = node
+    return out
+
+
+def schema_hash(structure: Dict[str, Any], root_attributes: Dict[str, Any]) -> str:
+    blob = json.dumps(
+        {"structure": _skeleton(structure), "root": sorted(root_attributes)},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+
+def _attribute_overrides(
+    base: Dict[str, Any], structure: Dict[str, Any], out: Dict[str, Dict[str, Any]]
+) -> Dict[str, Dict[str, Any]]:
+    """Collect {node path: {attr: value}} where structure differs from base."""
+    for name, item in structure.items():
+        base_item = base[name]
+        attrs = item.get("attributes", {})
+        base_attrs = base_item.get("attributes", {})
+        changed = {k: v for k, v in attrs.items() if base_attrs.get(k) != v}
+        if changed:
+            out[item.get("path", name)] = changed
+        if "children" in item:
+            _attribute_overrides(base_item["children"], item["children"], out)
+    return out
+
+
+def _apply_overrides(
+    structure: Dict[str, Any],
+    overrides: Dict[str, Dict[str, Any]],
+    prefix: str = "",
+) -> Dict[str, Any]:
+    """Copy-on-write application of attribute overrides to a schema tree."""
+    if not overrides:
+        return structure
+    out = dict(structure)
+    for name, item in structure.items():
+        path = f"{prefix}/{name}" if prefix else name
+        own = overrides.get(path)
+        below = {
+            k: v for k, v in overrides.items() if k.startswith(path + "/")
+        }
+        if own is None and not below:
+            continue
+        item = dict(item)
+        if own is not None:
+            item["attributes"] = {**item.get("attributes", {}), **own}
+        if below and "children" in item:
+            item["children"] = _apply_overrides(item["children"], below, path)
+        out[name] = item
+    return out
+
+
+def new_index(created: str) -> Dict[str, Any]:
+    return {
+        "version": INDEX_VERSION,
+        "created": created,
+        "last_updated": created,
+        "schemas": {},  # schema hash -> base structure and root attributes
+        "files": {},  # file_path -> compact metadata
+        "scanned_directories": [],  # list of scanned directories
+    }
+
+
+def add_file_entry(index: Dict[str, Any], file_metadata: Dict[str, Any]) -> str:
+    """Store a full (version 1.0 style) file entry in compact form."""
+    structure = file_metadata.get("structure", {})
+    root_attrs = file_metadata.get("root_attributes", {})
+    key = schema_hash(structure, root_attrs)
+    schema = index["schemas"].get(key)
+    if schema is None:
+        schema = {"structure": structure, "root_attributes": root_attrs}
+        index["schemas"][key] = schema
+
+    entry = {k: v for k, v in file_metadata.items() if k not in EXPANDED_KEYS}
+    entry["schema"] = key
+    entry["attribute_overrides"] = _attribute_overrides(
+        schema["structure"], structure, {}
+    )
+    entry["root_attribute_overrides"] = {
+        k: v for k, v in root_attrs.items() if schema["root_attributes"].get(k) != v
+    }
+    index["files"][file_metadata["file_path"]] = entry
+    return key
+
+
+def expand_file_entry(index: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the full file entry (with structure and root_attributes)."""
+    if "schema" not in entry:
+        return entry
+    schema = index["schemas"][entry["schema"]]
+    full = {
+        k: v
+        for k, v in entry.items()
+        if k not in ("schema", "attribute_overrides", "root_attribute_overrides")
+    }
+    full["root_attributes"] = {
+        **schema["root_attributes"],
+        **entry.get("root_attribute_overrides", {}),
+    }
+    full["structure"] = _apply_overrides(
+        schema["structure"], entry.get("attribute_overrides", {})
+    )
+    return full
+
+
+def iter_files(index: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Yield (file_path, full file entry), expanding one file at a time."""
+    for file_path, entry in index["files"].items():
+        yield file_path, expand_file_entry(index, entry)
+
+
+def get_file(index: Dict[str, Any], file_path: str) -> Optional[Dict[str, Any]]:
+    entry = index["files"].get(file_path)
+    return None if entry is None else expand_file_entry(index, entry)
+
+
+def prune_schemas(index: Dict[str, Any]) -> int:
+    """Drop schemas no file refers to; returns the number removed."""
+    used = {entry["schema"] for entry in index["files"].values()}
+    unused = [key for key in index["schemas"] if key not in used]
+    for key in unused:
+        del index["schemas"][key]
+    return len(unused)
+
+
+def migrate_index(index: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a version 1.0 index (full tree per file) to the compact form."""
+    if index.get("version") == INDEX_VERSION:
+        return index
+    migrated = new_index(index.get("created", ""))
+    migrated["last_updated"] = index.get("last_updated", migrated["created"])
+    migrated["scanned_directories"] = list(index.get("scanned_directories", []))
+    for file_path, file_meta in index.get("files", {}).items():
+        add_file_entry(migrated, {"file_path": file_path, **file_meta})
+    return migrated
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class JsonMetadataStore:
+    """Whole index in one JSON file, rewritten on save."""
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> Dict[str, Any]:
+        with open(self.path, "r") as f:
+            return migrate_index(json.load(f))
+
+    def save(self, index: Dict[str, Any]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(index, f, indent=2)
+
+    def upsert_file(self, index: Dict[str, Any], file_path: str) -> None:
+        """Nothing to do until save(); kept for interface parity."""
+
+    def delete_file(self, file_path: str) -> None:
+        """Nothing to do until save(); kept for interface parity."""
+
+    def attribute_history(
+        self, index: Dict[str, Any], node_path: str, attr_name: str
+    ) -> List[Tuple[str, Any]]:
+        history = []
+        for file_path, file_meta in iter_files(index):
+            if node_path == "":
+                attrs = file_meta.get("root_attributes", {})
+            else:
+                node = _find_node(file_meta.get("structure", {}), node_path)
+                attrs = node.get("attributes", {}) if node else {}
+            if attr_name in attrs:
+                history.append((file_path, attrs[attr_name]))
+        return history
+
+    def dataset_history(
+        self, index: Dict[str, Any], dataset_path: str
+    ) -> List[Dict[str, Any]]:
+        out = []
+        for file_path, entry in index["files"].items():
+            structure = index["schemas"][entry["schema"]]["structure"]
+            node = _find_node(structure, dataset_path)
+            if node is not None and node.get("type") == "dataset":
+                out.append(
+                    {
+                        "file_path": file_path,
+                        "modified_time": entry.get("modified_time"),
+                        "shape": node.get("shape"),
+                        "dtype": node.get("dtype"),
+                        "size": node.get("size"),
+                    }
+                )
+        return out
+
+
+def _find_node(structure: Dict[str, Any], node_path: str) -> Optional[Dict[str, Any]]:
+    node: Optional[Dict[str, Any]] = None
+    children = structure
+    for part in node_path.split("/"):
+        node = children.get(part)
+        if node is None:
+            return None
+        children = node.get("children", {})
+    return node
+
+
+def _iter_nodes(
+    structure: Dict[str, Any], prefix: str = ""
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for name, item in structure.items():
+        path = f"{prefix}/{name}" if prefix else name
+        yield path, item
+        if "children" in item:
+            yield from _iter_nodes(item["children"], path)
+
+
+class SqliteMetadataStore:
+    """Index in SQLite tables with per-file upserts (WAL mode)."""
+
+    SCHEMA_SQL = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS schemas (
+            hash TEXT PRIMARY KEY, structure TEXT, root_attributes TEXT
+        );
+        CREATE TABLE IF NOT EXISTS nodes (
+            schema TEXT, path TEXT, type TEXT, shape TEXT, dtype TEXT,
+            size INTEGER, chunks TEXT, compression TEXT,
+            PRIMARY KEY (schema, path)
+        );
+        CREATE INDEX IF NOT EXISTS nodes_path ON nodes(path);
+        CREATE TABLE IF NOT EXISTS schema_attributes (
+            schema TEXT, path TEXT, name TEXT, value TEXT,
+            PRIMARY KEY (schema, path, name)
+        );
+        CREATE INDEX IF NOT EXISTS schema_attributes_attr
+            ON schema_attributes(path, name);
+        CREATE TABLE IF NOT EXISTS files (
+            file_path TEXT PRIMARY KEY, file_name TEXT, file_size INTEGER,
+            modified_time TEXT, modified_ns INTEGER, scanned_time TEXT,
+            schema TEXT
+        );
+        CREATE INDEX IF NOT EXISTS files_schema ON files(schema);
+        CREATE TABLE IF NOT EXISTS file_attributes (
+            file_path TEXT, path TEXT, name TEXT, value TEXT,
+            PRIMARY KEY (file_path, path, name)
+        );
+        CREATE INDEX IF NOT EXISTS file_attributes_attr
+            ON file_attributes(path, name);
+    """
+
+    FILE_COLUMNS = (
+        "file_path",
+        "file_name",
+        "file_size",
+        "modified_time",
+        "modified_ns",
+        "scanned_time",
+        "schema",
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path))
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self.SCHEMA_SQL)
+        return self._conn
+
+    def exists(self) -> bool:
+        if not self.path.exists():
+            return False
+        row = self.conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        return row is not None
+
+    def load(self) -> Dict[str, Any]:
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        index = new_index(meta.get("created", ""))
+        index["last_updated"] = meta.get("last_updated", index["created"])
+        index["scanned_directories"] = json.loads(
+            meta.get("scanned_directories", "[]")
+        )
+        for key, structure, root_attrs in self.conn.execute(
+            "SELECT hash, structure, root_attributes FROM schemas"
+        ):
+            index["schemas"][key] = {
+                "structure": json.loads(structure),
+                "root_attributes": json.loads(root_attrs),
+            }
+        cols = ", ".join(self.FILE_COLUMNS)
+        for row in self.conn.execute(f"SELECT {cols} FROM files ORDER BY file_path"):
+            entry = {k: v for k, v in zip(self.FILE_COLUMNS, row) if v is not None}
+            entry["attribute_overrides"] = {}
+            entry["root_attribute_overrides"] = {}
+            index["files"][entry["file_path"]] = entry
+        for file_path, path, name, value in self.conn.execute(
+            "SELECT file_path, path, name, value FROM file_attributes"
+        ):
+            entry = index["files"].get(file_path)
+            if entry is None:
+                continue
+            if path == "":
+                entry["root_attribute_overrides"][name] = json.loads(value)
+            else:
+                entry["attribute_overrides"].setdefault(path, {})[name] = json.loads(
+                    value
+                )
+        return index
+
+    def _insert_schema(self, key: str, schema: Dict[str, Any]) -> None:
+        cur = self.conn.execute(
+            "INSERT OR IGNORE INTO schemas (hash, structure, root_attributes) "
+            "VALUES (?, ?, ?)",
+            (key, _dumps(schema["structure"]), _dumps(schema["root_attributes"])),
+        )
+        if cur.rowcount == 0:
+            return
+        node_rows = []
+        attr_rows = [
+            (key, "", name, _dumps(value))
+            for name, value in schema["root_attributes"].items()
+        ]
+        for path, item in _iter_nodes(schema["structure"]):
+            node_rows.append(
+                (
+                    key,
+                    path,
+                    item.get("type"),
+                    _dumps(item.get("shape")),
+                    item.get("dtype"),
+                    item.get("size"),
+                    _dumps(item.get("chunks")),
+                    item.get("compression"),
+                )
+            )
+            for name, value in item.get("attributes", {}).items():
+                attr_rows.append((key, path, name, _dumps(value)))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)", node_rows
+        )
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO schema_attributes VALUES (?, ?, ?, ?)", attr_rows
+        )
+
+    def _write_file(self, index: Dict[str, Any], file_path: str) -> None:
+        entry = index["files"][file_path]
+        self._insert_schema(entry["schema"], index["schemas"][entry["schema"]])
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO files ({', '.join(self.FILE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(self.FILE_COLUMNS))})",
+            tuple(entry.get(col) for col in self.FILE_COLUMNS),
+        )
+        self.conn.execute("DELETE FROM file_attributes WHERE file_path = ?", (file_path,))
+        rows = [
+            (file_path, "", name, _dumps(value))
+            for name, value in entry.get("root_attribute_overrides", {}).items()
+        ]
+        for path, attrs in entry.get("attribute_overrides", {}).items():
+            rows.extend((file_path, path, name, _dumps(v)) for name, v in attrs.items())
+        self.conn.executemany(
+            "INSERT INTO file_attributes VALUES (?, ?, ?, ?)", rows
+        )
+
+    def upsert_file(self, index: Dict[str, Any], file_path: str) -> None:
+        with self.conn:
+            self._write_file(index, file_path)
+
+    def delete_file(self, file_path: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
+            self.conn.execute(
+                "DELETE FROM file_attributes WHERE file_path = ?", (file_path,)
+            )
+
+    def save(self, index: Dict[str, Any]) -> None:
+        """Write index-level fields and any file rows that are not stored yet."""
+        with self.conn:
+            stored = {row[0] for row in self.conn.execute("SELECT file_path FROM files")}
+            for file_path in index["files"]:
+                if file_path not in stored:
+                    self._write_file(index, file_path)
+            for file_path in stored - set(index["files"]):
+                self.conn.execute("DELETE FROM files WHERE file_path = ?", (file_path,))
+                self.conn.execute(
+                    "DELETE FROM file_attributes WHERE file_path = ?", (file_path,)
+                )
+            # Drop schemas no file refers to any more
+            for table, col in (
+                ("schemas", "hash"),
+                ("nodes", "schema"),
+                ("schema_attributes", "schema"),
+            ):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE {col} NOT IN "
+                    "(SELECT DISTINCT schema FROM files)"
+                )
+            meta = {
+                "version": INDEX_VERSION,
+                "created": index.get("created", ""),
+                "last_updated": index.get("last_updated", ""),
+                "scanned_directories": json.dumps(index.get("scanned_directories", [])),
+            }
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items()
+            )
+
+    def attribute_history(
+        self, index: Optional[Dict[str, Any]], node_path: str, attr_name: str
+    ) -> List[Tuple[str, Any]]:
+        rows = self.conn.execute(
+            """
+            SELECT f.file_path, COALESCE(fa.value, sa.value)
+            FROM files f
+            JOIN schema_attributes sa
+              ON sa.schema = f.schema AND sa.path = ? AND sa.name = ?
+            LEFT JOIN file_attributes fa
+              ON fa.file_path = f.file_path AND fa.path = sa.path
+             AND fa.name = sa.name
+            ORDER BY f.file_path
+            """,
+            (node_path, attr_name),
+        )
+        return [(file_path, json.loads(value)) for file_path, value in rows]
+
+    def dataset_history(
+        self, index: Optional[Dict[str, Any]], dataset_path: str
+    ) -> List[Dict[str, Any]]:
+        rows = self.conn.execute(
+            """
+            SELECT f.file_path, f.modified_time, n.shape, n.dtype, n.size
+            FROM files f JOIN nodes n ON n.schema = f.schema
+            WHERE n.path = ? AND n.type = 'dataset'
+            ORDER BY f.file_path
+            """,
+            (dataset_path,),
+        )
+        return [
+            {
+                "file_path": file_path,
+                "modified_time": modified_time,
+                "shape": json.loads(shape),
+                "dtype": dtype,
+                "size": size,
+            }
+            for file_path, modified_time, shape, dtype, size in rows
+        ]
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+SQLITE_SUFFIXES = {".sqlite", ".sqlite3", ".db"}
+
+
+def open_metadata_store(metadata_file: Path):
+    """Pick the storage backend from the metadata file suffix."""
+    if metadata_file.suffix.lower() in SQLITE_SUFFIXES:
+        return SqliteMetadataStore(metadata_file)
+    return JsonMetadataStore(metadata_file)
+
+
+def load_metadata_index(metadata_file: Path) -> Dict[str, Any]:
+    """Load an index from either backend, migrating older versions in memory."""
+    store = open_metadata_store(metadata_file)
+    if not store.exists():
+        raise FileNotFoundError(f"Metadata file not found: {metadata_file}")
+    return store.load()
+
+
+def attribute_changes(
+    history: List[Tuple[str, Any]]
+) -> List[Tuple[str, Any, Any]]:
+    """(file_path, old, new) for each file whose value differs from the previous."""
+    changes = []
+    for (_, old), (file_path, new) in zip(history, history[1:]):
+        if old != new:
+            changes.append((file_path, old, new))
+    return changes
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Query or convert an HDF5 metadata index (JSON or SQLite)"
+    )
+    parser.add_argument(
+        "--metadata-file",
+        type=str,
+        default="analysis/artifacts/hdf5_metadata_index.json",
+        help="Path to metadata index (.json, or .sqlite/.sqlite3/.db)",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_attr = sub.add_parser(
+        "attribute-changes", help="Files where an attribute value changed"
+    )
+    p_attr.add_argument("node_path", help="Node path, or '' for root attributes")
+    p_attr.add_argument("attr_name", help="Attribute name")
+
+    p_size = sub.add_parser("dataset-sizes", help="Shape/size of a dataset per file")
+    p_size.add_argument("dataset_path", help="Dataset path, e.g. Acquisition/Raw[0]/RawData")
+
+    p_conv = sub.add_parser("convert", help="Copy the index into another backend")
+    p_conv.add_argument("output", help="Output index path (.json or .sqlite)")
+
+    args = parser.parse_args()
+
+    metadata_file = Path(args.metadata_file)
+    store = open_metadata_store(metadata_file)
+    if not store.exists():
+        print(f"Error: Metadata file not found: {metadata_file}", file=sys.stderr)
+        return 1
+
+    # The SQLite backend answers queries in SQL without loading the index
+    index = None if isinstance(store, SqliteMetadataStore) else store.load()
+
+    if args.command == "attribute-changes":
+        history = store.attribute_history(index, args.node_path, args.attr_name)
+        changes = attribute_changes(history)
+        print(f"{len(history)} files carry {args.node_path}.{args.attr_name}")
+        for file_path, old, new in changes:
+            print(f"  {Path(file_path).name}: {old} → {new}")
+        print(f"{len(changes)} changes")
+    elif args.command == "dataset-sizes":
+        for row in store.dataset_history(index, args.dataset_path):
+            print(
+                f"  {Path(row['file_path']).name}  {row['modified_time']}  "
+                f"shape={row['shape']} dtype={row['dtype']} size={row['size']:,}"
+            )
+    elif args.command == "convert":
+        out = open_metadata_store(Path(args.output))
+        out.save(index if index is not None else store.load())
+        print(f"Saved metadata to {args.output}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
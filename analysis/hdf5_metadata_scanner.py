@@ -8,55 +8,64 @@ Scans HDF5 files recursively and builds a persistent metadata index that include
 - Group attributes
 - Hierarchical tree structure
 
-The index is stored in JSON format and can be incrementally updated.
+The index is stored in JSON format with each distinct file schema stored once
+(see hdf5_metadata_index.py) and can be incrementally updated: files
+are rescanned only when their size or modification time changes, and entries
+for deleted files are dropped. Files can be opened concurrently in a process
+pool (h5py serializes all calls behind one lock, so threads would not help).
 """
 
 import argparse
-import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Set
 from datetime import datetime
 import h5py
 import numpy as np
 
+from hdf5_metadata_index import (
+    add_file_entry,
+    get_file,
+    new_index,
+    open_metadata_store,
+    prune_schemas,
+)
+
 
 class HDF5MetadataScanner:
     """Scans HDF5 files and builds a persistent metadata index."""
 
-    def __init__(self, metadata_file: Path):
+    def __init__(self, metadata_file: Optional[Path]):
         self.metadata_file = metadata_file
+        self.store = (
+            open_metadata_store(metadata_file) if metadata_file is not None else None
+        )
         self.metadata: Dict[str, Any] = self._load_metadata()
 
     def _load_metadata(self) -> Dict[str, Any]:
         """Load existing metadata or create new structure."""
-        if self.metadata_file.exists():
+        if self.store is not None and self.store.exists():
             try:
-                with open(self.metadata_file, "r") as f:
-                    data = json.load(f)
+                data = self.store.load()
                 print(
                     f"Loaded existing metadata with {len(data.get('files', {}))} files"
+                    f" ({len(data.get('schemas', {}))} schemas)"
                 )
                 return data
             except Exception as e:
                 print(f"Warning: Could not load metadata file: {e}", file=sys.stderr)
                 print("Creating new metadata structure", file=sys.stderr)
 
-        return {
-            "version": "1.0",
-            "created": datetime.now().isoformat(),
-            "last_updated": datetime.now().isoformat(),
-            "files": {},  # file_path -> metadata
-            "scanned_directories": [],  # list of fully scanned directories
-        }
+        return new_index(datetime.now().isoformat())
 
     def save_metadata(self):
         """Save metadata to disk."""
         self.metadata["last_updated"] = datetime.now().isoformat()
-        self.metadata_file.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(self.metadata_file, "w") as f:
-            json.dump(self.metadata, f, indent=2)
+        prune_schemas(self.metadata)
+        self.store.save(self.metadata)
         print(f"Saved metadata to {self.metadata_file}")
 
     def _serialize_value(self, value: Any) -> Any:
@@ -123,50 +132,58 @@ class HDF5MetadataScanner:
         else:
             return {"type": "unknown", "path": full_path, "class": str(type(obj))}
 
-    def scan_file(
-        self, file_path: Path, force: bool = False
+    def is_up_to_date(self, file_path: Path, file_stat: os.stat_result) -> bool:
+        """True if the index holds an entry matching the file's size and mtime."""
+        entry = self.metadata["files"].get(str(file_path.resolve()))
+        if entry is None or entry.get("file_size") != file_stat.st_size:
+            return False
+        if "modified_ns" in entry:
+            return entry["modified_ns"] == file_stat.st_mtime_ns
+        # Entries written before modified_ns was recorded
+        return (
+            entry.get("modified_time")
+            == datetime.fromtimestamp(file_stat.st_mtime).isoformat()
+        )
+
+    def read_file_metadata(
+        self, file_path: Path, h5: Optional[h5py.File] = None
     ) -> Optional[Dict[str, Any]]:
         """
-        Scan a single HDF5 file and return its metadata.
+        Read a single HDF5 file's metadata without touching the index.
 
         Args:
             file_path: Path to the HDF5 file
-            force: If True, rescan even if file is already in index
+            h5: The file already open for reading, to walk instead of opening
+                it again (left open)
 
         Returns:
-            File metadata dictionary or None if scan failed
+            File metadata dictionary or None if the file could not be read
         """
         file_key = str(file_path.resolve())
 
-        # Check if already scanned
-        if not force and file_key in self.metadata["files"]:
-            print(f"  Skipping (already scanned): {file_path.name}")
-            return self.metadata["files"][file_key]
-
         try:
             file_stat = file_path.stat()
 
-            with h5py.File(file_path, "r") as f:
+            opened = nullcontext(h5) if h5 is not None else h5py.File(file_path, "r")
+            with opened as f:
                 # Build tree structure
                 structure = {}
                 for key in f.keys():
                     structure[key] = self._scan_item(key, f[key])
 
-                file_metadata = {
+                return {
                     "file_path": file_key,
                     "file_name": file_path.name,
                     "file_size": file_stat.st_size,
                     "modified_time": datetime.fromtimestamp(
                         file_stat.st_mtime
                     ).isoformat(),
+                    "modified_ns": file_stat.st_mtime_ns,
                     "scanned_time": datetime.now().isoformat(),
                     "root_attributes": self._extract_attributes(f),
                     "structure": structure,
                 }
 
-                self.metadata["files"][file_key] = file_metadata
-                return file_metadata
-
         except OSError as e:
             error_msg = str(e)
             if "truncated file" in error_msg.lower():
@@ -183,51 +200,161 @@ class HDF5MetadataScanner:
             )
             return None
 
+    def scan_file(
+        self, file_path: Path, force: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Scan a single HDF5 file and return its metadata.
+
+        Args:
+            file_path: Path to the HDF5 file
+            force: If True, rescan even if the indexed entry is up to date
+
+        Returns:
+            File metadata dictionary or None if scan failed
+        """
+        file_key = str(file_path.resolve())
+
+        # Check if already scanned and unchanged on disk
+        try:
+            if not force and self.is_up_to_date(file_path, file_path.stat()):
+                print(f"  Skipping (unchanged): {file_path.name}")
+                return get_file(self.metadata, file_key)
+        except OSError:
+            pass
+
+        file_metadata = self.read_file_metadata(file_path)
+        if file_metadata is not None:
+            self.store_file(file_metadata)
+        return file_metadata
+
+    def store_file(self, file_metadata: Dict[str, Any]):
+        """Add a scanned file to the index and upsert it in the backing store."""
+        add_file_entry(self.metadata, file_metadata)
+        if self.store is not None:
+            self.store.upsert_file(self.metadata, file_metadata["file_path"])
+
     def scan_directory(
         self,
         directory: Path,
         force: bool = False,
         extensions: Set[str] = {".h5", ".hdf5"},
+        workers: int = 1,
     ) -> int:
         """
-        Scan all HDF5 files in a directory recursively.
+        Incrementally scan all HDF5 files in a directory recursively.
+
+        New files and files whose size or mtime changed are (re)scanned,
+        unchanged files are kept as indexed, and index entries for files
+        under the directory that no longer exist are removed.
 
         Args:
             directory: Directory to scan
-            force: If True, rescan all files even if directory was scanned before
+            force: If True, rescan all files even if their entries are current
             extensions: Set of file extensions to scan
+            workers: Number of processes used to open files concurrently
 
         Returns:
             Number of files scanned
         """
-        dir_key = str(directory.resolve())
+        stale = self.prepare_scan(directory, force=force, extensions=extensions)
 
-        # Check if directory was already fully scanned
-        if not force and dir_key in self.metadata["scanned_directories"]:
-            print(f"Directory already scanned: {directory}")
-            print("Use --force to rescan")
-            return 0
+        scanned_count = 0
+        if workers > 1 and len(stale) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(
+                    read_file_metadata,
+                    stale,
+                    chunksize=max(1, len(stale) // (workers * 8)),
+                )
+                for i, (file_path, file_metadata) in enumerate(zip(stale, results), 1):
+                    print(f"[{i}/{len(stale)}] Scanned: {file_path.name}")
+                    if file_metadata is not None:
+                        self.store_file(file_metadata)
+                        scanned_count += 1
+        else:
+            for i, file_path in enumerate(stale, 1):
+                print(f"[{i}/{len(stale)}] Scanning: {file_path.name}")
+                if self.scan_file(file_path, force=True):
+                    scanned_count += 1
+
+        self.finish_scan(directory)
+        print(f"\nSuccessfully scanned {scanned_count}/{len(stale)} files")
+        return scanned_count
+
+    def prepare_scan(
+        self,
+        directory: Path,
+        force: bool = False,
+        extensions: Set[str] = {".h5", ".hdf5"},
+    ) -> List[Path]:
+        """
+        First half of ``scan_directory``: drop entries for deleted files and
+        list the files to (re)scan, for callers that read the metadata
+        themselves (see ``store_file`` and ``finish_scan``).
+        """
+        dir_key = str(directory.resolve())
 
         # Find all HDF5 files
         files = []
         for ext in extensions:
             files.extend(directory.rglob(f"*{ext}"))
 
-        files = sorted(files)
+        files = sorted(set(files))
         print(f"\nFound {len(files)} HDF5 files in {directory}")
 
-        scanned_count = 0
-        for i, file_path in enumerate(files, 1):
-            print(f"[{i}/{len(files)}] Scanning: {file_path.name}")
-            if self.scan_file(file_path, force=force):
-                scanned_count += 1
+        # Drop entries for files that were deleted since the last scan
+        present = {str(p.resolve()) for p in files}
+        removed = [
+            key
+            for key in self.metadata["files"]
+            if Path(key).is_relative_to(dir_key) and key not in present
+        ]
+        for key in removed:
+            del self.metadata["files"][key]
+            if self.store is not None:
+                self.store.delete_file(key)
+
+        stale = []
+        for file_path in files:
+            try:
+                if force or not self.is_up_to_date(file_path, file_path.stat()):
+                    stale.append(file_path)
+            except OSError:
+                stale.append(file_path)
+
+        print(
+            f"  {len(stale)} new or changed, {len(files) - len(stale)} unchanged, "
+            f"{len(removed)} removed"
+        )
+        return stale
+
+    def finish_scan(self, directory: Path):
+        """Second half of ``scan_directory``: order entries and record the directory."""
+        dir_key = str(directory.resolve())
+
+        # Keep entries in path order so consecutive files stay adjacent for
+        # the structure comparator
+        self.metadata["files"] = dict(sorted(self.metadata["files"].items()))
 
-        # Mark directory as scanned
+        # Record the directory for bookkeeping; it no longer blocks rescans
         if dir_key not in self.metadata["scanned_directories"]:
             self.metadata["scanned_directories"].append(dir_key)
 
-        print(f"\nSuccessfully scanned {scanned_count}/{len(files)} files")
-        return scanned_count
+
+# Per-process scanner used by pool workers (no index of its own)
+_WORKER_SCANNER: Optional[HDF5MetadataScanner] = None
+
+
+def read_file_metadata(
+    file_path: Path, h5: Optional[h5py.File] = None
+) -> Optional[Dict[str, Any]]:
+    """``HDF5MetadataScanner.read_file_metadata`` outside of any index, for
+    worker processes and other scripts; the caller stores the entry."""
+    global _WORKER_SCANNER
+    if _WORKER_SCANNER is None:
+        _WORKER_SCANNER = HDF5MetadataScanner(None)
+    return _WORKER_SCANNER.read_file_metadata(file_path, h5=h5)
 
 
 def main():
@@ -239,7 +366,7 @@ def main():
         "--metadata-file",
         type=str,
         default="analysis/artifacts/hdf5_metadata_index.json",
-        help="Path to metadata index file (default: analysis/artifacts/hdf5_metadata_index.json)",
+        help="Path to metadata index file; a .sqlite/.sqlite3/.db suffix selects the SQLite store (default: analysis/artifacts/hdf5_metadata_index.json)",
     )
     parser.add_argument(
         "--force",
@@ -253,6 +380,12 @@ def main():
         default=[".h5", ".hdf5"],
         help="File extensions to scan (default: .h5 .hdf5)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Processes used to open files concurrently (default: 1)",
+    )
 
     args = parser.parse_args()
 
@@ -272,7 +405,7 @@ def main():
     # Scan directory
     extensions = set(args.extensions)
     scanned_count = scanner.scan_directory(
-        input_dir, force=args.force, extensions=extensions
+        input_dir, force=args.force, extensions=extensions, workers=args.workers
     )
 
     # Save results
@@ -280,6 +413,7 @@ def main():
 
     print(f"\n✅ Scan complete!")
     print(f"   Total files in index: {len(scanner.metadata['files'])}")
+    print(f"   Distinct schemas: {len(scanner.metadata['schemas'])}")
     print(f"   Scanned directories: {len(scanner.metadata['scanned_directories'])}")
     print(f"   Metadata file: {metadata_file}")
 
@@ -288,6 +422,3 @@ def main():
 
 if __name__ == "__main__":
     sys.exit(main())
-
-
-
@@ -13,34 +13,126 @@ Patterns analyzed:
 """
 
 import argparse
-import json
 import sys
 from pathlib import Path
-from typing import Dict, List, Any, Tuple
+from typing import Dict, List, Any, Optional, Set, Tuple
 from collections import defaultdict, Counter
-import matplotlib.pyplot as plt
-import matplotlib
-
-matplotlib.use("Agg")  # Use non-interactive backend
 import numpy as np
 
+from hdf5_metadata_index import get_file, iter_files, load_metadata_index
+from render_queue import RenderQueue
+
+
+def draw_array_sizes(fig, plotted: List[Tuple[str, List[int]]]):
+    """Bar charts of array sizes per file, one row per dataset path."""
+    axes = fig.subplots(len(plotted), 1, squeeze=False)[:, 0]
+
+    for ax, (path, sizes) in zip(axes, plotted):
+        # Create bar chart
+        x_pos = np.arange(len(sizes))
+        ax.bar(x_pos, sizes, color="steelblue", alpha=0.7)
+        ax.set_xlabel("File Index")
+        ax.set_ylabel("Array Size (elements)")
+        ax.set_title(f"Array Size Variation: {path}\n({len(sizes)} files)")
+        ax.grid(axis="y", alpha=0.3)
+
+        # Add statistics
+        if len(sizes) > 0:
+            stats_text = f"Min: {min(sizes):,} | Max: {max(sizes):,} | Mean: {np.mean(sizes):,.0f}"
+            ax.text(
+                0.02,
+                0.98,
+                stats_text,
+                transform=ax.transAxes,
+                verticalalignment="top",
+                bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
+            )
+
+    fig.tight_layout()
+
+
+def draw_scalar_values(fig, plotted: List[Tuple[str, List[float]]]):
+    """Bar charts of scalar attribute values per file."""
+    axes = fig.subplots(len(plotted), 1, squeeze=False)[:, 0]
+
+    for ax, (attr_path, values) in zip(axes, plotted):
+        # Create bar chart
+        x_pos = np.arange(len(values))
+        ax.bar(x_pos, values, color="coral", alpha=0.7)
+        ax.set_xlabel("File Index")
+        ax.set_ylabel("Value")
+        ax.set_title(f"Scalar Value Variation: {attr_path}\n({len(values)} files)")
+        ax.grid(axis="y", alpha=0.3)
+
+        # Add statistics
+        stats_text = f"Min: {min(values):.3g} | Max: {max(values):.3g} | Unique: {len(set(values))}"
+        ax.text(
+            0.02,
+            0.98,
+            stats_text,
+            transform=ax.transAxes,
+            verticalalignment="top",
+            bbox=dict(boxstyle="round", facecolor="lightblue", alpha=0.5),
+        )
+
+    fig.tight_layout()
+
+
+def draw_file_sizes(fig, file_sizes: List[int]):
+    """Histogram and box plot of file sizes."""
+    ax1, ax2 = fig.subplots(1, 2)
+
+    # Histogram
+    ax1.hist(
+        file_sizes,
+        bins=30,
+        color="green",
+        alpha=0.7,
+        edgecolor="black",
+    )
+    ax1.set_xlabel("File Size (bytes)")
+    ax1.set_ylabel("Frequency")
+    ax1.set_title("File Size Distribution")
+    ax1.grid(axis="y", alpha=0.3)
+
+    # Box plot
+    ax2.boxplot(file_sizes, vert=True)
+    ax2.set_ylabel("File Size (bytes)")
+    ax2.set_title("File Size Box Plot")
+    ax2.grid(axis="y", alpha=0.3)
+
+    fig.tight_layout()
+
 
 class HDF5MetadataVisualizer:
     """Visualizes patterns in HDF5 metadata."""
 
-    def __init__(self, metadata_file: Path):
+    def __init__(
+        self,
+        metadata_file: Path,
+        render_workers: int = 1,
+        skip_unchanged_figures: bool = False,
+    ):
         self.metadata_file = metadata_file
         self.metadata = self._load_metadata()
         self.output_dir = metadata_file.parent / "visualizations"
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.render_queue = RenderQueue(
+            workers=render_workers, skip_unchanged=skip_unchanged_figures
+        )
+        self._defer_rendering = False
 
     def _load_metadata(self) -> Dict[str, Any]:
         """Load metadata from file."""
-        if not self.metadata_file.exists():
-            raise FileNotFoundError(f"Metadata file not found: {self.metadata_file}")
+        return load_metadata_index(self.metadata_file)
 
-        with open(self.metadata_file, "r") as f:
-            return json.load(f)
+    def _render(self, out_png: Path, draw, *args, figsize):
+        """Queue a figure; it is rendered now unless rendering is deferred."""
+        self.render_queue.submit(
+            out_png, draw, *args, figsize=figsize, dpi=150, tight_bbox=True
+        )
+        if not self._defer_rendering:
+            self.render_queue.run()
 
     def _traverse_structure(
         self, structure: Dict[str, Any], callback, path: str = "", level: int = 0
@@ -55,30 +147,123 @@ class HDF5MetadataVisualizer:
                     item["children"], callback, current_path, level + 1
                 )
 
-    def pattern1_array_sizes(self):
+    def _collect(self, patterns: Set[str]) -> Dict[str, Any]:
+        """
+        Traverse every file's tree once, feeding the accumulators of ``patterns``.
+
+        Patterns: "array_sizes" (pattern 1), "scalar_attrs" (pattern 2),
+        "string_attrs" (pattern 3) and "additional" (additional patterns).
+        The result can be passed to each pattern method, so running them all
+        costs a single traversal of the index.
+        """
+        collected: Dict[str, Any] = {}
+        node_callbacks = []
+        file_callbacks = []
+
+        if "array_sizes" in patterns:
+            array_sizes = collected["array_sizes"] = defaultdict(list)
+
+            def collect_arrays(name, item, path, level):
+                if item.get("type") == "dataset":
+                    shape = tuple(item.get("shape", []))
+                    size = item.get("size", 0)
+                    if len(shape) > 0:  # Only arrays, not scalars
+                        array_sizes[path].append(
+                            {
+                                "file": item.get("file_path", "unknown"),
+                                "shape": shape,
+                                "size": size,
+                                "dtype": item.get("dtype", "unknown"),
+                            }
+                        )
+
+            node_callbacks.append(collect_arrays)
+
+        if "scalar_attrs" in patterns:
+            scalar_attrs = collected["scalar_attrs"] = defaultdict(list)
+
+            def is_scalar(value):
+                # Scalar numbers only (not arrays, strings or booleans)
+                return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+            def collect_scalars(name, item, path, level):
+                for attr_name, attr_value in item.get("attributes", {}).items():
+                    if is_scalar(attr_value):
+                        scalar_attrs[f"{path}.{attr_name}"].append(attr_value)
+
+            def collect_root_scalars(file_path, file_meta):
+                for attr_name, attr_value in file_meta.get("root_attributes", {}).items():
+                    if is_scalar(attr_value):
+                        scalar_attrs[f"ROOT.{attr_name}"].append(attr_value)
+
+            node_callbacks.append(collect_scalars)
+            file_callbacks.append(collect_root_scalars)
+
+        if "string_attrs" in patterns:
+            string_attrs = collected["string_attrs"] = defaultdict(list)
+
+            def is_string(value):
+                return isinstance(value, str) and not value.startswith("<")
+
+            def collect_strings(name, item, path, level):
+                for attr_name, attr_value in item.get("attributes", {}).items():
+                    if is_string(attr_value):
+                        string_attrs[f"{path}.{attr_name}"].append(attr_value)
+
+            def collect_root_strings(file_path, file_meta):
+                for attr_name, attr_value in file_meta.get("root_attributes", {}).items():
+                    if is_string(attr_value):
+                        string_attrs[f"ROOT.{attr_name}"].append(attr_value)
+
+            node_callbacks.append(collect_strings)
+            file_callbacks.append(collect_root_strings)
+
+        if "additional" in patterns:
+            stats = collected["additional"] = {
+                "total_files": len(self.metadata["files"]),
+                "compression_usage": 0,
+                "chunked_datasets": 0,
+                "total_datasets": 0,
+                "dtype_distribution": Counter(),
+                "file_sizes": [],
+                "common_paths": Counter(),
+            }
+
+            def analyze_item(name, item, path, level):
+                if item.get("type") == "dataset":
+                    stats["total_datasets"] += 1
+                    if item.get("compression"):
+                        stats["compression_usage"] += 1
+                    if item.get("chunks"):
+                        stats["chunked_datasets"] += 1
+                    stats["dtype_distribution"][item.get("dtype", "unknown")] += 1
+                    stats["common_paths"][path] += 1
+
+            def analyze_file(file_path, file_meta):
+                stats["file_sizes"].append(file_meta.get("file_size", 0))
+
+            node_callbacks.append(analyze_item)
+            file_callbacks.append(analyze_file)
+
+        def visit(name, item, path, level):
+            for callback in node_callbacks:
+                callback(name, item, path, level)
+
+        for file_path, file_meta in iter_files(self.metadata):
+            if node_callbacks:
+                self._traverse_structure(file_meta.get("structure", {}), visit)
+            for callback in file_callbacks:
+                callback(file_path, file_meta)
+
+        return collected
+
+    def pattern1_array_sizes(self, collected: Optional[Dict[str, Any]] = None):
         """Pattern 1: Array size distribution across files."""
         print("\n=== Pattern 1: Array Size Distribution ===")
 
-        # Collect array sizes by dataset path
-        array_sizes = defaultdict(list)  # path -> [(file, shape, size)]
-
-        def collect_arrays(name, item, path, level):
-            if item.get("type") == "dataset":
-                shape = tuple(item.get("shape", []))
-                size = item.get("size", 0)
-                if len(shape) > 0:  # Only arrays, not scalars
-                    array_sizes[path].append(
-                        {
-                            "file": item.get("file_path", "unknown"),
-                            "shape": shape,
-                            "size": size,
-                            "dtype": item.get("dtype", "unknown"),
-                        }
-                    )
-
-        for file_path, file_meta in self.metadata["files"].items():
-            structure = file_meta.get("structure", {})
-            self._traverse_structure(structure, collect_arrays)
+        if collected is None:
+            collected = self._collect({"array_sizes"})
+        array_sizes = collected["array_sizes"]  # path -> [(file, shape, size)]
 
         # Create visualizations for arrays that appear in multiple files
         multi_file_arrays = {
@@ -93,46 +278,16 @@ class HDF5MetadataVisualizer:
             return
 
         # Create bar charts for top varying arrays
-        fig, axes = plt.subplots(
-            min(4, len(multi_file_arrays)),
-            1,
-            figsize=(12, 4 * min(4, len(multi_file_arrays))),
+        plotted = [
+            (path, [d["size"] for d in data])
+            for path, data in list(multi_file_arrays.items())[:4]
+        ]
+        self._render(
+            self.output_dir / "pattern1_array_sizes.png",
+            draw_array_sizes,
+            plotted,
+            figsize=(12, 4 * len(plotted)),
         )
-        if len(multi_file_arrays) == 1:
-            axes = [axes]
-
-        for idx, (path, data) in enumerate(list(multi_file_arrays.items())[:4]):
-            ax = axes[idx] if len(multi_file_arrays) > 1 else axes[0]
-
-            # Extract sizes and file names
-            sizes = [d["size"] for d in data]
-            file_names = [Path(d["file"]).name for d in data]
-
-            # Create bar chart
-            x_pos = np.arange(len(sizes))
-            ax.bar(x_pos, sizes, color="steelblue", alpha=0.7)
-            ax.set_xlabel("File Index")
-            ax.set_ylabel("Array Size (elements)")
-            ax.set_title(f"Array Size Variation: {path}\n({len(data)} files)")
-            ax.grid(axis="y", alpha=0.3)
-
-            # Add statistics
-            if len(sizes) > 0:
-                stats_text = f"Min: {min(sizes):,} | Max: {max(sizes):,} | Mean: {np.mean(sizes):,.0f}"
-                ax.text(
-                    0.02,
-                    0.98,
-                    stats_text,
-                    transform=ax.transAxes,
-                    verticalalignment="top",
-                    bbox=dict(boxstyle="round", facecolor="wheat", alpha=0.5),
-                )
-
-        plt.tight_layout()
-        output_file = self.output_dir / "pattern1_array_sizes.png"
-        plt.savefig(output_file, dpi=150, bbox_inches="tight")
-        plt.close()
-        print(f"  Saved: {output_file}")
 
         # Save detailed report
         report_file = self.output_dir / "pattern1_array_sizes_report.txt"
@@ -152,33 +307,13 @@ class HDF5MetadataVisualizer:
 
         print(f"  Saved: {report_file}")
 
-    def pattern2_scalar_values(self):
+    def pattern2_scalar_values(self, collected: Optional[Dict[str, Any]] = None):
         """Pattern 2: Scalar value changes across files."""
         print("\n=== Pattern 2: Scalar Value Changes ===")
 
-        # Collect scalar attributes
-        scalar_attrs = defaultdict(list)  # path.attr_name -> [values]
-
-        def collect_scalars(name, item, path, level):
-            attrs = item.get("attributes", {})
-            for attr_name, attr_value in attrs.items():
-                # Check if scalar (not array or string)
-                if isinstance(attr_value, (int, float)) and not isinstance(
-                    attr_value, bool
-                ):
-                    key = f"{path}.{attr_name}"
-                    scalar_attrs[key].append(attr_value)
-
-        for file_path, file_meta in self.metadata["files"].items():
-            structure = file_meta.get("structure", {})
-            self._traverse_structure(structure, collect_scalars)
-
-            # Also check root attributes
-            for attr_name, attr_value in file_meta.get("root_attributes", {}).items():
-                if isinstance(attr_value, (int, float)) and not isinstance(
-                    attr_value, bool
-                ):
-                    scalar_attrs[f"ROOT.{attr_name}"].append(attr_value)
+        if collected is None:
+            collected = self._collect({"scalar_attrs"})
+        scalar_attrs = collected["scalar_attrs"]  # path.attr_name -> [values]
 
         # Find scalars that vary
         varying_scalars = {
@@ -193,61 +328,21 @@ class HDF5MetadataVisualizer:
             return
 
         # Create visualizations
-        n_plots = min(6, len(varying_scalars))
-        fig, axes = plt.subplots(n_plots, 1, figsize=(12, 4 * n_plots))
-        if n_plots == 1:
-            axes = [axes]
-
-        for idx, (attr_path, values) in enumerate(list(varying_scalars.items())[:6]):
-            ax = axes[idx]
-
-            # Create bar chart
-            x_pos = np.arange(len(values))
-            ax.bar(x_pos, values, color="coral", alpha=0.7)
-            ax.set_xlabel("File Index")
-            ax.set_ylabel("Value")
-            ax.set_title(f"Scalar Value Variation: {attr_path}\n({len(values)} files)")
-            ax.grid(axis="y", alpha=0.3)
-
-            # Add statistics
-            stats_text = f"Min: {min(values):.3g} | Max: {max(values):.3g} | Unique: {len(set(values))}"
-            ax.text(
-                0.02,
-                0.98,
-                stats_text,
-                transform=ax.transAxes,
-                verticalalignment="top",
-                bbox=dict(boxstyle="round", facecolor="lightblue", alpha=0.5),
-            )
-
-        plt.tight_layout()
-        output_file = self.output_dir / "pattern2_scalar_values.png"
-        plt.savefig(output_file, dpi=150, bbox_inches="tight")
-        plt.close()
-        print(f"  Saved: {output_file}")
+        plotted = list(varying_scalars.items())[:6]
+        self._render(
+            self.output_dir / "pattern2_scalar_values.png",
+            draw_scalar_values,
+            plotted,
+            figsize=(12, 4 * len(plotted)),
+        )
 
-    def pattern3_string_fields(self):
+    def pattern3_string_fields(self, collected: Optional[Dict[str, Any]] = None):
         """Pattern 3: String field variations (padding/truncation)."""
         print("\n=== Pattern 3: String Field Variations ===")
 
-        # Collect string attributes
-        string_attrs = defaultdict(list)  # path.attr_name -> [values]
-
-        def collect_strings(name, item, path, level):
-            attrs = item.get("attributes", {})
-            for attr_name, attr_value in attrs.items():
-                if isinstance(attr_value, str) and not attr_value.startswith("<"):
-                    key = f"{path}.{attr_name}"
-                    string_attrs[key].append(attr_value)
-
-        for file_path, file_meta in self.metadata["files"].items():
-            structure = file_meta.get("structure", {})
-            self._traverse_structure(structure, collect_strings)
-
-            # Also check root attributes
-            for attr_name, attr_value in file_meta.get("root_attributes", {}).items():
-                if isinstance(attr_value, str) and not attr_value.startswith("<"):
-                    string_attrs[f"ROOT.{attr_name}"].append(attr_value)
+        if collected is None:
+            collected = self._collect({"string_attrs"})
+        string_attrs = collected["string_attrs"]  # path.attr_name -> [values]
 
         print(f"Found {len(string_attrs)} string attributes")
 
@@ -312,48 +407,32 @@ class HDF5MetadataVisualizer:
             f.write("HDF5 File Structure Trees\n")
             f.write("=" * 80 + "\n\n")
 
-            for file_path, file_meta in sorted(self.metadata["files"].items()):
+            # The notation only shows names, shapes and dtypes, which are
+            # fixed by the file's schema, so render each schema once
+            notations: Dict[str, str] = {}
+            for file_path in sorted(self.metadata["files"]):
+                entry = self.metadata["files"][file_path]
                 f.write(f"\nFile: {Path(file_path).name}\n")
                 f.write(f"Path: {file_path}\n")
-                f.write(f"Size: {file_meta.get('file_size', 0):,} bytes\n")
+                f.write(f"Size: {entry.get('file_size', 0):,} bytes\n")
                 f.write("-" * 80 + "\n")
 
-                structure = file_meta.get("structure", {})
-                notation = structure_to_notation(structure)
-                f.write(notation)
+                schema = entry.get("schema")
+                if schema not in notations:
+                    structure = get_file(self.metadata, file_path).get("structure", {})
+                    notations[schema] = structure_to_notation(structure)
+                f.write(notations[schema])
                 f.write("\n\n")
 
         print(f"  Saved: {output_file}")
 
-    def additional_patterns(self):
+    def additional_patterns(self, collected: Optional[Dict[str, Any]] = None):
         """Additional pattern analysis and best practices."""
         print("\n=== Additional Patterns & Best Practices ===")
 
-        # Collect statistics
-        stats = {
-            "total_files": len(self.metadata["files"]),
-            "compression_usage": 0,
-            "chunked_datasets": 0,
-            "total_datasets": 0,
-            "dtype_distribution": Counter(),
-            "file_sizes": [],
-            "common_paths": Counter(),
-        }
-
-        def analyze_item(name, item, path, level):
-            if item.get("type") == "dataset":
-                stats["total_datasets"] += 1
-                if item.get("compression"):
-                    stats["compression_usage"] += 1
-                if item.get("chunks"):
-                    stats["chunked_datasets"] += 1
-                stats["dtype_distribution"][item.get("dtype", "unknown")] += 1
-                stats["common_paths"][path] += 1
-
-        for file_path, file_meta in self.metadata["files"].items():
-            structure = file_meta.get("structure", {})
-            self._traverse_structure(structure, analyze_item)
-            stats["file_sizes"].append(file_meta.get("file_size", 0))
+        if collected is None:
+            collected = self._collect({"additional"})
+        stats = collected["additional"]
 
         # Generate report
         report_file = self.output_dir / "additional_patterns_report.txt"
@@ -393,43 +472,38 @@ class HDF5MetadataVisualizer:
 
         # Create visualization for file sizes
         if stats["file_sizes"]:
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 5))
-
-            # Histogram
-            ax1.hist(
+            self._render(
+                self.output_dir / "file_size_distribution.png",
+                draw_file_sizes,
                 stats["file_sizes"],
-                bins=30,
-                color="green",
-                alpha=0.7,
-                edgecolor="black",
+                figsize=(14, 5),
             )
-            ax1.set_xlabel("File Size (bytes)")
-            ax1.set_ylabel("Frequency")
-            ax1.set_title("File Size Distribution")
-            ax1.grid(axis="y", alpha=0.3)
-
-            # Box plot
-            ax2.boxplot(stats["file_sizes"], vert=True)
-            ax2.set_ylabel("File Size (bytes)")
-            ax2.set_title("File Size Box Plot")
-            ax2.grid(axis="y", alpha=0.3)
-
-            plt.tight_layout()
-            output_file = self.output_dir / "file_size_distribution.png"
-            plt.savefig(output_file, dpi=150, bbox_inches="tight")
-            plt.close()
-            print(f"  Saved: {output_file}")
 
     def generate_all_visualizations(self):
         """Generate all visualizations and reports."""
         print(f"\nGenerating visualizations from: {self.metadata_file}")
         print(f"Output directory: {self.output_dir}")
 
-        self.pattern1_array_sizes()
-        self.pattern2_scalar_values()
-        self.pattern3_string_fields()
-        self.pattern5_tree_structures()
-        self.additional_patterns()
+        # One traversal of every file feeds all tree-walking patterns
+        collected = self._collect(
+            {"array_sizes", "scalar_attrs", "string_attrs", "additional"}
+        )
+
+        # Queue every figure, then render them together (in parallel with
+        # render_workers > 1)
+        self._defer_rendering = True
+        try:
+            self.pattern1_array_sizes(collected)
+            self.pattern2_scalar_values(collected)
+            self.pattern3_string_fields(collected)
+            self.pattern5_tree_structures()
+            self.additional_patterns(collected)
+        finally:
+            self._defer_rendering = False
+
+        print("\n=== Rendering figures ===")
+        rendered, skipped = self.render_queue.run()
+        print(f"  {rendered} rendered, {skipped} unchanged")
 
         print(f"\n✅ All visualizations complete!")
         print(f"   Output directory: {self.output_dir}")
@@ -443,6 +517,17 @@ def main():
         default="analysis/artifacts/hdf5_metadata_index.json",
         help="Path to metadata index file",
     )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="Processes used to render figures (default: 1)",
+    )
+    parser.add_argument(
+        "--skip-unchanged-figures",
+        action="store_true",
+        help="Skip re-rendering figures whose input data did not change",
+    )
 
     args = parser.parse_args()
 
@@ -454,7 +539,11 @@ def main():
         )
         return 1
 
-    visualizer = HDF5MetadataVisualizer(metadata_file)
+    visualizer = HDF5MetadataVisualizer(
+        metadata_file,
+        render_workers=args.render_workers,
+        skip_unchanged_figures=args.skip_unchanged_figures,
+    )
     visualizer.generate_all_visualizations()
 
     return 0
@@ -7,16 +7,25 @@ Analyzes and compares HDF5 file structures to identify:
 - Changed dataset shapes, dtypes, or attributes
 - Structural differences between files
 - Evolution of file structure over time
+
+Every node in a flattened structure carries a Merkle-style ``node_hash`` (its
+own properties) and ``subtree_hash`` (its node hash plus its children's
+subtree hashes), so pairs of files with the same root hash are skipped
+without a walk and only subtrees whose hashes differ are diffed.
 """
 
 import argparse
+import csv
+import hashlib
 import json
 import sys
 from pathlib import Path
-from typing import Dict, List, Any, Set, Tuple, Optional
+from typing import Dict, Iterator, List, Any, Set, Tuple, Optional
 from collections import defaultdict
 from datetime import datetime
 
+from hdf5_metadata_index import iter_files, load_metadata_index
+
 
 class HDF5StructureComparator:
     """Compares HDF5 file structures and identifies differences."""
@@ -29,16 +38,17 @@ class HDF5StructureComparator:
 
     def _load_metadata(self) -> Dict[str, Any]:
         """Load metadata from file."""
-        if not self.metadata_file.exists():
-            raise FileNotFoundError(f"Metadata file not found: {self.metadata_file}")
+        return load_metadata_index(self.metadata_file)
 
-        with open(self.metadata_file, "r") as f:
-            return json.load(f)
+    @staticmethod
+    def _hash(payload: Any) -> str:
+        blob = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha1(blob.encode("utf-8")).hexdigest()
 
     def _extract_structure_paths(
         self, structure: Dict[str, Any], prefix: str = ""
     ) -> Dict[str, Dict[str, Any]]:
-        """Extract all paths and their properties from structure."""
+        """Extract all paths and their properties (with Merkle hashes) from structure."""
         paths = {}
 
         for name, item in structure.items():
@@ -59,6 +69,7 @@ class HDF5StructureComparator:
                     "type": "group",
                     "attributes": item.get("attributes", {}),
                     "children_count": len(item.get("children", {})),
+                    "child_paths": [],
                 }
                 # Recursively extract children
                 if "children" in item:
@@ -66,19 +77,70 @@ class HDF5StructureComparator:
                         item["children"], current_path
                     )
                     paths.update(child_paths)
+                    paths[current_path]["child_paths"] = [
+                        f"{current_path}/{child}" for child in item["children"]
+                    ]
             else:
                 paths[current_path] = {
                     "type": item.get("type", "unknown"),
                     "error": item.get("error", "Unknown item type"),
                 }
 
+            node = paths[current_path]
+            node["node_hash"] = self._hash(
+                {k: v for k, v in node.items() if k != "child_paths"}
+            )
+            node["subtree_hash"] = self._hash(
+                [node["node_hash"]]
+                + sorted(
+                    (child, paths[child]["subtree_hash"])
+                    for child in node.get("child_paths", [])
+                )
+            )
+
         return paths
 
+    @staticmethod
+    def _top_level_paths(paths: Dict[str, Dict[str, Any]]) -> List[str]:
+        return [path for path in paths if "/" not in path]
+
+    def _root_hash(self, paths: Dict[str, Dict[str, Any]]) -> str:
+        """Hash of the whole file structure, from its top-level subtree hashes."""
+        return self._hash(
+            sorted(
+                (path, paths[path]["subtree_hash"])
+                for path in self._top_level_paths(paths)
+            )
+        )
+
+    @staticmethod
+    def _subtree(
+        paths: Dict[str, Dict[str, Any]], path: str
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (path, item) for ``path`` and everything below it."""
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            item = paths[current]
+            yield current, item
+            stack.extend(item.get("child_paths", []))
+
     def _compare_structures(
-        self, paths1: Dict[str, Dict[str, Any]], paths2: Dict[str, Dict[str, Any]]
+        self,
+        paths1: Dict[str, Dict[str, Any]],
+        paths2: Dict[str, Dict[str, Any]],
+        root_hash1: Optional[str] = None,
+        root_hash2: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Compare two structure dictionaries and return differences."""
-        all_paths = set(paths1.keys()) | set(paths2.keys())
+        if root_hash1 is None:
+            root_hash1 = self._root_hash(paths1)
+        if root_hash2 is None:
+            root_hash2 = self._root_hash(paths2)
+
+        if root_hash1 == root_hash2:
+            # Identical trees: nothing to walk, every path is unchanged
+            return {"added": {}, "removed": {}, "changed": {}, "unchanged": paths1}
 
         differences = {
             "added": {},  # paths in paths2 but not in paths1
@@ -87,22 +149,34 @@ class HDF5StructureComparator:
             "unchanged": {},  # paths in both with same properties
         }
 
-        for path in all_paths:
-            if path in paths1 and path not in paths2:
-                differences["removed"][path] = paths1[path]
-            elif path in paths2 and path not in paths1:
-                differences["added"][path] = paths2[path]
-            elif path in paths1 and path in paths2:
-                if self._structures_equal(paths1[path], paths2[path]):
-                    differences["unchanged"][path] = paths1[path]
+        top1 = self._top_level_paths(paths1)
+        stack = top1 + [p for p in self._top_level_paths(paths2) if p not in paths1]
+        while stack:
+            path = stack.pop()
+            item1 = paths1.get(path)
+            item2 = paths2.get(path)
+
+            if item2 is None:
+                differences["removed"].update(self._subtree(paths1, path))
+            elif item1 is None:
+                differences["added"].update(self._subtree(paths2, path))
+            elif item1["subtree_hash"] == item2["subtree_hash"]:
+                differences["unchanged"].update(self._subtree(paths1, path))
+            else:
+                if item1["node_hash"] == item2["node_hash"] or self._structures_equal(
+                    item1, item2
+                ):
+                    differences["unchanged"][path] = item1
                 else:
                     differences["changed"][path] = {
-                        "old": paths1[path],
-                        "new": paths2[path],
-                        "changes": self._get_property_changes(
-                            paths1[path], paths2[path]
-                        ),
+                        "old": item1,
+                        "new": item2,
+                        "changes": self._get_property_changes(item1, item2),
                     }
+                stack.extend(item1.get("child_paths", []))
+                stack.extend(
+                    c for c in item2.get("child_paths", []) if c not in paths1
+                )
 
         return differences
 
@@ -198,33 +272,38 @@ class HDF5StructureComparator:
         """Generate comprehensive structure comparison report."""
         print("\n=== HDF5 Structure Comparison Analysis ===")
 
-        files = list(self.metadata["files"].items())
+        files = list(self.metadata["files"])
         if len(files) < 2:
             print("Need at least 2 files to compare structures")
             return
 
-        # Extract structures for all files
+        # Extract structures for all files, hashing each one once
         file_structures = {}
-        for file_path, file_meta in files:
+        root_hashes = {}
+        for file_path, file_meta in iter_files(self.metadata):
             structure = file_meta.get("structure", {})
-            file_structures[file_path] = self._extract_structure_paths(structure)
+            paths = self._extract_structure_paths(structure)
+            file_structures[file_path] = paths
+            root_hashes[file_path] = self._root_hash(paths)
 
         # Generate pairwise comparisons
         comparison_results = []
 
         for i in range(len(files) - 1):
-            file1_path, file1_meta = files[i]
-            file2_path, file2_meta = files[i + 1]
+            file1_path = files[i]
+            file2_path = files[i + 1]
 
             file1_name = Path(file1_path).name
             file2_name = Path(file2_path).name
 
             print(f"Comparing: {file1_name} → {file2_name}")
 
-            paths1 = file_structures[file1_path]
-            paths2 = file_structures[file2_path]
-
-            differences = self._compare_structures(paths1, paths2)
+            differences = self._compare_structures(
+                file_structures[file1_path],
+                file_structures[file2_path],
+                root_hashes[file1_path],
+                root_hashes[file2_path],
+            )
 
             comparison_results.append(
                 {
@@ -396,65 +475,120 @@ class HDF5StructureComparator:
 
         print(f"  Saved: {stats_file}")
 
+    @staticmethod
+    def _timeline_value(item: Optional[Dict[str, Any]]) -> str:
+        """Value a path is tracked by in the evolution timeline."""
+        if item is None:
+            return "<missing>"
+        if item.get("type") == "dataset":
+            shape_str = str(item.get("shape", []))
+            dtype_str = str(item.get("dtype", "unknown"))
+            return f"dataset {shape_str} {dtype_str}"
+        if item.get("type") == "group":
+            return f"group ({item.get('children_count', 0)} children)"
+        return f"{item.get('type', 'unknown')}"
+
+    def _timeline_segments(
+        self, file_structures: Dict[str, Dict[str, Any]]
+    ) -> List[Tuple[str, str, int, int]]:
+        """
+        Run-length segments (path, value, first file index, last file index).
+
+        Built in one pass over the files. Timeline values ignore attribute
+        values, so consecutive files that share an index schema (same schema
+        hash: names, types, shapes and dtypes) cannot change any segment and
+        are skipped without looking at their paths.
+        """
+        file_paths = list(file_structures)
+        segments = []
+        open_segments: Dict[str, Tuple[str, int]] = {}  # path -> (value, start)
+        prev_schema = None
+
+        for i, file_path in enumerate(file_paths):
+            schema = self.metadata["files"].get(file_path, {}).get("schema")
+            if i > 0 and schema is not None and schema == prev_schema:
+                continue
+            prev_schema = schema
+
+            paths = file_structures[file_path]
+            for path in open_segments.keys() | paths.keys():
+                value = self._timeline_value(paths.get(path))
+                current = open_segments.get(path)
+                if current is None:
+                    if i > 0:
+                        segments.append((path, "<missing>", 0, i - 1))
+                    open_segments[path] = (value, i)
+                elif current[0] != value:
+                    segments.append((path, current[0], current[1], i - 1))
+                    open_segments[path] = (value, i)
+
+        for path, (value, start) in open_segments.items():
+            segments.append((path, value, start, len(file_paths) - 1))
+
+        segments.sort(key=lambda seg: (seg[0], seg[2]))
+        return segments
+
     def _write_evolution_timeline(self, file_structures: Dict[str, Dict[str, Any]]):
-        """Write structure evolution timeline with enhanced change highlighting."""
+        """Write the structure evolution timeline as run-length segments per path."""
         timeline_file = self.output_dir / "structure_evolution_timeline.txt"
+        table_file = self.output_dir / "structure_evolution_timeline.tsv"
+
+        file_names = [Path(p).name for p in file_structures]
+        segments = self._timeline_segments(file_structures)
+
+        with open(table_file, "w", newline="") as f:
+            writer = csv.writer(f, delimiter="\t")
+            writer.writerow(
+                [
+                    "path",
+                    "value",
+                    "first_file",
+                    "last_file",
+                    "first_index",
+                    "last_index",
+                    "n_files",
+                ]
+            )
+            for path, value, start, end in segments:
+                writer.writerow(
+                    [
+                        path,
+                        value,
+                        file_names[start],
+                        file_names[end],
+                        start,
+                        end,
+                        end - start + 1,
+                    ]
+                )
+
+        by_path = defaultdict(list)
+        for path, value, start, end in segments:
+            by_path[path].append((value, start, end))
 
         with open(timeline_file, "w") as f:
             f.write("HDF5 Structure Evolution Timeline\n")
             f.write("=" * 80 + "\n\n")
-
-            # Collect all unique paths across all files
-            all_paths = set()
-            for paths in file_structures.values():
-                all_paths.update(paths.keys())
-
-            all_paths = sorted(all_paths)
-
             f.write(
-                f"Tracking {len(all_paths)} unique paths across {len(file_structures)} files\n\n"
+                f"Tracking {len(by_path)} unique paths across {len(file_names)} files "
+                f"({len(segments)} segments)\n"
             )
+            f.write(f"Full table: {table_file.name}\n\n")
 
-            # For each path, show its evolution with change highlighting
-            for path in all_paths:
+            for path, runs in by_path.items():
                 f.write(f"\nPath: {path}\n")
                 f.write("-" * 60 + "\n")
-
-                # Collect all values for this path across files
-                path_values = []
-                for file_path, paths in file_structures.items():
-                    file_name = Path(file_path).name
-                    if path in paths:
-                        item = paths[path]
-                        if item.get("type") == "dataset":
-                            shape_str = str(item.get("shape", []))
-                            dtype_str = str(item.get("dtype", "unknown"))
-                            value_str = f"dataset {shape_str} {dtype_str}"
-                        elif item.get("type") == "group":
-                            children_count = item.get("children_count", 0)
-                            value_str = f"group ({children_count} children)"
-                        else:
-                            value_str = f"{item.get('type', 'unknown')}"
-
-                        path_values.append((file_name, value_str))
-                    else:
-                        path_values.append((file_name, "<missing>"))
-
-                # Detect changes and highlight them
-                prev_value = None
-                for file_name, value_str in path_values:
-                    if (
-                        prev_value is not None
-                        and prev_value != value_str
-                        and value_str != "<missing>"
-                    ):
-                        # Highlight changes with arrows
-                        f.write(f"  {file_name}: {value_str} ← CHANGED\n")
+                for k, (value, start, end) in enumerate(runs):
+                    if start == end:
+                        span = file_names[start]
                     else:
-                        f.write(f"  {file_name}: {value_str}\n")
-                    prev_value = value_str
+                        span = f"{file_names[start]} … {file_names[end]}"
+                    # Highlight changes with arrows
+                    marker = " ← CHANGED" if k > 0 and value != "<missing>" else ""
+                    f.write(f"  {span} ({end - start + 1} files): {value}{marker}\n")
 
         print(f"  Saved: {timeline_file}")
+        print(f"  Saved: {table_file}")
 
 
 def main():
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Prefetching file reader for das24_analyze_compress.py
+
+A background thread loads the datasets of the next files while the current
+one is being encoded, so disk (or NFS) latency overlaps with compute:
+
+    reader = PrefetchReader(files, plan, read, depth=2, max_bytes=1 << 30)
+    for path, preloaded in reader:
+        ...  # preloaded: {dataset name: array}, or None
+
+``plan(path)`` returns the (dataset, nbytes) pairs worth loading (e.g. not
+already in the result cache) and ``read(path, names)`` loads them. At most
+``depth`` files are held ahead of the consumer and the loaded bytes, counting
+the file currently in use, stay under ``max_bytes``; a single file larger
+than that is loaded only once nothing else is held. A file whose plan or
+read fails is yielded with ``None`` so the consumer reads it itself.
+"""
+
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+Preloaded = Optional[Dict[str, np.ndarray]]
+
+
+class PrefetchReader:
+    """Iterates over ``paths`` yielding (path, preloaded datasets)."""
+
+    def __init__(
+        self,
+        paths: Sequence[Path],
+        plan: Callable[[Path], List[Tuple[str, int]]],
+        read: Callable[[Path, List[str]], Dict[str, np.ndarray]],
+        depth: int = 2,
+        max_bytes: int = 1 << 30,
+    ):
+        self.paths = list(paths)
+        self.plan = plan
+        self.read = read
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.ready: Deque[Tuple[Path, Preloaded, int]] = deque()
+        self.held_bytes = 0
+        self.cond = threading.Condition()
+        self.stopped = False
+
+    def _load(self, path: Path) -> Tuple[Preloaded, int]:
+        try:
+            items = self.plan(path)
+        except Exception as e:
+            print(f"\n⚠️  Prefetch skipped {path.name}: {e}", file=sys.stderr)
+            return None, 0
+        nbytes = sum(n for _, n in items)
+        with self.cond:
+            while not self.stopped and (
+                len(self.ready) >= self.depth
+                or (self.held_bytes > 0 and self.held_bytes + nbytes > self.max_bytes)
+            ):
+                self.cond.wait()
+            if self.stopped:
+                return None, 0
+            self.held_bytes += nbytes
+        if not items:
+            return None, 0
+        try:
+            return self.read(path, [name for name, _ in items]), nbytes
+        except Exception as e:
+            print(f"\n⚠️  Prefetch failed for {path.name}: {e}", file=sys.stderr)
+            with self.cond:
+                self.held_bytes -= nbytes
+                self.cond.notify_all()
+            return None, 0
+
+    def _run(self) -> None:
+        for path in self.paths:
+            data, nbytes = self._load(path)
+            with self.cond:
+                if self.stopped:
+                    return
+                self.ready.append((path, data, nbytes))
+                self.cond.notify_all()
+
+    def __iter__(self) -> Iterator[Tuple[Path, Preloaded]]:
+        thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+        thread.start()
+        try:
+            for _ in self.paths:
+                with self.cond:
+                    while not self.ready:
+                        self.cond.wait()
+                    path, data, nbytes = self.ready.popleft()
+                    self.cond.notify_all()
+                yield path, data
+                # The consumer is done with this file: release its budget
+                del data
+                with self.cond:
+                    self.held_bytes -= nbytes
+                    self.cond.notify_all()
+        finally:
+            with self.cond:
+                self.stopped = True
+                self.ready.clear()
+                self.cond.notify_all()
+            thread.join()
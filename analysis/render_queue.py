@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Headless figure render queue
+
+Figures are described as jobs (output PNG, draw function, arguments) and
+rendered with matplotlib's object-oriented Agg API (``Figure`` +
+``FigureCanvasAgg``), so no pyplot global state is touched and jobs can be
+rendered in a process pool.
+
+Draw functions are called as ``draw(fig, *args)`` and must be module-level
+functions so they can be sent to worker processes.
+
+With ``skip_unchanged`` each job is keyed by a hash of its draw function,
+arguments and figure settings; the hashes of rendered PNGs are kept in a
+``.render_hashes.json`` file next to them and figures whose inputs did not
+change since the last render are skipped.
+"""
+
+import hashlib
+import json
+import pickle
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+
+MANIFEST_NAME = ".render_hashes.json"
+
+
+def render_job(job: Dict[str, Any]) -> str:
+    """Render one job to its PNG; returns the output path."""
+    fig = Figure(figsize=job["figsize"])
+    FigureCanvasAgg(fig)
+    job["draw"](fig, *job["args"])
+    out_png = Path(job["out_png"])
+    out_png.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(out_png, **job["savefig"])
+    return str(out_png)
+
+
+def job_hash(job: Dict[str, Any]) -> str:
+    draw = job["draw"]
+    payload = (
+        f"{draw.__module__}.{draw.__qualname__}",
+        job["args"],
+        job["figsize"],
+        sorted(job["savefig"].items()),
+    )
+    return hashlib.sha1(pickle.dumps(payload, protocol=4)).hexdigest()
+
+
+def _load_manifest(directory: Path) -> Dict[str, str]:
+    try:
+        with open(directory / MANIFEST_NAME, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(directory: Path, manifest: Dict[str, str]) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / MANIFEST_NAME, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+class RenderQueue:
+    """Collects figure jobs and renders them, optionally in parallel."""
+
+    def __init__(self, workers: int = 1, skip_unchanged: bool = False):
+        self.workers = max(1, workers)
+        self.skip_unchanged = skip_unchanged
+        self.jobs: List[Dict[str, Any]] = []
+
+    def submit(
+        self,
+        out_png: Path,
+        draw: Callable[..., None],
+        *args: Any,
+        figsize: Tuple[float, float] = (8, 4),
+        dpi: Optional[float] = None,
+        tight_bbox: bool = False,
+    ) -> None:
+        savefig: Dict[str, Any] = {}
+        if dpi is not None:
+            savefig["dpi"] = dpi
+        if tight_bbox:
+            savefig["bbox_inches"] = "tight"
+        self.jobs.append(
+            {
+                "out_png": str(out_png),
+                "draw": draw,
+                "args": args,
+                "figsize": figsize,
+                "savefig": savefig,
+            }
+        )
+
+    def run(self) -> Tuple[int, int]:
+        """Render all pending jobs; returns (rendered, skipped)."""
+        jobs, self.jobs = self.jobs, []
+        if not jobs:
+            return 0, 0
+
+        by_dir: Dict[Path, List[Dict[str, Any]]] = defaultdict(list)
+        for job in jobs:
+            job["hash"] = job_hash(job) if self.skip_unchanged else None
+            by_dir[Path(job["out_png"]).parent].append(job)
+
+        manifests = {}
+        pending = []
+        skipped = 0
+        for directory, dir_jobs in by_dir.items():
+            manifest = _load_manifest(directory) if self.skip_unchanged else {}
+            manifests[directory] = manifest
+            for job in dir_jobs:
+                out_png = Path(job["out_png"])
+                if (
+                    self.skip_unchanged
+                    and out_png.exists()
+                    and manifest.get(out_png.name) == job["hash"]
+                ):
+                    print(f"  Unchanged: {out_png}")
+                    skipped += 1
+                else:
+                    pending.append(job)
+
+        if self.workers > 1 and len(pending) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(pending))
+            ) as pool:
+                done = list(pool.map(render_job, pending))
+        else:
+            done = [render_job(job) for job in pending]
+
+        for job, out_png in zip(pending, done):
+            print(f"  Saved: {out_png}")
+            if self.skip_unchanged:
+                manifests[Path(out_png).parent][Path(out_png).name] = job["hash"]
+
+        if self.skip_unchanged:
+            for directory, manifest in manifests.items():
+                _save_manifest(directory, manifest)
+
+        return len(pending), skipped
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Shared-memory read/encode pipeline for das24_analyze_compress.py
+
+h5py serializes every call behind one global lock, so reader threads do not
+scale, and a plain process pool would pickle each dataset between processes.
+Here dedicated reader processes load datasets straight into
+``multiprocessing.shared_memory`` slabs, and encoder processes wrap the same
+slabs as numpy arrays, so the bytes are never copied between processes:
+
+    for result in slab_pipeline(files, plan, read_into, encode, slab_bytes,
+                                readers=2, workers=8):
+        ...  # encode(path, slab name or None, layout), in file order
+
+``plan(path)`` returns the (dataset, nbytes) pairs worth loading, as for
+``PrefetchReader``, and ``read_into(path, names, buf)`` loads them back to
+back into a slab, returning their layout. Both run in the reader processes,
+file by file as the readers reach them. Slabs are recycled through a
+free-list queue: a reader waits for a free slab before loading a file, and a
+slab is freed when the encoder working on it returns, so at most ``slabs``
+files are held in memory. A file with nothing to load, more than a slab
+holds, or whose plan or read fails, is passed to ``encode`` without a slab so
+it reads the file itself.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+SLAB_ALIGN = 64
+
+# (dataset, byte offset in the slab, shape, dtype string) per loaded dataset
+Layout = List[Tuple[str, int, Tuple[int, ...], str]]
+Plan = Callable[[Path], List[Tuple[str, int]]]
+ReadInto = Callable[[Path, List[str], memoryview], Layout]
+
+# Slabs attached by this process, kept open for its lifetime
+_ATTACHED: Dict[str, shared_memory.SharedMemory] = {}
+
+
+def aligned(nbytes: int) -> int:
+    """``nbytes`` rounded up so the next dataset in a slab starts aligned."""
+    return -(-nbytes // SLAB_ALIGN) * SLAB_ALIGN
+
+
+def attach_slab(name: str) -> shared_memory.SharedMemory:
+    shm = _ATTACHED.get(name)
+    if shm is None:
+        try:
+            # Only the process that created the slab unlinks it
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:  # Python < 3.13
+            shm = shared_memory.SharedMemory(name=name)
+        _ATTACHED[name] = shm
+    return shm
+
+
+def slab_arrays(name: str, layout: Layout) -> Dict[str, np.ndarray]:
+    """Arrays of ``layout`` viewing the slab ``name`` (no copy)."""
+    buf = attach_slab(name).buf
+    return {
+        dname: np.ndarray(shape, dtype=np.dtype(dtype), buffer=buf, offset=offset)
+        for dname, offset, shape, dtype in layout
+    }
+
+
+def shm_free_bytes() -> Optional[int]:
+    try:
+        st = os.statvfs("/dev/shm")
+    except OSError:
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+class SlabPool:
+    """``count`` shared-memory slabs of ``nbytes`` each and their free-list."""
+
+    def __init__(self, count: int, nbytes: int, ctx: Any = None):
+        ctx = ctx or mp.get_context()
+        free = shm_free_bytes()
+        if free is not None and count * nbytes > free:
+            raise RuntimeError(
+                f"{count} slab(s) of {nbytes / 2**20:.0f} MB do not fit in the "
+                f"{free / 2**20:.0f} MB free in /dev/shm; use fewer slabs "
+                "(--shm-slabs) or enlarge it (e.g. docker run --shm-size)"
+            )
+        self.nbytes = nbytes
+        self.slabs: List[shared_memory.SharedMemory] = []
+        self.free = ctx.Queue()
+        try:
+            for i in range(max(1, count)):
+                self.slabs.append(
+                    shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+                )
+                self.free.put(i)
+        except BaseException:
+            self.close()
+            raise
+
+    @property
+    def names(self) -> List[str]:
+        return [shm.name for shm in self.slabs]
+
+    def release(self, slab: int) -> None:
+        self.free.put(slab)
+
+    def close(self) -> None:
+        for shm in self.slabs:
+            shm.close()
+            shm.unlink()
+        self.slabs = []
+
+
+def _reader_main(
+    tasks: Any,
+    free: Any,
+    ready: Any,
+    names: List[str],
+    slab_bytes: int,
+    plan: Plan,
+    read_into: ReadInto,
+) -> None:
+    for index, path in iter(tasks.get, None):
+        try:
+            items = plan(path)
+        except Exception as e:
+            ready.put((index, None, None, f"plan failed: {type(e).__name__}: {e}"))
+            continue
+        if not items:
+            ready.put((index, None, None, None))
+            continue
+        nbytes = sum(aligned(n) for _, n in items)
+        if nbytes > slab_bytes:
+            error = f"{nbytes:,} bytes do not fit a {slab_bytes:,}-byte slab"
+            ready.put((index, None, None, error))
+            continue
+        slab = free.get()
+        try:
+            buf = attach_slab(names[slab]).buf
+            layout = read_into(path, [name for name, _ in items], buf)
+        except Exception as e:
+            free.put(slab)
+            ready.put((index, None, None, f"{type(e).__name__}: {e}"))
+        else:
+            ready.put((index, slab, layout, None))
+
+
+def read_slabs(
+    pool: SlabPool,
+    paths: Sequence[Path],
+    plan: Plan,
+    read_into: ReadInto,
+    readers: int = 1,
+    ctx: Any = None,
+) -> Iterator[Tuple[int, Optional[int], Optional[Layout]]]:
+    """Yields (path index, slab, layout) as reader processes finish files.
+
+    ``slab`` is None when nothing was loaded; otherwise the consumer must
+    ``pool.release(slab)`` once done with it.
+    """
+    ctx = ctx or mp.get_context()
+    task_q = ctx.Queue()
+    ready_q = ctx.Queue()
+    for index, path in enumerate(paths):
+        task_q.put((index, path))
+    procs = [
+        ctx.Process(
+            target=_reader_main,
+            args=(
+                task_q,
+                pool.free,
+                ready_q,
+                pool.names,
+                pool.nbytes,
+                plan,
+                read_into,
+            ),
+            name=f"slab-reader-{i}",
+            daemon=True,
+        )
+        for i in range(max(1, readers))
+    ]
+    for _ in procs:
+        task_q.put(None)
+    for p in procs:
+        p.start()
+    try:
+        for _ in paths:
+            while True:
+                try:
+                    index, slab, layout, error = ready_q.get(timeout=1.0)
+                    break
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs):
+                        raise RuntimeError("slab reader processes exited early")
+            if error is not None:
+                print(
+                    f"\n⚠️  {Path(paths[index]).name} is read by its encoder: {error}",
+                    file=sys.stderr,
+                )
+            yield index, slab, layout
+    finally:
+        for p in procs:
+            p.join(timeout=5.0)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+
+
+def slab_pipeline(
+    paths: Sequence[Path],
+    plan: Plan,
+    read_into: ReadInto,
+    encode: Callable[[Path, Optional[str], Optional[Layout]], Any],
+    slab_bytes: int,
+    readers: int = 1,
+    workers: int = 1,
+    slabs: int = 0,
+    initializer: Optional[Callable[..., None]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> Iterator[Any]:
+    """Yields ``encode(path, slab name, layout)`` for each path, in order.
+
+    ``encode`` runs in a pool of ``workers`` processes, each started with
+    ``initializer(*initargs)``, and ``plan`` and ``read_into`` in ``readers``
+    reader processes. Slabs hold ``slab_bytes`` each; ``slabs`` defaults to
+    readers + workers, one per process.
+    """
+    paths = list(paths)
+    count = slabs or max(1, readers) + max(1, workers)
+    print(
+        f"Shared-memory pipeline: {readers} reader(s), {workers} encoder(s), "
+        f"{count} slab(s) of {slab_bytes / 2**20:.1f} MB",
+        file=sys.stderr,
+    )
+    pool = SlabPool(count, slab_bytes)
+    try:
+        executor = ProcessPoolExecutor(
+            max_workers=max(1, workers), initializer=initializer, initargs=initargs
+        )
+        ready = read_slabs(pool, paths, plan, read_into, readers)
+        try:
+            futures: Dict[int, Future] = {}
+            next_index = 0
+            for index, slab, layout in ready:
+                name = pool.names[slab] if slab is not None else None
+                future = executor.submit(encode, paths[index], name, layout)
+                if slab is not None:
+                    future.add_done_callback(lambda _, slab=slab: pool.release(slab))
+                futures[index] = future
+                # Results go out in path order, so outputs match a serial run
+                while next_index in futures and futures[next_index].done():
+                    yield futures.pop(next_index).result()
+                    next_index += 1
+            while next_index < len(paths):
+                yield futures.pop(next_index).result()
+                next_index += 1
+        finally:
+            ready.close()
+            executor.shutdown(cancel_futures=True)
+    finally:
+        pool.close()
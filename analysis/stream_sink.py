@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Output sink for encoded streams of das24_analyze_compress.py
+
+Each stream can go to:
+- files: one standalone file per stream in ``outputs/``
+- aggregator: the blob of ``outputs/daspack_compressed.h5`` only
+- both: a file and a copy in the aggregator blob
+- linked: a file, indexed by the aggregator without copying its bytes
+  (``BlobAggregator.put_external``), so the data is stored once
+
+Writes run on a background thread fed through a queue bounded by the bytes
+in flight, so output I/O overlaps with encoding and the buffered streams
+never exceed ``max_pending_bytes``. Write errors are raised from ``close``.
+
+In worker processes the aggregator part cannot be written (h5py handles are
+not shared), so it is collected into a list for the parent process, which
+passes each entry to its own sink's ``submit_aggregator``. Linked entries
+are collected without their bytes.
+"""
+
+import sys
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Collection, Deque, Dict, List, Optional
+
+from das_aggregator import BlobAggregator
+
+
+OUTPUT_MODES = ["files", "aggregator", "both", "linked"]
+
+
+class StreamSink:
+    """Buffered, background writer of stream entries.
+
+    An entry is a dict with ``file_name`` (relative to ``outputs_dir``),
+    ``grp_path`` (aggregator key), ``stream`` and ``attrs``.
+    """
+
+    def __init__(
+        self,
+        outputs_dir: Path,
+        mode: str = "both",
+        aggregator: Optional[BlobAggregator] = None,
+        collect: Optional[List[Dict[str, Any]]] = None,
+        max_pending_bytes: int = 256 * 2**20,
+        background: bool = True,
+        stored_keys: Collection[str] = (),
+    ):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"unknown output mode: {mode}")
+        self.outputs_dir = Path(outputs_dir)
+        self.mode = mode
+        self.aggregator = aggregator
+        self.collect = collect
+        self.max_pending_bytes = max_pending_bytes
+        self.stored_keys = stored_keys
+        self.pending: Deque[Any] = deque()
+        self.pending_bytes = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.error: Optional[BaseException] = None
+        self.thread: Optional[threading.Thread] = None
+        if background:
+            self.thread = threading.Thread(
+                target=self._run, name="stream-sink", daemon=True
+            )
+            self.thread.start()
+
+    @property
+    def writes_files(self) -> bool:
+        return self.mode != "aggregator"
+
+    @property
+    def writes_aggregator(self) -> bool:
+        return self.mode != "files" and (
+            self.aggregator is not None or self.collect is not None
+        )
+
+    def stored(self, file_name: str, grp_path: str) -> bool:
+        """Whether a stream written earlier is still in every destination.
+
+        The aggregator part is looked up in ``stored_keys``, the keys it held
+        when the run started (see ``BlobAggregator.available_keys``).
+        """
+        if self.writes_files and not (self.outputs_dir / file_name).is_file():
+            return False
+        return not self.writes_aggregator or grp_path in self.stored_keys
+
+    def submit(self, entry: Dict[str, Any]) -> None:
+        """Queue one stream for every destination of the sink's mode."""
+        self._enqueue(entry, files=self.writes_files)
+
+    def submit_aggregator(self, entry: Dict[str, Any]) -> None:
+        """Queue only the aggregator part (entries collected by workers)."""
+        self._enqueue(entry, files=False)
+
+    def _enqueue(self, entry: Dict[str, Any], files: bool) -> None:
+        nbytes = len(entry["stream"]) if entry.get("stream") is not None else 0
+        if self.thread is None:
+            self._write(entry, files)
+            return
+        with self.cond:
+            # Block the producer while the buffer is full (one oversized
+            # stream is let through on its own)
+            while (
+                self.pending_bytes > 0
+                and self.pending_bytes + nbytes > self.max_pending_bytes
+                and self.error is None
+            ):
+                self.cond.wait()
+            if self.error is not None:
+                raise RuntimeError(f"stream sink failed: {self.error}") from self.error
+            self.pending.append((entry, files, nbytes))
+            self.pending_bytes += nbytes
+            self.cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                entry, files, nbytes = self.pending.popleft()
+            try:
+                self._write(entry, files)
+            except BaseException as e:
+                with self.cond:
+                    self.error = e
+                    self.pending.clear()
+                    self.pending_bytes = 0
+                    self.cond.notify_all()
+                return
+            with self.cond:
+                self.pending_bytes -= nbytes
+                self.cond.notify_all()
+
+    def _write(self, entry: Dict[str, Any], files: bool) -> None:
+        out_path = self.outputs_dir / entry["file_name"]
+        if files:
+            self.outputs_dir.mkdir(parents=True, exist_ok=True)
+            with open(out_path, "wb") as fo:
+                fo.write(entry["stream"])
+        if not self.writes_aggregator:
+            return
+
+        if self.aggregator is None:
+            if self.mode == "linked":
+                entry = {**entry, "stream": None, "length": len(entry["stream"])}
+            self.collect.append(entry)
+        elif self.mode == "linked":
+            length = entry.get("length")
+            if length is None:
+                length = len(entry["stream"])
+            self.aggregator.put_external(
+                entry["grp_path"], out_path, length, entry["attrs"]
+            )
+        else:
+            self.aggregator.put(entry["grp_path"], entry["stream"], entry["attrs"])
+
+    def close(self) -> None:
+        """Flush every queued write and stop the writer thread."""
+        if self.thread is not None:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+            self.thread.join()
+            self.thread = None
+        if self.aggregator is not None:
+            self.aggregator.flush()
+        if self.error is not None:
+            error, self.error = self.error, None
+            print(f"\n⚠️  Stream sink failed: {error}", file=sys.stderr)
+            raise error